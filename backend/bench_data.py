@@ -0,0 +1,243 @@
+# bench_data.py
+# 基准测试用的合成数据：按真实数据的形态生成 ai_product_app_v1 / ai_source_app_v1 (款号、成分、品名、标签等)，
+# 写入 SQLite 文件，供 db_standin.py 作为本地替身数据库使用。同一 seed 生成的数据完全相同。
+#
+#   python bench_data.py --rows 100k --out bench_100k.db
+import os
+import random
+import sqlite3
+import argparse
+import datetime
+from typing import Dict, Any, Iterator, List, Tuple
+
+# 产品表全部列 (与 fastapi_server.FIELD_MAPPING 一致)；未列入 NUMERIC_COLUMNS 的列为文本
+PRODUCT_COLUMNS = [
+    'code', 'name', 'ename', 'elem', 'inelem', 'yarncount', 'weight', 'width', 'twist', 'swzoomin',
+    'shzoomin', 'sph', 'unitqty', 'fewprice', 'unitid', 'unitrate', 'fewunitid', 'fewunitrate',
+    'emptyqty', 'papertubeqty', 'makedate', 'colorfastnotes', 'unpilling', 'whitefiber', 'wetrubfast',
+    'ldensity', 'hdensity', 'devproid', 'category', 'propinnum', 'dnumber', 'spinntype', 'foreignname',
+    'glosscommid', 'price', 'fiber_type', 'yarn_type', 'production_process', 'quality_level', 'devtype',
+    'notice', 'ennotice', 'introduce', 'eintroduce', 'dyeing_process', 'customizable_grade', 'season_new',
+    'fabric_structure', 'has_rib', 'dyemethod', 'className', 'slogan', 'fun_level', 'type_notes',
+    'stock_qty', 'image_urls', 'makedate_year', 'makedate_month', 'code_start', 'fabric_structure_two',
+    'fabric_erp', 'report_urls', 'release_date', 'mprice', 'yprice', 'kgprice', 'taxmprice', 'taxyprice',
+    'taxkgprice', 'sale_num_year', 'spring_color_fastness', 'dry_rubbing_fastness', 'light_fastness',
+    'fabe', 'color_name', 'series', 'applicable_crowd',
+]
+NUMERIC_COLUMNS = {
+    'weight', 'width', 'price', 'taxkgprice', 'taxmprice', 'fewprice', 'emptyqty', 'papertubeqty',
+    'stock_qty', 'sale_num_year', 'mprice', 'yprice', 'kgprice', 'taxyprice',
+}
+SOURCE_COLUMNS = ['id', 'name', 'tags', 'file_type', 'pic_url', 'video_path', 'is_delete']
+
+# 成分 (含别名写法，与线上数据一样混用)
+FIBERS = ['棉', '聚酯纤维', '氨纶', '粘纤', '腈纶', '天丝', '莱赛尔', '锦纶', '莫代尔', '羊毛', '绵羊毛',
+          '山羊绒', '亚麻', '桑蚕丝', '涤纶', '聚酰胺纤维']
+# 主成分的出现权重 (棉、涤纶类最常见)
+MAIN_FIBERS = ['棉'] * 6 + ['聚酯纤维'] * 4 + ['粘纤'] * 2 + ['天丝', '莫代尔', '羊毛', '锦纶', '亚麻']
+STRUCTURES = ['单面', '双面', '罗纹', '平纹', '珠地', '打鸡', '拉架', '双面绒', '空气绒', '阶梯', '空气层',
+              '提花', '肌理', '健康布', '纱盖丝', '棉盖丝', '抽针', '1X1', '2X2', '毛圈', '毛巾']
+NAME_WORDS = ['卫衣布', '毛圈', '汗布', '罗纹', '慕斯羊绒', '空气层', '珠地', '华夫格', '天丝棉', '冰丝',
+              '抓绒', '双面布', '提花布', '摇粒绒', '牛奶丝', '莫代尔', '精梳棉', '竹节棉']
+NAME_PREFIXES = ['', '', '', '新款', '高支', '弹力', '凉感', '磨毛', '丝光', '亲肤']
+PROCESSES = ['面抓毛', '底抓毛', '双面抓毛', '面剪毛', '烫光', '摇粒', '碱缩', '丝光', '食毛', '烧毛',
+             '砂洗', '磨毛', '刷毛']
+COLOR_PROCESSES = ['染定', '半漂定型', '漂白定型', '洗水定型']
+SERIES = ['天丝羊毛', '天丝麻', '羊毛', '羊绒', '慕斯绒', '麻', '棉麻', '新麻', '棉涤', '涤棉', 'ACR/RAC', 'RC',
+          'TC', '混纺', '纯纺', '棉捻', '棉莫', '棉莱', '雪花纱', '棉混纺', '桑蚕丝', '棉天丝', '莫代尔']
+TYPE_NOTES = ['保留款', '待观察', '新款测试款', '下架款', '外购款', '订单款', '杂款', '订单主推']
+CROWDS = ['高端女装', '男装', '内衣线', '通用', '女装', '儿童']
+FEATURES = ['凉感', '抗静电', '耐磨', '保暖', '吸湿排汗', '抗起球', '柔软', '挺括', '透气', '速干', '亲肤', '垂感']
+GRADES = ['可订一等品', '可订一等品', '可订合格品', None]
+COLORS = ['黑色', '漂白', '花灰', '藏青色', '米白', '卡其', '酒红', '雾霾蓝', '燕麦色', '奶茶色', '墨绿', '焦糖色']
+TAGS = ['春季', '夏季', '秋冬', '卫衣', '新品', '直播', '面料细节', '上身图', '色卡', '视频讲解', '主推']
+# 款号首位 (现货 6/9/3 为主，其他为外购与开发款)
+CODE_STARTS = ['6'] * 5 + ['9'] * 2 + ['3'] * 2 + ['1', '2', '5', '8']
+# 前几行固定使用的款号 (test_cases_20 中按款号查询的场景)
+ANCHOR_CODES = ['6228', '6327']
+# 常见标准配比，约四分之一的产品直接使用
+STANDARD_ELEMS = ['100%棉', '95%棉 5%氨纶', '棉95%氨纶5%', '92%聚酯纤维 8%氨纶', '60%棉 40%聚酯纤维',
+                  '37.6%粘纤 28.3%棉 28.3%腈纶 5.8%氨纶', '70%莫代尔 30%棉', '50%天丝 50%棉']
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+def parse_size(text: str) -> int:
+    """'10k' / '100k' / '1m' 或整数"""
+    text = str(text).strip().lower()
+    return SIZES.get(text) or int(text)
+
+
+def random_elem(rng: random.Random) -> str:
+    """成分字符串，形如 "37.6%粘纤 28.3%棉 28.3%腈纶 5.8%氨纶" 或 "棉95%氨纶5%" """
+    if rng.random() < 0.25:
+        return rng.choice(STANDARD_ELEMS)
+    count = rng.choices([1, 2, 3, 4], weights=[2, 5, 3, 1])[0]
+    fibers = [rng.choice(MAIN_FIBERS)]
+    while len(fibers) < count:
+        fiber = '氨纶' if len(fibers) == count - 1 and rng.random() < 0.6 else rng.choice(FIBERS)
+        if fiber not in fibers:
+            fibers.append(fiber)
+    if count == 1:
+        parts = [100.0]
+    else:
+        cuts = sorted(rng.uniform(5, 95) for _ in range(count - 1))
+        parts = [round(b - a, 1) for a, b in zip([0.0] + cuts, cuts + [100.0])]
+        parts.sort(reverse=True)
+        parts[0] = round(100 - sum(parts[1:]), 1)
+    if rng.random() < 0.7:
+        return ' '.join(f"{p:g}%{f}" for f, p in zip(fibers, parts))
+    return ''.join(f"{f}{p:g}%" for f, p in zip(fibers, parts))
+
+
+def product_row(i: int, rng: random.Random) -> Dict[str, Any]:
+    code_start = rng.choice(CODE_STARTS)
+    code = f"{code_start}{i:03d}" if i < 1000 else f"{code_start}{i}"
+    if rng.random() < 0.15:
+        code += rng.choice('ABCDG')
+    if i < len(ANCHOR_CODES):
+        code = ANCHOR_CODES[i]
+        code_start = code[0]
+    weight = rng.choice([None, 0]) if rng.random() < 0.05 else float(rng.randint(120, 480))
+    price = round(rng.uniform(15, 120), 2) if rng.random() > 0.05 else 0
+    processes = rng.sample(PROCESSES, rng.randint(0, 2)) + [rng.choice(COLOR_PROCESSES)]
+    release = datetime.date(2019, 1, 1) + datetime.timedelta(days=rng.randint(0, 2400))
+    structure = rng.choice(STRUCTURES)
+    images = [f"{code}电子色卡.jpg:https://wyoooni.net//upload//proattr/{release:%Y-%m}/{i}{k}.jpg"
+              for k in range(rng.randint(0, 3))]
+    if rng.random() < 0.2:
+        images.append(f"{code}检测报告.pdf:https://wyoooni.net//upload//proattr/{release:%Y-%m}/{i}.pdf")
+    row = {c: None for c in PRODUCT_COLUMNS}
+    row.update({
+        'code': code,
+        'code_start': code_start,
+        'name': rng.choice(NAME_PREFIXES) + rng.choice(NAME_WORDS),
+        'elem': random_elem(rng),
+        'inelem': f"{rng.choice([32, 40, 50, 60, 80])}S{rng.choice(['精梳', '紧赛纺', '环锭纺', ''])}",
+        'weight': weight,
+        'width': float(rng.choice([150, 160, 165, 170, 175, 180, 185])),
+        'price': price,
+        'taxkgprice': round(price * rng.uniform(1.1, 1.3), 2) if price else 0,
+        'taxmprice': round(price * rng.uniform(0.4, 0.6), 2) if price else 0,
+        'fewprice': round(price * 0.9, 2) if price else None,
+        'emptyqty': rng.choice([1.0, 1.5, 2.0]),
+        'papertubeqty': rng.choice([1.0, 1.5, 2.0]),
+        'stock_qty': rng.randint(0, 6000),
+        'sale_num_year': rng.choice([0, rng.randint(0, 200), rng.randint(0, 8000)]),
+        'fabric_structure_two': f"{structure} {rng.choice(STRUCTURES)}" if rng.random() < 0.3 else structure,
+        'fabric_erp': structure,
+        'production_process': ','.join(processes),
+        'series': rng.choice(SERIES),
+        'type_notes': rng.choice(TYPE_NOTES),
+        'applicable_crowd': rng.choice(CROWDS),
+        'customizable_grade': rng.choice(GRADES),
+        'introduce': '，'.join(rng.sample(FEATURES, rng.randint(1, 4))),
+        'fabe': f"F（特征）：{'、'.join(rng.sample(FEATURES, 3))}。",
+        'color_name': ','.join(rng.sample(COLORS, rng.randint(1, 6))),
+        'image_urls': ','.join(images) or None,
+        'report_urls': f"{code}检测报告.pdf:https://wyoooni.net//upload//report/{i}.pdf" if rng.random() < 0.3 else None,
+        'release_date': release.isoformat(),
+        'devproid': f"D{rng.randint(10000, 99999)}",
+        'spring_color_fastness': rng.choice(['3', '3-4', '4', '4-5']),
+        'light_fastness': rng.choice(['3', '4', '4-5']),
+        'dry_rubbing_fastness': rng.choice(['3-4', '4', '4-5']),
+    })
+    return row
+
+
+def source_row(i: int, rng: random.Random, codes: List[str]) -> Dict[str, Any]:
+    """素材：名称以款号开头 (素材图按款号匹配)，少量已删除"""
+    file_type = rng.choice(['image'] * 4 + ['video', 'IMAGE'])
+    code = rng.choice(codes)
+    return {
+        'id': i + 1,
+        'name': f"{code}_{rng.choice(NAME_WORDS)}_{rng.choice(TAGS)}{i}",
+        'tags': ','.join(rng.sample(TAGS, rng.randint(1, 3))),
+        'file_type': file_type,
+        'pic_url': f"/aiModels/uploads/pic/{i}.jpg" if file_type.lower() == 'image' or rng.random() < 0.5 else None,
+        'video_path': f"/aiModels/uploads/video/{i}.mp4" if file_type == 'video' else None,
+        'is_delete': 1 if rng.random() < 0.05 else 0,
+    }
+
+
+def generate_products(n: int, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield product_row(i, rng)
+
+
+def generate_sources(n: int, codes: List[str], seed: int = 2) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield source_row(i, rng, codes)
+
+
+def _column_sql(name: str, numeric: bool) -> str:
+    # 文本列不区分大小写，与 MySQL 默认排序规则一致
+    return f"`{name}` REAL" if numeric else f"`{name}` TEXT COLLATE NOCASE"
+
+
+def _insert(conn: sqlite3.Connection, table: str, columns: List[str], rows: Iterator[Dict[str, Any]],
+            chunk: int = 10_000) -> int:
+    sql = f"INSERT INTO {table} ({', '.join(f'`{c}`' for c in columns)}) VALUES ({', '.join('?' * len(columns))})"
+    count, batch = 0, []
+    for row in rows:
+        batch.append(tuple(row[c] for c in columns))
+        if len(batch) >= chunk:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def build_database(path: str, products: int, sources: int = None, seed: int = 1) -> Tuple[int, int]:
+    """生成数据并写入 SQLite 文件 (已存在时覆盖)，返回 (产品数, 素材数)；素材数默认为产品数的一半"""
+    if os.path.exists(path):
+        os.remove(path)
+    sources = products // 2 if sources is None else sources
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"CREATE TABLE ai_product_app_v1 (id INTEGER PRIMARY KEY, "
+                     f"{', '.join(_column_sql(c, c in NUMERIC_COLUMNS) for c in PRODUCT_COLUMNS)})")
+        conn.execute("CREATE TABLE ai_source_app_v1 (id INTEGER PRIMARY KEY, name TEXT COLLATE NOCASE, "
+                     "tags TEXT COLLATE NOCASE, file_type TEXT COLLATE NOCASE, pic_url TEXT, video_path TEXT, "
+                     "is_delete INTEGER)")
+        conn.execute("CREATE TABLE ai_user (id TEXT PRIMARY KEY, product TEXT, name TEXT, userid TEXT)")
+
+        codes: List[str] = []
+
+        def products_with_codes():
+            for row in generate_products(products, seed):
+                codes.append(row['code'])
+                yield row
+
+        product_count = _insert(conn, 'ai_product_app_v1', PRODUCT_COLUMNS, products_with_codes())
+        source_count = _insert(conn, 'ai_source_app_v1', SOURCE_COLUMNS, generate_sources(sources, codes, seed + 1))
+        conn.executemany("INSERT INTO ai_user VALUES (?, ?, ?, ?)",
+                         [(f"u{i}", 'sale', f"用户{i}", f"user{i}") for i in range(100)])
+        # 详情接口按款号查询
+        conn.execute("CREATE INDEX idx_product_code ON ai_product_app_v1 (code)")
+        conn.commit()
+        return product_count, source_count
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成基准测试用的合成数据库 (SQLite)")
+    parser.add_argument("--rows", default="10k", help="产品行数：10k / 100k / 1m 或整数")
+    parser.add_argument("--sources", type=int, default=None, help="素材行数，默认为产品行数的一半")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="输出文件，默认 bench_<rows>.db")
+    args = parser.parse_args()
+
+    n = parse_size(args.rows)
+    out = args.out or f"bench_{args.rows}.db"
+    start = datetime.datetime.now()
+    p, s = build_database(out, n, args.sources, args.seed)
+    print(f"{out}: {p} products, {s} sources in {(datetime.datetime.now() - start).total_seconds():.1f}s")
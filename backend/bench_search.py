@@ -0,0 +1,152 @@
+# bench_search.py
+# 搜索基准：在合成数据 (bench_data.py) + SQLite 替身库 (db_standin.py) 上，
+# 逐个运行 test_cases_20 中的场景 (直接调用 perform_single_search，不经过结果缓存)，
+# 输出每个场景的 p50/p95/p99 延迟与吞吐；指定 --baseline 时与上次结果比较，p95 变慢超过阈值即返回非零退出码。
+#
+#   python bench_search.py --rows 100k --iterations 50 --json bench_100k.json
+#   python bench_search.py --rows 100k --baseline bench_100k.json
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Dict, Any, List
+
+from bench_data import build_database, parse_size
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩分位数 (sorted_values 已升序)"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies: List[float], catalog_rows: int, returned: int, total: int) -> Dict[str, Any]:
+    values = sorted(latencies)
+    mean = sum(values) / len(values)
+    return {
+        "iterations": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "qps": round(1 / mean, 1) if mean else None,
+        # 每秒评估的目录行数 (目录行数 / 平均延迟)，用于比较不同数据规模
+        "rows_per_s": round(catalog_rows / mean) if mean else None,
+        "returned": returned,
+        "total": total,
+    }
+
+
+async def run_case(server, payload: Dict[str, Any], iterations: int, warmup: int) -> Dict[str, Any]:
+    latencies = []
+    result = {}
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        result = await server.perform_single_search(dict(payload))
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            latencies.append(elapsed)
+    return {"latencies": latencies, "returned": len(result.get("list", [])),
+            "total": result.get("total", 0), "error": result.get("error")}
+
+
+async def run_mode(server, cases, mode: str, iterations: int, warmup: int, catalog_rows: int) -> Dict[str, Any]:
+    results = {}
+    for case_id, title, payload in cases:
+        r = await run_case(server, payload, iterations, warmup)
+        summary = summarize(r["latencies"], catalog_rows, r["returned"], r["total"])
+        if r["error"]:
+            summary["error"] = r["error"]
+        results[case_id] = {"title": title, **summary}
+        print(f"[{mode:8}] {case_id} {summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f} {summary['p99_ms']:9.2f} "
+              f"{summary['qps']:9.1f} {summary['rows_per_s']:12} {summary['total']:6}  {title}"
+              + (f"  ERROR: {r['error']}" if r["error"] else ""))
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = 1.0) -> List[str]:
+    """返回 p95 变慢超过阈值的场景 (绝对差值小于 min_delta_ms 的视为抖动)"""
+    regressions = []
+    for mode, cases in current.get("modes", {}).items():
+        for case_id, r in cases.items():
+            base = baseline.get("modes", {}).get(mode, {}).get(case_id)
+            if not base or not base.get("p95_ms"):
+                continue
+            ratio = r["p95_ms"] / base["p95_ms"]
+            if ratio > 1 + threshold and r["p95_ms"] - base["p95_ms"] >= min_delta_ms:
+                regressions.append(f"[{mode}] {case_id} {r['title']}: p95 {base['p95_ms']}ms -> {r['p95_ms']}ms (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="test_cases_20 场景的搜索基准 (合成数据 + SQLite 替身库)")
+    parser.add_argument("--rows", default="10k", help="产品行数：10k / 100k / 1m 或整数")
+    parser.add_argument("--db", default=None, help="SQLite 文件，默认 bench_<rows>.db，不存在时自动生成")
+    parser.add_argument("--mode", choices=["sql", "snapshot", "both"], default="both",
+                        help="sql: 不加载内存快照 (数据库路径)；snapshot: 加载目录快照与素材图索引")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--cases", default=None, help="只运行指定场景，如 01,05,13")
+    parser.add_argument("--json", default=None, help="结果写入 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与之前的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 允许的变慢比例")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="p95 变慢的最小绝对值 (毫秒)")
+    args = parser.parse_args()
+
+    catalog_rows = parse_size(args.rows)
+    db_path = args.db or f"bench_{args.rows}.db"
+    if not os.path.exists(db_path):
+        print(f"Generating {db_path} ({catalog_rows} products)...")
+        build_database(db_path, catalog_rows)
+
+    # 服务模块在导入时读取配置：使用替身库，不写事件日志，不启动后台刷新
+    os.environ["DB_STANDIN"] = db_path
+    os.environ.setdefault("LOG_EVENT_FILE", "")
+    import fastapi_server as server
+    from test_cases_20 import test_cases
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = test_cases
+    if args.cases:
+        wanted = set(args.cases.split(','))
+        cases = [c for c in test_cases if c[0] in wanted]
+
+    report = {"rows": catalog_rows, "db": db_path, "iterations": args.iterations, "modes": {}}
+    print(f"{'mode':10} {'id':2} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'qps':>9} {'rows/s':>12} {'total':>6}")
+
+    modes = ["sql", "snapshot"] if args.mode == "both" else [args.mode]
+
+    async def run_all():
+        for mode in modes:
+            if mode == "snapshot":
+                start = time.perf_counter()
+                server.catalog_engine.load()
+                server.material_index.load_full()
+                print(f"Snapshot loaded in {time.perf_counter() - start:.2f}s")
+            report["modes"][mode] = await run_mode(server, cases, mode, args.iterations, args.warmup, catalog_rows)
+
+    asyncio.run(run_all())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
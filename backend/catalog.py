@@ -0,0 +1,344 @@
+# catalog.py
+# 产品目录内存快照：启动时把 ai_product_app_v1 整表加载为按列存储的数组，
+# product_search 直接在内存中完成筛选，后台线程定时刷新快照。
+# 配置共享目录时快照来自主机内共享的只读列式文件 (catalog_store)，多个 worker 只加载、保存一份。
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, List, Callable, Iterable, Set, Tuple
+from catalog_store import CatalogStore, DictionaryColumn, MappedTable
+from composition import CompositionIndex, compile_composition_query
+from ngram_index import NgramIndex
+from ranking import static_rank
+from query_plan import ColumnFilter, QueryPlan
+
+logger = logging.getLogger(__name__)
+
+
+def _to_float_array(values: Iterable[Any], size: int) -> Tuple[np.ndarray, bool]:
+    """
+    将任意列值转为 float64 数组，空值记为 NaN
+    返回 (数组, 是否全部可转换)；存在无法转换的非空值时排序需回退到 Python 逻辑
+    """
+    arr = np.full(size, np.nan, dtype=np.float64)
+    exact = True
+    for i, v in enumerate(values):
+        if v is None or v == '':
+            continue
+        try:
+            arr[i] = float(v)
+        except (TypeError, ValueError):
+            exact = False
+    return arr, exact
+
+
+def derived_arrays(column: Callable[[str], Iterable[Any]], fields: Iterable[str], numeric_fields: Iterable[str],
+                   size: int) -> Tuple[Dict[str, np.ndarray], Set[str], np.ndarray]:
+    """
+    由列取值计算 (数值列, 可按数值排序的列, 排序静态分量名次)
+    column(f) 返回字段 f 的全部取值
+    """
+    field_set = set(fields)
+    numbers: Dict[str, np.ndarray] = {}
+    sortable: Set[str] = set()
+    for f in numeric_fields:
+        if f not in field_set: continue
+        numbers[f], exact = _to_float_array(column(f), size)
+        if exact: sortable.add(f)
+    # 排序静态分量 (系列分, -年销量) 的名次
+    sales = numbers.get('sale_num_year', np.zeros(size))
+    rank = static_rank(column('code'), sales) if 'code' in field_set else np.zeros(size, dtype=np.int64)
+    return numbers, sortable, rank
+
+
+def _text_index(column) -> NgramIndex:
+    if isinstance(column, DictionaryColumn):
+        return NgramIndex.from_dictionary(column.values(), column.codes)
+    return NgramIndex(column)
+
+
+def table_arrays(rows: List[Dict], fields: List[str], numeric_fields: Iterable[str],
+                 index_fields: Iterable[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    共享列式文件中除原始值列以外的部分 (附带数组, 元数据)：
+    数值列、排序静态名次，以及加载时建立的 n-gram 索引与成分索引 (只由发布的进程计算一次)
+    """
+    numbers, sortable, rank = derived_arrays(lambda f: [r.get(f) for r in rows], fields, numeric_fields, len(rows))
+    arrays = {f"number:{f}": values for f, values in numbers.items()}
+    arrays['static_rank'] = rank
+    text_indexes = sorted(f for f in index_fields if f in fields)
+    for f in text_indexes:
+        for key, values in NgramIndex(r.get(f) for r in rows).to_arrays().items():
+            arrays[f"ngram:{f}:{key}"] = values
+    if 'elem' in fields:
+        for key, values in CompositionIndex(r.get('elem') for r in rows).to_arrays().items():
+            arrays[f"composition:{key}"] = values
+    meta = {"numeric_fields": sorted(numbers), "sortable": sorted(sortable),
+            "text_indexes": text_indexes, "composition": 'elem' in fields}
+    return arrays, meta
+
+
+def _prefixed(arrays: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    return {name[len(prefix):]: values for name, values in arrays.items() if name.startswith(prefix)}
+
+
+def content_version(columns: Dict[str, np.ndarray]) -> str:
+    """
+    按内容计算快照版本：各 worker 加载到相同数据时版本相同，续页游标可在 worker 之间使用；
+    数据变化后版本随之变化，旧游标失效
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for f, col in columns.items():
+        digest.update(f.encode('utf-8'))
+        digest.update(repr(col.tolist()).encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class CatalogSnapshot:
+    """一次加载得到的只读列式快照"""
+
+    def __init__(self, rows: List[Dict], fields: List[str], numeric_fields: Iterable[str], version: Any = None,
+                 index_fields: Iterable[str] = ()):
+        """version 为空时按内容计算 (content_version)"""
+        self.size = len(rows)
+        self.fields = list(fields)
+        self.field_set = set(self.fields)
+        self.loaded_at = time.time()
+        self.table: Optional[MappedTable] = None
+
+        # 原始值列 (保持数据库返回的类型，序列化逻辑不变)
+        self.columns: Dict[str, Any] = {}
+        for f in self.fields:
+            col = np.empty(self.size, dtype=object)
+            col[:] = [r.get(f) for r in rows]
+            self.columns[f] = col
+        self.version = content_version(self.columns) if version is None else version
+
+        # 数值列 (用于范围比较与排序) 与排序静态分量 (系列分, -年销量) 的名次
+        self.numbers, self.sortable, self.static_rank = derived_arrays(
+            self.columns.__getitem__, self.fields, numeric_fields, self.size)
+        # 文本列 n-gram 倒排索引：严格文本字段加载时建立，其余列首次使用时建立
+        self._text_indexes: Dict[str, NgramIndex] = {
+            f: NgramIndex(self.columns[f]) for f in index_fields if f in self.field_set
+        }
+        self._index_lock = threading.Lock()
+        # 成分索引：每个 elem 只解析一次
+        self.composition = CompositionIndex(self.columns['elem']) if 'elem' in self.field_set else None
+
+    @classmethod
+    def from_table(cls, table: MappedTable) -> 'CatalogSnapshot':
+        """由共享列式文件建立：原始值、数值列、静态名次与索引全部直接映射，不在本进程重新计算"""
+        snapshot = cls.__new__(cls)
+        snapshot.version = table.version
+        snapshot.size = table.size
+        snapshot.fields = list(table.fields)
+        snapshot.field_set = set(snapshot.fields)
+        snapshot.loaded_at = time.time()
+        snapshot.table = table
+        snapshot.columns = dict(table.columns)
+        snapshot.numbers = {f: table.arrays[f"number:{f}"] for f in table.meta['numeric_fields']}
+        snapshot.sortable = set(table.meta['sortable'])
+        snapshot.static_rank = table.arrays['static_rank']
+        # 发布时建立的文本列索引直接映射，其余列首次使用时由字典编码列建立
+        snapshot._text_indexes = {
+            f: NgramIndex.from_arrays(_prefixed(table.arrays, f"ngram:{f}:")) for f in table.meta['text_indexes']
+        }
+        snapshot._index_lock = threading.Lock()
+        snapshot.composition = CompositionIndex.from_arrays(_prefixed(table.arrays, "composition:")) \
+            if table.meta['composition'] else None
+        return snapshot
+
+    def has_fields(self, fields: Iterable[str]) -> bool:
+        return all(f in self.field_set for f in fields)
+
+    def text_index(self, field: str) -> NgramIndex:
+        index = self._text_indexes.get(field)
+        if index is None:
+            with self._index_lock:
+                index = self._text_indexes.get(field)
+                if index is None:
+                    index = _text_index(self.columns[field])
+                    self._text_indexes[field] = index
+        return index
+
+    def rows(self, indices: Iterable[int], fields: Iterable[str]) -> List[Dict]:
+        """按行号物化为字典，与 DictCursor 的返回结构一致"""
+        if self.table is not None:
+            return self.table.rows(indices, fields)
+        cols = [(f, self.columns[f]) for f in fields]
+        return [{f: col[i] for f, col in cols} for i in indices]
+
+    # --- 列级过滤 (与 ColumnFilter 渲染出的 SQL 语义一一对应) ---
+
+    def like_mask(self, column: str, patterns: Iterable[str], any_of: bool) -> np.ndarray:
+        """多个 LIKE 条件按 OR / AND 组合 (倒排表求并集 / 交集)"""
+        return self.text_index(column).like(patterns, any_of)
+
+    def in_mask(self, column: str, values: Iterable[Any]) -> np.ndarray:
+        """精确匹配 (IN / =)，大小写不敏感"""
+        return self.text_index(column).equals(values)
+
+    def elem_mask(self, query_str: Any) -> Optional[np.ndarray]:
+        """成分粗筛 + 精确求值 (对应 SQL 关键词粗筛与成分比例精细筛选)"""
+        if not query_str or self.composition is None: return None
+        mask = compile_composition_query(str(query_str)).mask(self.composition)
+        coarse = self.composition.keyword_mask(query_str)
+        return mask if coarse is None else mask & coarse
+
+    def filter_mask(self, f: ColumnFilter) -> Optional[np.ndarray]:
+        """对单个 ColumnFilter 求值，列不在快照中时返回 None"""
+        if f.column not in self.field_set: return None
+        if f.kind in ('range', 'compare'):
+            values = self.numbers.get(f.column)
+            if values is None: return None
+            if f.kind == 'range':
+                return (values >= float(f.values[0])) & (values <= float(f.values[1]))
+            op, target = f.values[0], float(f.values[1])
+            if op == '>': return values > target
+            if op == '<': return values < target
+            if op == '>=': return values >= target
+            if op == '<=': return values <= target
+            return values == target
+        if f.kind == 'in':
+            return self.in_mask(f.column, f.values)
+        if f.kind == 'like_any':
+            return self.like_mask(f.column, f.values, any_of=True)
+        if f.kind == 'like_all':
+            return self.like_mask(f.column, f.values, any_of=False)
+        if f.kind == 'elem':
+            return self.elem_mask(f.values[0])
+        return None
+
+
+class CatalogEngine:
+    """
+    管理目录快照的加载、原子替换与后台刷新
+    store 为空时各进程各自加载，快照版本按内容计算 (加载到相同数据的 worker 版本相同)；
+    store 不为空时：到达刷新间隔后由拿到发布锁的一个进程从数据库加载并发布到共享文件，
+    各进程每隔 poll_interval 检查并映射新版本 (版本号即发布序号)
+    两种方式下快照版本在各进程间一致，续页游标可跨 worker 使用
+    """
+
+    def __init__(self, loader: Callable[[List[str]], List[Dict]], fields: Iterable[str],
+                 numeric_fields: Iterable[str], index_fields: Iterable[str] = (), refresh_interval: float = 300,
+                 store: Optional[CatalogStore] = None, poll_interval: float = 5):
+        self.loader = loader
+        self.fields = list(fields)
+        self.numeric_fields = set(numeric_fields)
+        self.index_fields = set(index_fields)
+        self.refresh_interval = refresh_interval
+        self.store = store
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+
+    def on_refresh(self, callback: Callable[[CatalogSnapshot], None]):
+        """注册快照替换后的回调 (如清空结果缓存)"""
+        self._listeners.append(callback)
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """当前可用快照；尚未加载成功时返回 None，调用方应回退到数据库"""
+        return self._snapshot
+
+    def load(self) -> Optional[CatalogSnapshot]:
+        """全量加载一次并原子替换当前快照，失败时保留旧快照"""
+        if self.store is not None:
+            return self._load_shared()
+        with self._load_lock:
+            start = time.time()
+            try:
+                rows = self.loader(self.fields)
+            except Exception as e:
+                logger.error(f"Catalog snapshot load failed: {e}")
+                return self._snapshot
+            snapshot = CatalogSnapshot(rows, self.fields, self.numeric_fields, index_fields=self.index_fields)
+            logger.info(f"Catalog snapshot v{snapshot.version} loaded: {snapshot.size} rows in {time.time() - start:.2f}s")
+            self._swap(snapshot)
+            return snapshot
+
+    def _load_shared(self) -> Optional[CatalogSnapshot]:
+        """必要时发布新版本，然后映射共享文件中的最新版本"""
+        with self._load_lock:
+            current = self._snapshot
+            try:
+                pointer = self.store.refresh(self._publish, self.refresh_interval)
+                if pointer is None or (current is not None and current.version == pointer['version']):
+                    return current
+                start = time.time()
+                snapshot = CatalogSnapshot.from_table(self.store.open(pointer))
+            except Exception as e:
+                logger.error(f"Shared catalog snapshot load failed: {e}")
+                return current
+            logger.info(f"Catalog snapshot v{snapshot.version} mapped: {snapshot.size} rows in {time.time() - start:.2f}s")
+            self._swap(snapshot)
+            return snapshot
+
+    def _publish(self):
+        """(持有发布锁时调用) 从数据库全量加载并写出共享列式文件"""
+        start = time.time()
+        try:
+            rows = self.loader(self.fields)
+        except Exception as e:
+            logger.error(f"Catalog snapshot load failed: {e}")
+            return
+        arrays, meta = table_arrays(rows, self.fields, self.numeric_fields, self.index_fields)
+        pointer = self.store.publish(rows, self.fields, arrays, meta)
+        logger.info(f"Catalog v{pointer['version']} published: {len(rows)} rows in {time.time() - start:.2f}s")
+
+    def _swap(self, snapshot: CatalogSnapshot):
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Catalog refresh callback failed: {e}")
+
+    def start(self):
+        """启动后台线程：立即加载一次，之后按间隔刷新"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self.load()
+                # 共享模式下更频繁地检查其他进程发布的新版本 (只读指针文件)
+                self._stop.wait(self.refresh_interval if self.store is None
+                                else min(self.poll_interval, self.refresh_interval))
+
+        self._thread = threading.Thread(target=run, name="catalog-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "ready": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "rows": snapshot.size if snapshot else 0,
+            "shared": self.store is not None,
+        }
+
+    def search(self, snapshot: CatalogSnapshot, plan: QueryPlan) -> Tuple[np.ndarray, Set[str]]:
+        """
+        在快照上执行查询计划中的过滤条件，返回命中的行号 (保持表内顺序)，
+        以及已在快照上精确求值、无需再做 Python 精细筛选的字段
+        """
+        resolved = set()
+        mask = np.ones(snapshot.size, dtype=bool)
+
+        for f in plan.filters:
+            m = snapshot.filter_mask(f)
+            if m is None: continue
+            mask &= m
+            if f.kind == 'elem' and snapshot.composition is not None:
+                resolved.add('elem')
+
+        return np.flatnonzero(mask), resolved
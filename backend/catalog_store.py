@@ -0,0 +1,335 @@
+# catalog_store.py
+# 主机内共享的只读列式目录文件：多个 uvicorn worker 映射 (mmap) 同一份数据，而不是各自持有一份对象列。
+# - 每列按字典编码存储：int32 行编码 (NULL 为 -1) + 去重取值的 UTF-8 字节串与偏移，另可附带 float64 / int64 数组
+# - 每次发布写入新的版本目录，写完后用 os.replace 原子替换指针文件，读取方只会看到完整的版本
+# - 文件锁保证同一时刻只有一个进程从数据库加载并发布，其余进程只映射已发布的版本
+import os
+import json
+import time
+import pickle
+import shutil
+import logging
+import datetime
+import contextlib
+import numpy as np
+from decimal import Decimal
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Callable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # 非 POSIX 平台没有文件锁，只能使用进程内快照
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 取值类型 -> (编码, 解码)；同一列出现多种类型或其他类型时使用 pickle
+_CODECS: Dict[str, tuple] = {
+    'str': (lambda v: v.encode('utf-8'), lambda b: b.decode('utf-8')),
+    'int': (lambda v: str(v).encode(), int),
+    'float': (lambda v: repr(v).encode(), float),
+    'decimal': (lambda v: str(v).encode(), lambda b: Decimal(b.decode())),
+    'datetime': (lambda v: v.isoformat().encode(), lambda b: datetime.datetime.fromisoformat(b.decode())),
+    'date': (lambda v: v.isoformat().encode(), lambda b: datetime.date.fromisoformat(b.decode())),
+    'bytes': (bytes, bytes),
+    'pickle': (pickle.dumps, pickle.loads),
+}
+# 去重取值不超过该数量的列在映射时整体解码并留在本进程 (内存很小)，其余列按需逐个解码
+DECODED_VALUES_LIMIT = 4096
+_KINDS = {str: 'str', int: 'int', float: 'float', Decimal: 'decimal',
+          datetime.datetime: 'datetime', datetime.date: 'date', bytes: 'bytes'}
+
+
+def _column_kind(values: List[Any]) -> str:
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return 'str'
+    if len(types) > 1:
+        return 'pickle'
+    return _KINDS.get(types.pop(), 'pickle')
+
+
+def _load_array(path: str) -> np.ndarray:
+    """
+    以只读方式映射 .npy 文件 (空数组无法映射，直接读取)
+    返回普通 ndarray 视图：底层仍是映射的内存，但避免 np.memmap 子类在每次索引、运算时的额外开销
+    """
+    try:
+        return np.load(path, mmap_mode='r').view(np.ndarray)
+    except ValueError:
+        return np.load(path)
+
+
+def encode_strings(strings: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """字符串列表编码为 (偏移, UTF-8 字节串)，供 StringArray 读取"""
+    chunks = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in chunks], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(chunks), dtype=np.uint8)
+
+
+class StringArray:
+    """映射的只读字符串表，按下标解码"""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self._offsets = memoryview(offsets) if len(offsets) else []
+        self._blob = memoryview(blob) if len(blob) else memoryview(b'')
+        self._count = max(0, len(offsets) - 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i) -> str:
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def take(self, ids: np.ndarray) -> List[str]:
+        """批量解码 (候选较多时比逐个下标访问快)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        starts, ends = self.offsets[ids].tolist(), self.offsets[ids + 1].tolist()
+        blob = self._blob.tobytes()
+        return [blob[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+
+    def __iter__(self) -> Iterator[str]:
+        blob = self._blob.tobytes()
+        offsets = self._offsets.tolist() if self._count else []
+        for i in range(self._count):
+            yield blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+
+
+class DictionaryColumn:
+    """字典编码的只读列：按需解码，行为与对象数组一致 (整数下标返回取值，数组下标返回对象数组)"""
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, blob: np.ndarray, kind: str):
+        self.codes = codes
+        self.offsets = offsets
+        self.blob = blob
+        self.kind = kind
+        self.unique_count = len(offsets) - 1
+        self._decode = _CODECS[kind][1]
+        # 逐个解码时通过 memoryview 访问，比 numpy 标量索引快一个数量级
+        self._offsets = memoryview(offsets) if len(offsets) else []
+        self._blob = memoryview(blob) if len(blob) else memoryview(b'')
+        # 低基数列的全部取值 (末尾的 None 对应编码 -1)
+        self._decoded: Optional[List[Any]] = None
+        if self.unique_count <= DECODED_VALUES_LIMIT:
+            self._decoded = self._decode_all() + [None]
+
+    def value(self, code: int) -> Any:
+        """字典中第 code 个取值 (-1 为 NULL)"""
+        if self._decoded is not None:
+            return self._decoded[code]
+        if code < 0:
+            return None
+        data = self._blob[self._offsets[code]:self._offsets[code + 1]]
+        return str(data, 'utf-8') if self.kind == 'str' else self._decode(data.tobytes())
+
+    def values(self) -> List[Any]:
+        """字典中的全部取值 (按编码顺序)"""
+        if self._decoded is not None:
+            return self._decoded[:-1]
+        return self._decode_all()
+
+    def _decode_all(self) -> List[Any]:
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [self._decode(blob[offsets[i]:offsets[i + 1]]) for i in range(self.unique_count)]
+
+    def take(self, indices) -> List[Any]:
+        """按行号 (数组或切片) 取值，同一次调用中相同的取值只解码一次"""
+        codes = self.codes[indices].tolist()
+        if self._decoded is not None:
+            decoded = self._decoded
+            return [decoded[code] for code in codes]
+        value = self.value
+        decoded = {code: value(code) for code in set(codes)}
+        return [decoded[code] for code in codes]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.value(int(self.codes[index]))
+        values = self.take(index)
+        col = np.empty(len(values), dtype=object)
+        col[:] = values
+        return col
+
+    def __iter__(self) -> Iterator[Any]:
+        step = 65536
+        for start in range(0, len(self.codes), step):
+            yield from self.take(slice(start, start + step))
+
+
+def _write_column(directory: str, prefix: str, values: List[Any]) -> str:
+    """字典编码并写出一列，返回取值类型"""
+    kind = _column_kind(values)
+    encode = _CODECS[kind][0]
+    lookup: Dict[Any, int] = {}
+    chunks: List[bytes] = []
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            codes[i] = -1
+            continue
+        # 按编码后的字节去重 (Decimal('1.0') 与 Decimal('1.00') 相等但序列化结果不同)
+        b = v.encode('utf-8') if kind == 'str' else encode(v)
+        code = lookup.get(b)
+        if code is None:
+            code = lookup[b] = len(chunks)
+            chunks.append(b)
+        codes[i] = code
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in chunks], out=offsets[1:])
+    np.save(os.path.join(directory, f"{prefix}.codes.npy"), codes)
+    np.save(os.path.join(directory, f"{prefix}.offsets.npy"), offsets)
+    np.save(os.path.join(directory, f"{prefix}.blob.npy"), np.frombuffer(b''.join(chunks), dtype=np.uint8))
+    return kind
+
+
+class MappedTable:
+    """已发布的一个版本：字典编码列 + 附带数组 + 元数据，全部只读映射"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, 'table.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.path = path
+        self.version: int = manifest['version']
+        self.size: int = manifest['size']
+        self.fields: List[str] = manifest['fields']
+        self.meta: Dict[str, Any] = manifest['meta']
+        self.columns: Dict[str, DictionaryColumn] = {}
+        for j, (f, kind) in enumerate(zip(self.fields, manifest['kinds'])):
+            prefix = os.path.join(path, f"c{j}")
+            self.columns[f] = DictionaryColumn(_load_array(f"{prefix}.codes.npy"), _load_array(f"{prefix}.offsets.npy"),
+                                               _load_array(f"{prefix}.blob.npy"), kind)
+        self.arrays: Dict[str, np.ndarray] = {
+            name: _load_array(os.path.join(path, f"a{j}.npy")) for j, name in enumerate(manifest['arrays'])
+        }
+
+    def rows(self, indices, fields: Iterable[str]) -> List[Dict]:
+        """按行号 (数组或切片) 物化为字典"""
+        if not isinstance(indices, slice):
+            indices = np.asarray(indices, dtype=np.int64)
+        count = len(range(self.size)[indices]) if isinstance(indices, slice) else len(indices)
+        cols = [(f, self.columns[f].take(indices)) for f in fields]
+        return [{f: values[n] for f, values in cols} for n in range(count)]
+
+    def iter_rows(self, fields: Iterable[str], start: int = 0, chunk: int = 4096) -> Iterator[Dict]:
+        """从第 start 行起逐块物化，不在内存中保留整表"""
+        fields = list(fields)
+        for begin in range(start, self.size, chunk):
+            yield from self.rows(slice(begin, begin + chunk), fields)
+
+
+class CatalogStore:
+    """
+    directory 下名为 name 的共享表：
+    <name>.current 为指针文件 (版本号、版本目录、最近检查时间)，<name>-v<版本号> 为版本目录，<name>.lock 为发布锁
+    """
+
+    def __init__(self, directory: str, name: str, keep: int = 2):
+        if fcntl is None:
+            raise RuntimeError("Shared catalog store requires POSIX file locks (fcntl)")
+        self.directory = directory
+        self.name = name
+        self.keep = max(2, keep)
+        self._pointer_path = os.path.join(directory, f"{name}.current")
+        self._lock_path = os.path.join(directory, f"{name}.lock")
+        os.makedirs(directory, exist_ok=True)
+
+    def pointer(self) -> Optional[Dict[str, Any]]:
+        """当前发布的版本；尚未发布时返回 None"""
+        try:
+            with open(self._pointer_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.error(f"Catalog store '{self.name}' pointer is unreadable: {e}")
+            return None
+
+    def _write_pointer(self, pointer: Dict[str, Any]):
+        tmp = f"{self._pointer_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(pointer, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._pointer_path)
+
+    @contextlib.contextmanager
+    def publishing(self, blocking: bool = False) -> Iterator[bool]:
+        """发布锁 (进程退出时自动释放)；blocking 为假且锁已被占用时得到 False"""
+        with open(self._lock_path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def is_fresh(self, max_age: float) -> bool:
+        """已发布的版本在 max_age 秒内从数据库检查过"""
+        pointer = self.pointer()
+        return pointer is not None and time.time() - pointer['checked_at'] < max_age
+
+    def touch(self):
+        """(持有发布锁时调用) 数据库没有变化：只更新检查时间，其余进程据此跳过加载"""
+        pointer = self.pointer()
+        if pointer is not None:
+            self._write_pointer({**pointer, "checked_at": time.time()})
+
+    def publish(self, rows: List[Dict], fields: List[str], arrays: Optional[Dict[str, np.ndarray]] = None,
+                meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """(持有发布锁时调用) 写出新版本并原子切换指针，返回新的指针"""
+        pointer = self.pointer()
+        version = (pointer['version'] if pointer else 0) + 1
+        name = f"{self.name}-v{version}"
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        kinds = [_write_column(tmp, f"c{j}", [r.get(f) for r in rows]) for j, f in enumerate(fields)]
+        arrays = arrays or {}
+        for j, values in enumerate(arrays.values()):
+            np.save(os.path.join(tmp, f"a{j}.npy"), values)
+        with open(os.path.join(tmp, 'table.json'), 'w', encoding='utf-8') as f:
+            json.dump({"version": version, "size": len(rows), "fields": list(fields), "kinds": kinds,
+                       "arrays": list(arrays), "meta": meta or {}}, f, ensure_ascii=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        pointer = {"version": version, "path": name, "checked_at": time.time()}
+        self._write_pointer(pointer)
+        self._prune(version)
+        return pointer
+
+    def _prune(self, version: int):
+        """删除较旧的版本目录 (已映射的进程不受影响，文件在解除映射后才真正释放)"""
+        for entry in os.listdir(self.directory):
+            head, sep, tail = entry.partition(f"{self.name}-v")
+            if head or not sep or not tail.isdigit() or int(tail) > version - self.keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def open(self, pointer: Optional[Dict[str, Any]] = None) -> Optional[MappedTable]:
+        """映射指定 (默认为当前) 版本"""
+        pointer = pointer or self.pointer()
+        if pointer is None:
+            return None
+        return MappedTable(os.path.join(self.directory, pointer['path']))
+
+    def refresh(self, build: Callable[[], Optional[bool]], max_age: float) -> Optional[Dict[str, Any]]:
+        """
+        已发布版本超过 max_age 未检查时由拿到发布锁的进程调用 build (从数据库加载并 publish / touch)
+        尚无任何版本时等待正在发布的进程，避免每个 worker 都去加载；返回当前指针
+        """
+        if not self.is_fresh(max_age):
+            with self.publishing(blocking=self.pointer() is None) as acquired:
+                # 拿到锁后重新检查：等待期间其他进程可能已经发布
+                if acquired and not self.is_fresh(max_age):
+                    build()
+        return self.pointer()
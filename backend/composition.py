@@ -0,0 +1,238 @@
+# composition.py
+# 成分解析与成分索引：每个 elem 字符串只解析一次，目录中的成分存为 纤维 × 百分比 矩阵，
+# "棉>30% + 聚酯纤维<60% + 氨纶" / "棉 / 天丝" 这类条件编译后对整个目录做向量化比较。
+import re
+import threading
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+from catalog_store import StringArray, encode_strings
+
+# 支持 "95%棉" 或 "棉95%" 两种写法
+ELEM_PATTERN = re.compile(r'(\d+(?:\.\d+)?)%\s*([\u4e00-\u9fa5a-zA-Z]+)|([\u4e00-\u9fa5a-zA-Z]+)(\d+(?:\.\d+)?)%')
+OP_PATTERN = re.compile(r'(>=|<=|>|<|=)([\d\.]+)')
+
+# 纤维名称归一化：别名 -> 标准名
+FIBER_ALIASES = {
+    '全棉': '棉', '纯棉': '棉', 'cotton': '棉',
+    '涤纶': '聚酯纤维', '聚酯': '聚酯纤维', 'polyester': '聚酯纤维',
+    '弹力纤维': '氨纶', '莱卡': '氨纶', 'spandex': '氨纶', 'lycra': '氨纶',
+    '尼龙': '锦纶', '聚酰胺纤维': '锦纶', 'nylon': '锦纶',
+    '粘胶纤维': '粘纤', '粘胶': '粘纤', '黏纤': '粘纤', '黏胶纤维': '粘纤', 'viscose': '粘纤',
+    '莱赛尔': '天丝', '莱赛尔纤维': '天丝', 'lyocell': '天丝', 'tencel': '天丝',
+    '莫代尔纤维': '莫代尔', 'modal': '莫代尔',
+    '绵羊毛': '羊毛', 'wool': '羊毛',
+}
+
+_VARIANTS: Dict[str, List[str]] = {}
+for _alias, _name in FIBER_ALIASES.items():
+    _VARIANTS.setdefault(_name, [_name]).append(_alias)
+
+
+def normalize_fiber(name: str) -> str:
+    """纤维名转为标准名 (小写、去空白、别名归并)"""
+    name = str(name or '').strip().lower()
+    return FIBER_ALIASES.get(name, name)
+
+
+def fiber_variants(name: str) -> List[str]:
+    """标准名及其全部别名，用于 SQL 粗筛和子串兜底匹配"""
+    canonical = normalize_fiber(name)
+    return _VARIANTS.get(canonical, [canonical])
+
+
+def elem_keyword_terms(query_str: Any) -> List[List[str]]:
+    """提取成分逻辑中的全部成分名 (忽略数字和符号)，每个成分名展开为别名列表，用于粗筛"""
+    keywords = re.findall(r'[\u4e00-\u9fa5a-zA-Z]+', str(query_str))
+    return [list(dict.fromkeys([kw.lower()] + fiber_variants(kw))) for kw in keywords]
+
+
+@lru_cache(maxsize=65536)
+def parse_composition(elem_str: str) -> Dict[str, float]:
+    """解析成分字符串为 {标准纤维名: 百分比}，同名纤维比例累加"""
+    row_elems: Dict[str, float] = {}
+    for m in ELEM_PATTERN.findall(elem_str.lower()):
+        if m[0] and m[1]: # 95%棉
+            name, pct = m[1], float(m[0])
+        elif m[2] and m[3]: # 棉95%
+            name, pct = m[2], float(m[3])
+        else:
+            continue
+        name = normalize_fiber(name)
+        row_elems[name] = row_elems.get(name, 0) + pct
+    return row_elems
+
+
+class CompositionCondition:
+    """单个成分条件：带比较符 (棉>30) 或仅成分名 (氨纶)"""
+    __slots__ = ('name', 'op', 'target', 'variants')
+
+    def __init__(self, name: str, op: Optional[str], target: Optional[float], variants: List[str]):
+        self.name = name
+        self.op = op
+        self.target = target
+        self.variants = variants
+
+    def compare(self, val):
+        """对标量或数组执行比较"""
+        if self.op == '>': return val > self.target
+        if self.op == '<': return val < self.target
+        if self.op == '>=': return val >= self.target
+        if self.op == '<=': return val <= self.target
+        return val == self.target
+
+
+class CompositionQuery:
+    """编译后的成分逻辑：'/' 分隔的组之间为 OR，组内 '+' 分隔的条件为 AND"""
+
+    def __init__(self, groups: List[List[CompositionCondition]]):
+        self.groups = groups
+
+    def match(self, elem_str: Any) -> bool:
+        """对单个 elem 字符串求值 (数据库回退路径使用)"""
+        elem_str_lower = str(elem_str or "").lower()
+        row_elems = parse_composition(elem_str_lower)
+        for group in self.groups:
+            group_pass = True
+            for cond in group:
+                if cond.op:
+                    match = cond.compare(row_elems.get(cond.name, 0))
+                else:
+                    # 仅搜索成分名时，解析出的成分中存在，或原始字符串中包含即可
+                    match = (cond.name in row_elems) or any(v in elem_str_lower for v in cond.variants)
+                if not match: group_pass = False; break
+            if group_pass: return True
+        return False
+
+    def mask(self, index: 'CompositionIndex') -> np.ndarray:
+        """在成分索引上向量化求值，返回按行的布尔掩码"""
+        result = np.zeros(index.unique_count, dtype=bool)
+        for group in self.groups:
+            group_mask = np.ones(index.unique_count, dtype=bool)
+            for cond in group:
+                if cond.op:
+                    group_mask &= cond.compare(index.percentages(cond.name))
+                else:
+                    group_mask &= index.present(cond.name) | index.contains_any(cond.variants)
+            result |= group_mask
+        return result[index.inverse]
+
+
+@lru_cache(maxsize=1024)
+def compile_composition_query(logic_query: str) -> CompositionQuery:
+    """把成分逻辑字符串编译为 CompositionQuery (结果缓存，重复查询不再解析)"""
+    groups = []
+    for group in str(logic_query).split('/'):
+        conds = []
+        for cond in group.split('+'):
+            cond = cond.strip().replace('%', '')
+            if not cond: continue
+            op_match = OP_PATTERN.search(cond)
+            if op_match:
+                try:
+                    target = float(op_match.group(2))
+                except ValueError:
+                    target = float('nan')
+                name = normalize_fiber(cond.replace(op_match.group(0), ''))
+                conds.append(CompositionCondition(name, op_match.group(1), target, fiber_variants(name)))
+            else:
+                name = normalize_fiber(cond)
+                variants = list(dict.fromkeys([cond.lower()] + fiber_variants(name)))
+                conds.append(CompositionCondition(name, None, None, variants))
+        groups.append(conds)
+    return CompositionQuery(groups)
+
+
+class CompositionIndex:
+    """目录成分索引：按去重后的 elem 字符串建立 纤维 × 百分比 矩阵"""
+    # 子串匹配结果缓存的条数上限 (每条为一个 unique_count 长度的布尔数组)
+    CONTAINS_CACHE_SIZE = 1024
+
+    def __init__(self, elem_values: Iterable[Any]):
+        unique: Dict[str, int] = {}
+        inverse = []
+        for v in elem_values:
+            s = str(v or "").lower()
+            inverse.append(unique.setdefault(s, len(unique)))
+        self.inverse = np.asarray(inverse, dtype=np.int64)
+        self.strings: List[str] = list(unique.keys())
+        self.unique_count = len(self.strings)
+
+        parsed = [parse_composition(s) for s in self.strings]
+        self.fibers: Dict[str, int] = {}
+        for comp in parsed:
+            for name in comp:
+                self.fibers.setdefault(name, len(self.fibers))
+
+        self.matrix = np.zeros((self.unique_count, len(self.fibers)), dtype=np.float64)
+        self.presence = np.zeros((self.unique_count, len(self.fibers)), dtype=bool)
+        for i, comp in enumerate(parsed):
+            for name, pct in comp.items():
+                j = self.fibers[name]
+                self.matrix[i, j] = pct
+                self.presence[i, j] = True
+
+        self._finish()
+
+    def _finish(self):
+        self._zeros = np.zeros(self.unique_count, dtype=np.float64)
+        self._absent = np.zeros(self.unique_count, dtype=bool)
+        self._contains: 'OrderedDict[Tuple[str, ...], np.ndarray]' = OrderedDict()
+        self._contains_lock = threading.Lock()
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为扁平数组 (共享列式文件)：成分串表、纤维名表、比例矩阵与行映射"""
+        offsets, blob = encode_strings(self.strings)
+        fiber_offsets, fiber_blob = encode_strings(self.fibers)
+        return {"offsets": offsets, "blob": blob, "fiber_offsets": fiber_offsets, "fiber_blob": fiber_blob,
+                "matrix": self.matrix, "presence": self.presence, "inverse": self.inverse.astype(np.int32)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'CompositionIndex':
+        """由 to_arrays 导出 (并映射) 的数组建立，不复制数据"""
+        index = cls.__new__(cls)
+        index.inverse = arrays["inverse"]
+        index.strings = StringArray(arrays["offsets"], arrays["blob"])
+        index.unique_count = len(index.strings)
+        index.fibers = {name: j for j, name in enumerate(StringArray(arrays["fiber_offsets"], arrays["fiber_blob"]))}
+        index.matrix = arrays["matrix"]
+        index.presence = arrays["presence"]
+        index._finish()
+        return index
+
+    def percentages(self, name: str) -> np.ndarray:
+        j = self.fibers.get(name)
+        return self._zeros if j is None else self.matrix[:, j]
+
+    def present(self, name: str) -> np.ndarray:
+        j = self.fibers.get(name)
+        return self._absent if j is None else self.presence[:, j]
+
+    def keyword_mask(self, query_str: Any) -> Optional[np.ndarray]:
+        """对应 parse_elem_filter 的 SQL LIKE 粗筛：含 '/' 时任一成分名出现即可，否则需全部出现"""
+        terms = elem_keyword_terms(query_str)
+        if not terms: return None
+        combine = np.logical_or if '/' in str(query_str) else np.logical_and
+        result = self.contains_any(terms[0])
+        for t in terms[1:]:
+            result = combine(result, self.contains_any(t))
+        return result[self.inverse]
+
+    def contains_any(self, terms: List[str]) -> np.ndarray:
+        """原始字符串子串匹配 (仅在去重后的成分串上计算，结果按 LRU 缓存)"""
+        key = tuple(terms)
+        with self._contains_lock:
+            cached = self._contains.get(key)
+            if cached is not None:
+                self._contains.move_to_end(key)
+                return cached
+        # 匹配在锁外计算，并发查询不互相阻塞
+        cached = np.fromiter((any(t in s for t in terms) for s in self.strings), dtype=bool, count=self.unique_count)
+        with self._contains_lock:
+            self._contains[key] = cached
+            self._contains.move_to_end(key)
+            while len(self._contains) > self.CONTAINS_CACHE_SIZE:
+                self._contains.popitem(last=False)
+        return cached
@@ -0,0 +1,121 @@
+# db_async.py
+# 原生 asyncio 数据访问层：基于 aiomysql 的异步连接池，
+# 提供连接获取/归还、空闲连接健康检查、获取与查询超时，查询直接在事件循环上 await。
+import time
+import asyncio
+import logging
+import weakref
+import aiomysql
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Sequence
+
+from metrics import POOL_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """异步 MySQL 连接池 (首次使用时创建)"""
+
+    def __init__(self, config: Dict[str, Any], minsize: int = 1, maxsize: int = 100,
+                 acquire_timeout: float = 10, query_timeout: float = 30,
+                 health_check_interval: float = 60, pool_recycle: int = 3600):
+        self.config = {
+            'host': config['host'],
+            'port': config['port'],
+            'user': config['user'],
+            'password': config['password'],
+            'db': config['db'],
+            'charset': config.get('charset', 'utf8mb4'),
+            'cursorclass': aiomysql.DictCursor,
+            'autocommit': True,
+        }
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.acquire_timeout = acquire_timeout
+        self.query_timeout = query_timeout
+        self.health_check_interval = health_check_interval
+        self.pool_recycle = pool_recycle
+        self._pool: Optional[aiomysql.Pool] = None
+        self._pool_lock: Optional[asyncio.Lock] = None
+        # 连接最近一次归还的时间，用于判断是否需要健康检查
+        self._last_used: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+    async def _get_pool(self) -> aiomysql.Pool:
+        if self._pool is not None:
+            return self._pool
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    minsize=self.minsize, maxsize=self.maxsize,
+                    pool_recycle=self.pool_recycle, **self.config
+                )
+                logger.info(f"Async DB pool created (min={self.minsize}, max={self.maxsize})")
+        return self._pool
+
+    async def _healthy(self, conn) -> bool:
+        """空闲超过 health_check_interval 的连接先 ping 一次"""
+        last_used = self._last_used.get(conn)
+        # 新建的连接无需检查
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(conn.ping(reconnect=False), self.acquire_timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Async DB connection failed health check: {e}")
+            return False
+
+    @asynccontextmanager
+    async def acquire(self):
+        """获取一个健康的连接，使用完毕自动归还；超时抛出 asyncio.TimeoutError"""
+        pool = await self._get_pool()
+        start = time.perf_counter()
+        conn = await asyncio.wait_for(pool.acquire(), self.acquire_timeout)
+        if not await self._healthy(conn):
+            conn.close()
+            pool.release(conn)
+            conn = await asyncio.wait_for(pool.acquire(), self.acquire_timeout)
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start, 'async')
+        try:
+            yield conn
+        finally:
+            self._last_used[conn] = time.monotonic()
+            pool.release(conn)
+
+    async def _execute(self, sql: str, params: Optional[Sequence[Any]], fetch_one: bool):
+        async with self.acquire() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await asyncio.wait_for(cursor.execute(sql, params), self.query_timeout)
+                    if fetch_one:
+                        return await cursor.fetchone()
+                    return await cursor.fetchall()
+            except asyncio.TimeoutError:
+                # 超时后连接状态未知，直接关闭，归还时由连接池丢弃
+                conn.close()
+                raise
+
+    async def fetchall(self, sql: str, params: Optional[Sequence[Any]] = None) -> List[Dict]:
+        return list(await self._execute(sql, params, fetch_one=False))
+
+    async def fetchone(self, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Dict]:
+        return await self._execute(sql, params, fetch_one=True)
+
+    def stats(self) -> Dict[str, Any]:
+        if self._pool is None:
+            return {"size": 0, "free": 0, "used": 0, "maxsize": self.maxsize}
+        return {
+            "size": self._pool.size,
+            "free": self._pool.freesize,
+            "used": self._pool.size - self._pool.freesize,
+            "maxsize": self.maxsize,
+        }
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
@@ -0,0 +1,240 @@
+# db_pool.py
+# 同步 (pymysql) 连接池管理：替代启动时即建立 mincached 个连接的 PooledDB。
+# - 懒连接：创建连接池不连接数据库，可选后台预热
+# - 自适应容量：等待连接超过 grow_wait 时提高容量上限 (不超过 max_size)，连接空闲超过 idle_timeout 时关闭并回收容量
+# - 健康检查：空闲超过 health_check_interval 的连接交出前先 ping，失败则丢弃重建
+# - 统计：在用/空闲/容量上限/创建与丢弃次数，等待时间记入 db_pool_wait_seconds 直方图
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, Optional
+
+from metrics import POOL_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """在 acquire_timeout 内没有拿到连接"""
+
+
+class PooledConnection:
+    """借出的连接：close() 归还给连接池，其余属性转发给底层连接 (与 PooledDB 的用法一致)"""
+
+    def __init__(self, pool: 'ManagedPool', conn):
+        self._pool = pool
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ManagedPool:
+    def __init__(self, creator: Callable[..., Any], name: str = 'sync', min_size: int = 1, max_size: int = 100,
+                 acquire_timeout: float = 10, grow_wait: float = 0.05, idle_timeout: float = 300,
+                 health_check_interval: float = 60, **connect_kwargs):
+        """
+        creator: 数据库驱动模块 (pymysql) 或返回新连接的函数
+        min_size: 空闲回收时保留的最少连接数，也是初始容量上限
+        max_size: 容量上限的最大值
+        grow_wait: 等待超过该时间 (秒) 时提高容量上限
+        """
+        self._connect = creator.connect if hasattr(creator, 'connect') else creator
+        self.connect_kwargs = connect_kwargs
+        self.name = name
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.acquire_timeout = acquire_timeout
+        self.grow_wait = grow_wait
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.limit = self.min_size
+        # 最近一次因等待而扩容的时间；超过 idle_timeout 没有扩容时收回多余的容量上限
+        self._last_grow = 0.0
+        # 空闲连接 (连接, 归还时间)，右端为最近归还
+        self._idle: deque = deque()
+        self._in_use = 0
+        self._opening = 0
+        self._cond = threading.Condition()
+        self._counters = {"created": 0, "closed": 0, "health_failures": 0, "connect_errors": 0,
+                          "waits": 0, "timeouts": 0, "grown": 0, "shrunk": 0}
+
+    # --- 借出与归还 ---
+
+    def connection(self) -> PooledConnection:
+        """借出一个健康的连接；在 acquire_timeout 内拿不到时抛出 PoolTimeoutError"""
+        start = time.perf_counter()
+        conn = self._acquire(start)
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start, self.name)
+        return PooledConnection(self, conn)
+
+    def _acquire(self, start: float):
+        deadline = start + self.acquire_timeout
+        waited = False
+        while True:
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._size() < self.limit:
+                        conn, returned_at = None, None
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(f"No {self.name} DB connection available in {self.acquire_timeout}s")
+                    if not waited:
+                        waited = True
+                        self._counters["waits"] += 1
+                    if not self._cond.wait(min(remaining, self.grow_wait)) and self.limit < self.max_size:
+                        # 等待超过 grow_wait：提高容量上限 (每次增加当前上限的一半)
+                        self.limit = min(self.max_size, self.limit + max(1, self.limit // 2))
+                        self._last_grow = time.monotonic()
+                        self._counters["grown"] += 1
+                        logger.info(f"DB pool '{self.name}' limit raised to {self.limit}")
+            if conn is None:
+                return self._open()
+            if self._healthy(conn, returned_at):
+                return conn
+            self._discard(conn)
+
+    def _release(self, conn):
+        try:
+            # 与 PooledDB (reset=True) 一样，归还前结束未提交的事务
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            expired = self._expire_idle()
+            self._cond.notify()
+        for stale in expired:
+            self._close(stale)
+
+    def _size(self) -> int:
+        return self._in_use + len(self._idle) + self._opening
+
+    # --- 连接的建立、检查与关闭 ---
+
+    def _open(self):
+        """建立新连接 (调用前已在 _opening 中预留名额)"""
+        try:
+            conn = self._connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._counters["connect_errors"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self._in_use += 1
+            self._counters["created"] += 1
+        return conn
+
+    def _healthy(self, conn, returned_at: float) -> bool:
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"DB pool '{self.name}' connection failed health check: {e}")
+            with self._cond:
+                self._counters["health_failures"] += 1
+            return False
+
+    def _discard(self, conn):
+        """丢弃一个借出中的连接，空出的名额交给等待者"""
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+        self._close(conn)
+
+    def _close(self, conn):
+        with self._cond:
+            self._counters["closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expire_idle(self) -> list:
+        """(持有锁时调用) 取出空闲超过 idle_timeout 的连接 (保留 min_size 个)；一段时间没有等待时收回容量上限"""
+        expired = []
+        now = time.monotonic()
+        while self._idle and self._size() > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        target = max(self.min_size, self._size())
+        if self.limit > target and now - self._last_grow > self.idle_timeout:
+            self.limit = target
+            self._counters["shrunk"] += 1
+        return expired
+
+    # --- 预热与维护 ---
+
+    def warmup(self, count: int):
+        """建立最多 count 个空闲连接；数据库不可用时只记录警告"""
+        count = min(count, self.max_size)
+        with self._cond:
+            self.limit = max(self.limit, count)
+        opened = []
+        try:
+            for _ in range(count):
+                with self._cond:
+                    if self._size() >= count:
+                        break
+                    self._opening += 1
+                opened.append(self._open())
+            logger.info(f"DB pool '{self.name}' warmed up with {len(opened)} connections")
+        except Exception as e:
+            logger.warning(f"DB pool '{self.name}' warmup stopped after {len(opened)} connections: {e}")
+        for conn in opened:
+            self._release(conn)
+
+    def start_warmup(self, count: int) -> Optional[threading.Thread]:
+        """后台预热，不阻塞启动"""
+        if count <= 0:
+            return None
+        thread = threading.Thread(target=self.warmup, args=(count,), name=f"db-pool-warmup-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "size": self._size(),
+                "used": self._in_use,
+                "free": len(self._idle),
+                "limit": self.limit,
+                "minsize": self.min_size,
+                "maxsize": self.max_size,
+                **self._counters,
+            }
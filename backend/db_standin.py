@@ -0,0 +1,144 @@
+# db_standin.py
+# 本地替身数据库：用 SQLite 文件 (bench_data.py 生成) 代替 MySQL，接口与 PooledDB / AsyncDatabase 一致，
+# 供基准测试、压测在没有生产数据库时启动服务。设置环境变量 DB_STANDIN=<SQLite 文件> 后 fastapi_server 自动使用。
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Sequence
+
+from metrics import POOL_WAIT_SECONDS
+
+
+def _regexp(pattern: str, value: Any) -> bool:
+    return value is not None and re.search(pattern, str(value)) is not None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """只读打开 (多线程各自持有连接)，注册 MySQL 方言中用到的 REGEXP"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+    return conn
+
+
+def translate(sql: str) -> str:
+    """MySQL (pymysql) 占位符 %s 转为 SQLite 的 ?"""
+    return sql.replace('%s', '?')
+
+
+class StandInCursor:
+    """DictCursor 语义：fetchall 返回 dict 列表"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._rows: List[Dict] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None):
+        cursor = self._conn.execute(translate(sql), list(params or []))
+        self._rows = [dict(r) for r in cursor.fetchall()]
+        return len(self._rows)
+
+    def fetchall(self) -> List[Dict]:
+        return self._rows
+
+    def fetchone(self) -> Optional[Dict]:
+        return self._rows[0] if self._rows else None
+
+
+class StandInConnection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self._conn)
+
+    def close(self):
+        """与 PooledDB 一样，close 只是归还 (连接由线程持有)"""
+
+
+class StandInPool:
+    """同步连接池 (db_pool.ManagedPool) 替身：每个线程复用一个 SQLite 连接"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._created = 0
+
+    def _thread_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            self._created += 1
+        return conn
+
+    def connection(self) -> StandInConnection:
+        start = time.perf_counter()
+        conn = self._thread_conn()
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start, 'sync')
+        return StandInConnection(conn)
+
+    def start_warmup(self, count: int):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self._created, "created": self._created}
+
+    def close(self):
+        pass
+
+
+class StandInAsyncDatabase:
+    """
+    AsyncDatabase 替身：查询在线程中执行 (SQLite 没有异步驱动)，
+    用信号量限制并发连接数，以便压测时观察连接池饱和
+    """
+
+    def __init__(self, path: str, maxsize: int = 100, acquire_timeout: float = 10):
+        self.pool = StandInPool(path)
+        self.maxsize = maxsize
+        self.acquire_timeout = acquire_timeout
+        self._used = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+        start = time.perf_counter()
+        await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start, 'async')
+        self._used += 1
+        try:
+            yield self.pool
+        finally:
+            self._used -= 1
+            self._semaphore.release()
+
+    def _execute(self, sql: str, params: Optional[Sequence[Any]], fetch_one: bool):
+        # 等待时间已在 acquire 中按 async 记录
+        with StandInCursor(self.pool._thread_conn()) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+
+    async def fetchall(self, sql: str, params: Optional[Sequence[Any]] = None) -> List[Dict]:
+        async with self.acquire():
+            return await asyncio.to_thread(self._execute, sql, params, False)
+
+    async def fetchone(self, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Dict]:
+        async with self.acquire():
+            return await asyncio.to_thread(self._execute, sql, params, True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.maxsize, "free": self.maxsize - self._used, "used": self._used, "maxsize": self.maxsize}
+
+    async def close(self):
+        pass
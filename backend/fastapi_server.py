@@ -1,35 +1,46 @@
 import re
 import pymysql
-import datetime
 import asyncio
 import logging
-import json
-from dbutils.pooled_db import PooledDB
-from decimal import Decimal
 
 import os
+import time
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
 # --- 日志配置 ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("query.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 文本日志写入 query.log，请求体与 SQL 事件 (JSON-lines) 写入 query_events.jsonl，均由后台线程批量写入
+from logs import setup_logging, log_payload, log_sql, logging_stats
+setup_logging("query.log", os.getenv("LOG_EVENT_FILE", "query_events.jsonl"))
 logger = logging.getLogger(__name__)
-from typing import Dict, Any, Optional, List, Tuple, Union
+from typing import Dict, Any, Optional, List, Tuple, Union, AsyncIterator, Awaitable
 from fastapi import FastAPI, HTTPException, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 import uvicorn
 from pydantic import BaseModel, Field, ConfigDict
-from wechat.Wechat import WeChat
+from wechat.Wechat import WeChat, close_http_client
+from catalog import CatalogEngine, CatalogSnapshot
+from catalog_store import CatalogStore
+from db_async import AsyncDatabase
+from db_pool import ManagedPool
+from scheduler import RequestClass, AdmissionMiddleware, run_blocking
+from singleflight import SingleFlight
+from material_index import MaterialImageIndex
+from material_search import MaterialSearchEngine
+from serializer import convert_value, serialize_rows, dumps
+from result_cache import SearchResultCache, TTLCache, canonical_query, canonical_key
+from pagination import CursorError, query_fingerprint, encode_cursor, decode_cursor
+from metrics import REGISTRY, POOL_WAIT_SECONDS, REQUEST_SECONDS, stage, cache_collector, gauge_collector, stage_summary
+from ranking import (
+    SERIES_SCORES, DEFAULT_SERIES_SCORE, series_score, by_code, top_k_rows, top_k_order, default_keys, numeric_keys, after_position
+)
+from query_plan import (
+    ColumnFilter, QueryPlan, PlanCache, group_by_shared_filters, parse_numeric_filter, parse_text_filter, parse_elem_filter,
+    compile_text_predicate, compile_elem_predicate, compile_soft_terms, resolve_sort, resolve_mode
+)
 
 app = FastAPI(title="Fabric Search API", description="纺织面料产品搜索服务")
 
@@ -42,6 +53,49 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """按路由记录接口耗时 (流式响应只计到开始发送)"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, route.path if route is not None else "unmatched")
+    return response
+
+# --- 准入控制 ---
+# 每类请求独立的并发上限、有界队列与线程池，排队已满或超时返回 503 + Retry-After
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+
+def request_class(name: str, concurrency: int, queue_size: int, threads: int) -> RequestClass:
+    """ADMISSION_<类别>_CONCURRENCY / _QUEUE / _THREADS 可覆盖默认值"""
+    prefix = f"ADMISSION_{name.upper()}_"
+    return RequestClass(
+        name,
+        concurrency=int(os.getenv(prefix + 'CONCURRENCY', concurrency)),
+        queue_size=int(os.getenv(prefix + 'QUEUE', queue_size)),
+        threads=int(os.getenv(prefix + 'THREADS', threads)),
+        queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10)),
+        retry_after=int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+    )
+
+REQUEST_CLASSES = {
+    "search": request_class("search", 32, 128, 8),
+    "detail": request_class("detail", 64, 256, 4),
+    "source": request_class("source", 32, 128, 4),
+    "auth": request_class("auth", 16, 64, 2),
+}
+ROUTE_CLASSES = {
+    "/api/product_search": "search",
+    "/api/get_product_detail": "detail",
+    "/api/get_product_details": "detail",
+    "/api/search_source": "source",
+    "/api/get_user_info": "auth",
+    "/api/wechat_login": "auth",
+}
+if ADMISSION_ENABLED:
+    # 最后添加的中间件在最外层：被拒绝的请求不进入路由，request_seconds 不含排队时间
+    app.add_middleware(AdmissionMiddleware, classes=REQUEST_CLASSES, routes=ROUTE_CLASSES)
+
 # --- 数据库配置 ---
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', '139.196.198.169'), 
@@ -53,19 +107,70 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
-# 初始化连接池
-pool = PooledDB(
-    creator=pymysql,
-    mincached=10,    # 初始化时，连接池中至少创建的空闲连接数
-    maxcached=50,   # 连接池中最多闲置的连接数
-    maxconnections=100, # 连接池允许的最大连接数
-    blocking=True,  # 连接池中如果没有可用连接后，是否阻塞等待
-    **DB_CONFIG
-)
+# 本地替身数据库 (bench_data.py 生成的 SQLite 文件)，用于基准测试与压测，设置后不连接 MySQL
+DB_STANDIN = os.getenv('DB_STANDIN')
+
+# 初始化连接池 (懒连接：启动时不连接数据库，DB_POOL_WARMUP > 0 时在后台预热)
+DB_POOL_WARMUP = int(os.getenv('DB_POOL_WARMUP', 0))
+if DB_STANDIN:
+    from db_standin import StandInPool, StandInAsyncDatabase
+    pool = StandInPool(DB_STANDIN)
+else:
+    pool = ManagedPool(
+        creator=pymysql,
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', 2)),      # 空闲回收时保留的连接数，也是初始容量上限
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', 100)),    # 容量上限的最大值
+        acquire_timeout=float(os.getenv('DB_ACQUIRE_TIMEOUT', 10)),
+        grow_wait=float(os.getenv('DB_POOL_GROW_WAIT', 0.05)),   # 等待连接超过该时间时扩容
+        idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),  # 空闲超过该时间的连接关闭
+        health_check_interval=float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 60)),
+        **DB_CONFIG
+    )
 
 def get_db_connection():
     return pool.connection()
 
+# --- 异步数据库访问 ---
+# 请求路径上的查询直接在事件循环上 await (aiomysql)，不再占用线程池线程；
+# DB_ASYNC=0 时回退为 pymysql 连接池 + 当前请求类别的线程池 (run_blocking)。目录快照的后台加载仍使用同步连接池。
+DB_ASYNC = os.getenv('DB_ASYNC', '1') == '1'
+if not DB_ASYNC:
+    async_db = None
+elif DB_STANDIN:
+    async_db = StandInAsyncDatabase(
+        DB_STANDIN,
+        maxsize=int(os.getenv('DB_ASYNC_MAXSIZE', 100)),
+        acquire_timeout=float(os.getenv('DB_ACQUIRE_TIMEOUT', 10))
+    )
+else:
+    async_db = AsyncDatabase(
+        DB_CONFIG,
+        minsize=int(os.getenv('DB_ASYNC_MINSIZE', 1)),
+        maxsize=int(os.getenv('DB_ASYNC_MAXSIZE', 100)),
+        acquire_timeout=float(os.getenv('DB_ACQUIRE_TIMEOUT', 10)),
+        query_timeout=float(os.getenv('DB_QUERY_TIMEOUT', 30)),
+        health_check_interval=float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 60))
+    )
+
+def fetch_sync(sql: str, params: Optional[List[Any]] = None, fetch_one: bool = False):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+    finally:
+        conn.close()
+
+async def db_fetchall(sql: str, params: Optional[List[Any]] = None) -> List[Dict]:
+    if async_db is not None:
+        return await async_db.fetchall(sql, params)
+    return list(await run_blocking(fetch_sync, sql, params))
+
+async def db_fetchone(sql: str, params: Optional[List[Any]] = None) -> Optional[Dict]:
+    if async_db is not None:
+        return await async_db.fetchone(sql, params)
+    return await run_blocking(fetch_sync, sql, params, True)
+
 # --- 字段定义 ---
 # 默认返回字段
 DEFAULT_RETURN_FIELDS = [
@@ -208,6 +313,96 @@ STRICT_TEXT_FIELDS = {
 SOFT_FIELDS = {'fabe', 'introduce', 'production_process'}
 SIMPLE_SQL_TEXT_FIELDS = ['code', 'name', 'code_start']
 
+# --- 产品目录内存快照 ---
+CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', '1') == '1'
+CATALOG_REFRESH_SECONDS = float(os.getenv('CATALOG_REFRESH_SECONDS', 300))
+# 多 worker 部署时指向主机内共享目录 (如 /dev/shm/ai-chat-catalog)：产品目录与素材只由一个 worker 加载并写成
+# 只读列式文件，各 worker 映射同一份数据；为空时每个进程各自加载
+CATALOG_SHARED_DIR = os.getenv('CATALOG_SHARED_DIR', '')
+CATALOG_SHARED_POLL_SECONDS = float(os.getenv('CATALOG_SHARED_POLL_SECONDS', 5))
+
+def load_catalog_rows(fields: List[str]) -> List[Dict]:
+    """全量读取产品表，供内存快照使用 (按款号排列，排序键相同时按行号即款号先后)"""
+    fields_sql = ", ".join([f"`{f}`" for f in fields])
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {fields_sql} FROM ai_product_app_v1")
+            return by_code(cursor.fetchall())
+    finally:
+        conn.close()
+
+catalog_engine = CatalogEngine(
+    loader=load_catalog_rows,
+    fields=list(FIELD_MAPPING.keys()),
+    numeric_fields=NUMERIC_FIELDS,
+    index_fields=STRICT_TEXT_FIELDS,
+    refresh_interval=CATALOG_REFRESH_SECONDS,
+    store=CatalogStore(CATALOG_SHARED_DIR, 'product') if CATALOG_SHARED_DIR else None,
+    poll_interval=CATALOG_SHARED_POLL_SECONDS
+)
+
+# --- 款号 -> 素材图索引 ---
+MATERIAL_INDEX_ENABLED = os.getenv('MATERIAL_INDEX_ENABLED', '1') == '1'
+MATERIAL_INDEX_REFRESH_SECONDS = float(os.getenv('MATERIAL_INDEX_REFRESH_SECONDS', 60))
+MATERIAL_INDEX_FULL_REFRESH_SECONDS = float(os.getenv('MATERIAL_INDEX_FULL_REFRESH_SECONDS', 3600))
+
+def load_source_rows(after_id: Optional[int]) -> List[Dict]:
+    """读取素材表 (after_id 不为空时只读取新增部分)，供素材图索引与素材检索共用"""
+    sql = "SELECT id, name, tags, file_type, pic_url, video_path, is_delete FROM ai_source_app_v1"
+    params = []
+    if after_id is not None:
+        sql += " WHERE id > %s"
+        params.append(after_id)
+    sql += " ORDER BY id"
+    return fetch_sync(sql, params)
+
+material_index = MaterialImageIndex(
+    loader=load_source_rows,
+    refresh_interval=MATERIAL_INDEX_REFRESH_SECONDS,
+    full_refresh_interval=MATERIAL_INDEX_FULL_REFRESH_SECONDS,
+    store=CatalogStore(CATALOG_SHARED_DIR, 'material') if CATALOG_SHARED_DIR else None,
+    poll_interval=CATALOG_SHARED_POLL_SECONDS
+)
+
+def format_source_row(row: Dict) -> Dict:
+    """素材返回内容：清洗数据并为 pic_url 和 video_path 补全域名"""
+    serialized = serialize_row({k: row.get(k) for k in ('name', 'file_type', 'pic_url', 'video_path')})
+    # 处理图片域名
+    if serialized.get('pic_url') and serialized['pic_url'].startswith('/'):
+        serialized['pic_url'] = f"https://lobe.wyoooni.net{serialized['pic_url']}"
+    # 处理视频域名
+    if serialized.get('video_path') and serialized['video_path'].startswith('/'):
+        serialized['video_path'] = f"https://lobe.wyoooni.net{serialized['video_path']}"
+    return serialized
+
+def load_live_source_ids() -> List[int]:
+    """未删除素材的 id (与素材检索的 is_delete = 0 一致)，增量刷新时用于同步删除"""
+    return [r['id'] for r in fetch_sync("SELECT id FROM ai_source_app_v1 WHERE is_delete = 0")]
+
+# 素材检索快照与素材图索引共用一次加载
+material_search = MaterialSearchEngine(formatter=format_source_row, live_ids=load_live_source_ids)
+material_index.on_load(material_search.on_load)
+
+@app.on_event("startup")
+async def start_catalog_engine():
+    pool.start_warmup(DB_POOL_WARMUP)
+    if CATALOG_ENABLED:
+        catalog_engine.start()
+    if MATERIAL_INDEX_ENABLED:
+        material_index.start()
+
+@app.on_event("shutdown")
+async def stop_catalog_engine():
+    catalog_engine.stop()
+    material_index.stop()
+    if async_db is not None:
+        await async_db.close()
+    pool.close()
+    for request_class in REQUEST_CLASSES.values():
+        request_class.shutdown()
+    await close_http_client()
+
 # --- Pydantic 模型 ---
 class ProductSearchRequest(BaseModel):
     limit: int = Field(1000, description="返回条数限制")
@@ -216,279 +411,98 @@ class ProductSearchRequest(BaseModel):
     
     model_config = ConfigDict(extra="allow") 
 
+def json_response(content: Any) -> Response:
+    """预编码的 JSON 响应 (跳过 FastAPI 默认的 jsonable_encoder 逐层转换)"""
+    return Response(content=dumps(content), media_type="application/json")
+
 def serialize_row(row: Dict) -> Dict:
     """清洗数据：Decimal -> float, Date -> str, 处理 URL 列表"""
-    new_row = {}
-    for k, v in row.items():
-        if isinstance(v, Decimal):
-            new_row[k] = float(v)
-        elif isinstance(v, (datetime.date, datetime.datetime)):
-            new_row[k] = str(v)
-        elif isinstance(v, bytes):
-            new_row[k] = v.decode('utf-8', errors='ignore')
-        elif k in ('image_urls', 'report_urls'):
-            # 处理 URL 列表（支持字符串和列表格式）
-            items = []
-            if isinstance(v, str) and v:
-                items = [item.strip().replace('`', '') for item in v.split(',') if item.strip()]
-            elif isinstance(v, list):
-                items = [str(item).strip().replace('`', '') for item in v]
-            
-            if k == 'image_urls':
-                # 再次确保图片列表中只有图片类型，过滤掉 PDF 等
-                IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
-                final_imgs = []
-                for item in items:
-                    path_part = item.split(':')[-1].split('?')[0].lower()
-                    if any(path_part.endswith(ext) for ext in IMAGE_EXTS):
-                        final_imgs.append(item)
-                    elif path_part.endswith('.pdf'):
-                        continue
-                    else:
-                        # 兜底：其他未知类型暂留
-                        final_imgs.append(item)
-                
-                # 图片字段根据数量返回字符串或列表
-                if not final_imgs:
-                    new_row[k] = []
-                else:
-                    new_row[k] = final_imgs if len(final_imgs) > 1 else final_imgs[0]
-            else:
-                # 报告字段统一返回列表
-                new_row[k] = items
-        else:
-            new_row[k] = v
-    return new_row
-
-def build_numeric_sql(column, query_str):
-    if not query_str: return None
-    clean_str = re.sub(r'[^\d\.\-<>=]', '', str(query_str))
-    range_match = re.match(r'^(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?)$', clean_str)
-    if range_match: return f"{column} BETWEEN {range_match.group(1)} AND {range_match.group(2)}"
-    compare_match = re.match(r'^(>=|<=|>|<|=)(\d+(?:\.\d+)?)$', clean_str)
-    if compare_match: return f"{column} {compare_match.group(1)} {compare_match.group(2)}"
-    return None
-
-def build_elem_sql_filter(query_str):
-    """
-    针对 elem 字段生成 SQL 粗筛条件 (LIKE)
-    逻辑：
-    1. 提取所有中文/英文成分名 (忽略数字和符号)
-    2. 如果含 '/' (OR关系)，SQL 用 OR 连接
-    3. 否则 (AND关系)，SQL 用 AND 连接
-    返回: (sql_clause, params)
-    """
-    if not query_str: return None, []
-    
-    # 提取关键词，例如 "棉>95%" -> ["棉"]
-    keywords = re.findall(r'[\u4e00-\u9fa5a-zA-Z]+', str(query_str))
-    if not keywords: return None, []
-    
-    conditions = []
-    params = []
-    for kw in keywords:
-        conditions.append("elem LIKE %s")
-        params.append(f"%{kw}%")
-    
-    if '/' in query_str:
-        # 或关系：(elem LIKE %s OR elem LIKE %s)
-        return f"({' OR '.join(conditions)})", params
-    else:
-        # 且关系：elem LIKE %s AND elem LIKE %s
-        return " AND ".join(conditions), params
-
-def build_text_sql_filter(column, query_val):
-    """
-    针对文本字段生成 SQL 过滤条件
-    支持: 
-    1. 字符串 (含 / 和 +)
-    2. 列表 (转为 IN 或 OR 处理)
-    返回: (sql_clause, params)
-    """
-    if not query_val: return None, []
-    
-    # 特殊处理列表格式
-    if isinstance(query_val, list):
-        if not query_val: return None, []
-        # 对于 code_start 或精确匹配字段，使用 IN 提高性能
-        if column == 'code_start':
-            placeholders = ", ".join(["%s"] * len(query_val))
-            return f"{column} IN ({placeholders})", [str(i) for i in query_val]
-        # 其他字段转为 OR 逻辑
-        query_val = "/".join(str(i) for i in query_val)
-    
-    val = str(query_val).strip()
-    if not val: return None, []
-
-    # 简单的单个词 (无 /、+ 和 ,)
-    if '/' not in val and '+' not in val and ',' not in val:
-        if column == 'code':
-            # 款号改回模糊匹配，以支持如 6228 和 6228A 等关联查询
-            param = val if '%' in val else f"%{val}%"
-            return f"{column} LIKE %s", [param]
-        elif column == 'code_start':
-            # code_start 依然保持精确匹配以保证性能
-            return f"{column} = %s", [val]
-        
-        param = val if '%' in val else f"%{val}%"
-        return f"{column} LIKE %s", [param]
-    
-    # 处理 OR 逻辑 (/)
-    if '/' in val and '+' not in val:
-        parts = [p.strip() for p in val.split('/') if p.strip()]
-        if not parts: return None, []
-        
-        if column == 'code_start':
-            # code_start 在 OR 逻辑下也应保持精确匹配
-            placeholders = ", ".join(["%s"] * len(parts))
-            return f"{column} IN ({placeholders})", parts
-            
-        clauses = [f"{column} LIKE %s" for _ in parts]
-        params = [p if '%' in p else f"%{p}%" for p in parts]
-        return f"({' OR '.join(clauses)})", params
-
-    # 处理 AND 逻辑 (+ 或 ,)
-    if ('+' in val or ',' in val) and '/' not in val:
-        parts = [p.strip() for p in re.split(r'[+,]', val) if p.strip()]
-        if not parts: return None, []
-        clauses = [f"{column} LIKE %s" for _ in parts]
-        params = [p if '%' in p else f"%{p}%" for p in parts]
-        return " AND ".join(clauses), params
-
-    # 复杂逻辑 (既有 / 又有 +) 暂时只在 SQL 层做部分过滤或跳过
-    return None, []
-
-def check_text_logic(target_text, query_str):
-    if not query_str: return True
-    # 处理列表格式，默认转为 OR 逻辑
-    if isinstance(query_str, list):
-        query_str = "/".join(str(i) for i in query_str)
-        
-    target_text = str(target_text or "").lower()
-    query_str = str(query_str).lower()
-    for group in query_str.split('/'):
-        # 同时支持 + 、 , 和 中文逗号 、 作为 AND 逻辑
-        if all(cond.strip() in target_text for cond in re.split(r'[+,，、]', group) if cond.strip()):
-            return True
-    return False
-
-def check_composition_logic(elem_str, logic_query):
-    if not logic_query: return True
-    elem_str_lower = str(elem_str or "").lower()
-    # 提取成分和比例，支持 "95%棉" 或 "棉95%" 格式
-    matches = re.findall(r'(\d+(?:\.\d+)?)%\s*([\u4e00-\u9fa5a-zA-Z]+)|([\u4e00-\u9fa5a-zA-Z]+)(\d+(?:\.\d+)?)%', elem_str_lower)
-    row_elems = {}
-    for m in matches:
-        if m[0] and m[1]: # 95%棉
-            row_elems[m[1]] = float(m[0])
-        elif m[2] and m[3]: # 棉95%
-            row_elems[m[2]] = float(m[3])
-
-    for group in str(logic_query).split('/'):
-        group_pass = True
-        for cond in group.split('+'):
-            cond = cond.strip().replace('%', '')
-            if not cond: continue
-            op_match = re.search(r'(>=|<=|>|<|=)([\d\.]+)', cond)
-            if op_match:
-                op, target_val = op_match.group(1), float(op_match.group(2))
-                name = cond.replace(op_match.group(0), '').strip().lower()
-                val = row_elems.get(name, 0)
-                if op == '>': match = val > target_val
-                elif op == '<': match = val < target_val
-                elif op == '>=': match = val >= target_val
-                elif op == '<=': match = val <= target_val
-                else: match = val == target_val
-            else:
-                # 如果没有操作符（如仅搜索 "棉"），只要关键词在解析出的成分中，或者直接在原始字符串中即可
-                cond_lower = cond.lower()
-                match = (cond_lower in row_elems) or (cond_lower in elem_str_lower)
-            if not match: group_pass = False; break
-        if group_pass: return True
-    return False
-
-def get_sort_score(row: Dict, search_code: str, soft_criteria: Dict[str, Any]) -> Tuple:
-    code = str(row.get('code', ''))
-    sales = float(row.get('sale_num_year') or 0)
-    
-    match_score = 10
-    if search_code:
-        clean_search = search_code.strip().replace('%', '')
-        if code == clean_search: match_score = 0
-        elif code.startswith(clean_search): match_score = 1
-        elif clean_search in code: match_score = 2
-
-    # 软指标评分：匹配到的关键词越多，分数越低（越靠前）
-    soft_match_count = 0
-    for key, query_val in soft_criteria.items():
-        if not query_val: continue
-        target_text = str(row.get(key, '') or "").lower()
-        
-        # 提取关键词列表
-        if isinstance(query_val, list):
-            keywords = [str(i) for i in query_val]
-        else:
-            keywords = re.split(r'[/,，、+]', str(query_val))
-            
-        for kw in keywords:
-            kw = kw.strip().lower()
-            if kw and kw in target_text:
-                soft_match_count += 1
-                
-    soft_score = 100 - soft_match_count
-
-    if code.startswith('6'): series_score = 1
-    elif code.startswith('9'): series_score = 2
-    elif code.startswith('9'): series_score = 3
-    elif code.startswith('3'): series_score = 4
-    elif code.startswith('2'): series_score = 5
-    else: series_score = 6
-    
-    return (match_score, soft_score, series_score, -sales)
+    return {k: convert_value(k, v) for k, v in row.items()}
+
+def make_sort_key(search_code: str, soft_criteria: Dict[str, Any]):
+    """生成综合排序函数：款号匹配度、软指标命中数、系列、年销量"""
+    clean_search = search_code.strip().replace('%', '') if search_code else ''
+    soft_terms = compile_soft_terms(soft_criteria)
+
+    def sort_key(row: Dict) -> Tuple:
+        code = str(row.get('code', ''))
+        sales = float(row.get('sale_num_year') or 0)
+
+        match_score = 10
+        if clean_search:
+            if code == clean_search: match_score = 0
+            elif code.startswith(clean_search): match_score = 1
+            elif clean_search in code: match_score = 2
+
+        # 软指标评分：匹配到的关键词越多，分数越低（越靠前）
+        soft_match_count = 0
+        for key, keywords in soft_terms:
+            target_text = str(row.get(key, '') or "").lower()
+            for kw in keywords:
+                if kw in target_text:
+                    soft_match_count += 1
+        soft_score = 100 - soft_match_count
+
+        return (match_score, soft_score, series_score(code), -sales)
+    return sort_key
 
 # --- 辅助函数 ---
 
-def process_material_images(rows: List[Dict], codes: List[str]):
-    """批量获取并合并素材图"""
-    if not codes:
-        return
-    
+async def fetch_material_images(codes: List[str]) -> Dict[str, List[str]]:
+    """素材图索引未就绪时回退到数据库查询，返回 款号 -> 素材图"""
     # 构造正则表达式，匹配包含任意一个款号的名称
     # 过滤掉空的款号，并对款号进行转义以防特殊字符干扰正则
     valid_codes = [re.escape(str(c)) for c in codes if str(c).strip()]
     if not valid_codes:
-        return
+        return {}
         
     # 将 REGEXP 改为多个 LIKE 条件，以兼容不支持正则的 MySQL 环境
     clauses = ["name LIKE %s" for _ in valid_codes]
     params = [f"%{c}%" for c in valid_codes]
     img_sql = f"SELECT name, pic_url FROM ai_source_app_v1 WHERE ({' OR '.join(clauses)}) AND file_type = 'image'"
     
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(img_sql, params)
-            img_rows = cursor.fetchall()
-        conn.close()
-        
-        # 将图片按款号归类
-        code_to_imgs = {}
-        for img_row in img_rows:
-            name = img_row.get('name', '')
-            pic_url = img_row.get('pic_url', '')
-            if not pic_url:
-                continue
-                
-            # 直接使用原始路径，前端会负责拼接域名
-            new_url = pic_url
-            formatted_img = f"素材:{new_url}"
+    img_rows = await db_fetchall(img_sql, params)
+    
+    # 将图片按款号归类
+    code_to_imgs = {}
+    for img_row in img_rows:
+        name = img_row.get('name', '')
+        pic_url = img_row.get('pic_url', '')
+        if not pic_url:
+            continue
             
-            # 检查这个图片属于哪个款号 (一个图片名可能匹配多个款号，虽然概率低)
-            for code in codes:
-                if str(code) in name:
-                    if code not in code_to_imgs:
-                        code_to_imgs[code] = []
-                    code_to_imgs[code].append(formatted_img)
+        # 直接使用原始路径，前端会负责拼接域名
+        new_url = pic_url
+        formatted_img = f"素材:{new_url}"
+        
+        # 检查这个图片属于哪个款号 (一个图片名可能匹配多个款号，虽然概率低)
+        for code in codes:
+            if str(code) in name:
+                if code not in code_to_imgs:
+                    code_to_imgs[code] = []
+                code_to_imgs[code].append(formatted_img)
+    return code_to_imgs
+
+async def process_material_images(rows: List[Dict], codes: List[str]):
+    """批量获取并合并素材图"""
+    if not codes:
+        return
+    
+    valid_codes = [str(c) for c in codes if str(c).strip()]
+    if not valid_codes:
+        return
+    
+    with stage('material_images', rows_in=len(rows)):
+        await merge_material_images(rows, valid_codes, codes)
+
+async def merge_material_images(rows: List[Dict], valid_codes: List[str], codes: List[str]):
+    """获取素材图并合并到行中 (图片字段只保留图片，PDF 移至报告)"""
+    try:
+        # 索引就绪时直接查字典，不访问数据库
+        if material_index.ready:
+            code_to_imgs = material_index.lookup(valid_codes)
+        else:
+            code_to_imgs = await fetch_material_images(codes)
         
         # 合并到原始行中
         for row in rows:
@@ -559,20 +573,50 @@ def organize_detail_by_categories(data: Dict[str, Any]) -> Dict[str, Any]:
 
 # --- API 接口 ---
 
-def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
-    """执行单条搜索逻辑"""
+MODE1_FILTERS = [
+    ColumnFilter('code_start', 'in', ('6', '9', '3')),
+    ColumnFilter('type_notes', 'in', ('现货', '订单', '订单主推')),
+    # 克重为空或为 0 的款不参与筛选
+    ColumnFilter('weight', 'compare', ('>', '0')),
+]
+
+PRICE_RELATED_FIELDS = {
+    'price', 'taxkgprice', 'taxmprice', 'fewprice', 
+    'mprice', 'yprice', 'kgprice', 'taxyprice', 
+    'gkgprice', 'gtaxkgprice'
+}
+
+def build_order_by(sort_field: Optional[str], sort_reverse: bool, positive_only: bool,
+                   search_code: str, soft_query: Dict[str, Any], required_fields) -> Optional[str]:
+    """
+    生成与 Python 排序等价的 ORDER BY，无法等价表达时返回 None
+    1. 指定 sort_by：仅限数值字段；空值按 0 处理，价格排序时非正值排在最后 (随后在 Python 中剔除)
+    2. 默认排序：无款号搜索与软指标时，综合评分退化为 (系列, -年销量)
+    排序键相同时按款号先后 (与 rank_rows 及快照一致)
+    """
+    if sort_field:
+        if sort_field not in NUMERIC_FIELDS or sort_field not in required_fields:
+            return None
+        direction = "DESC" if sort_reverse else "ASC"
+        if positive_only:
+            return f"({sort_field} > 0) DESC, {sort_field} {direction}, code"
+        return f"COALESCE({sort_field}, 0) {direction}, code"
+    if search_code or soft_query:
+        return None
+    series_case = " ".join(f"WHEN '{prefix}' THEN {score}" for prefix, score in SERIES_SCORES.items())
+    return f"CASE SUBSTRING(code, 1, 1) {series_case} ELSE {DEFAULT_SERIES_SCORE} END, COALESCE(sale_num_year, 0) DESC, code"
+
+def compile_query_plan(query: Dict[str, Any]) -> QueryPlan:
+    """把单条查询编译为 QueryPlan"""
     # 1. 解析参数
-    # 不再使用 pop，避免修改原始字典
-    title = query.get('title')
     limit_val = query.get('limit', 100)
     limit = int(limit_val) if limit_val and str(limit_val).isdigit() else 100
-    # 强制限制最大返回条数为 5000
+    # 强制限制最大返回条数为 100
     if limit > 100:
         limit = 100
     
     # 兼容 sort 和 sort_by
-    user_sort = query.get('sort', query.get('sort_by'))
-    if not user_sort: user_sort = None
+    user_sort = resolve_sort(query)
     
     requested_fields = query.get('fields', DEFAULT_RETURN_FIELDS)
     if not requested_fields:
@@ -584,8 +628,8 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
     # 2. 分离软硬指标
     strict_query = {}
     soft_query = {}
-    # 定义需要排除的元数据字段，避免它们进入 strict_query 干扰（虽然逻辑上会自动跳过，但排除更清晰）
-    metadata_fields = {'title', 'limit', 'sort', 'sort_by', 'fields', 'mode'}
+    # 定义需要排除的元数据字段，避免它们进入 strict_query 干扰
+    metadata_fields = {'title', 'limit', 'sort', 'sort_by', 'fields', 'mode', 'cursor'}
     
     for k, v in query.items():
         if v is None or k in metadata_fields: continue
@@ -593,11 +637,9 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         else: strict_query[k] = v
             
     search_code_val = strict_query.get('code', '')
-    mode = query.get('mode', 1)
-    if mode is None:
-        mode = 1
+    mode = resolve_mode(query)
 
-    # 3. SQL 构造
+    # 3. 过滤条件
     # 只选择必要的字段：过滤字段 + 返回字段 + 排序/逻辑字段
     required_fields = set(requested_fields) | {'code', 'sale_num_year', 'elem', 'weight'}
     # 添加查询中涉及的字段
@@ -605,153 +647,509 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         if k in NUMERIC_FIELDS or k in STRICT_TEXT_FIELDS or k in SOFT_FIELDS:
             required_fields.add(k)
     
-    fields_sql = ", ".join(required_fields)
-    sql_template = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE 1=1"
-    
-    # A. 模式过滤 (mode=1 时仅筛选 6/9/3 开头的款号，且运营分类为 现货/订单/订单主推)
-    if str(mode) == '1':
-        sql_template += " AND (code_start in ('6', '9', '3')) AND (type_notes in ('现货', '订单', '订单主推'))"
-    elif str(mode) == '2':
-        # 如果有 mode=2 的逻辑，可以在此添加
-        pass
-    
-    params = []
+    filters: List[ColumnFilter] = []
+    predicates = []
 
-    # A. 数值字段 SQL
+    # A. 模式过滤 (mode=1 时仅筛选 6/9/3 开头且克重不为空的款号，且运营分类为 现货/订单/订单主推)
+    if mode == '1':
+        filters.extend(MODE1_FILTERS)
+
+    # B. 数值字段
     for key, val in strict_query.items():
         if key in NUMERIC_FIELDS:
-            clause = build_numeric_sql(key, val)
-            if clause: sql_template += f" AND {clause}"
+            f = parse_numeric_filter(key, val)
+            if f: filters.append(f)
     
-    # B. 文本字段 SQL (包含 code, name, fabric_structure_two 等)
-    sql_filtered_fields = set()
-    for key in STRICT_TEXT_FIELDS:
-        if key == 'elem': continue
-        val = strict_query.get(key)
-        if not val: continue
-        
-        clause, c_params = build_text_sql_filter(key, val)
-        if clause:
-            sql_template += f" AND {clause}"
-            params.extend(c_params)
-            sql_filtered_fields.add(key)
+    # C. 文本字段 (包含 code, name, fabric_structure_two 等)，SQL 无法表达的复杂逻辑交给 Python 精细筛选
+    for key, val in strict_query.items():
+        if key not in STRICT_TEXT_FIELDS or not val: continue
+        f = parse_text_filter(key, val)
+        if f:
+            filters.append(f)
+        elif key not in NUMERIC_FIELDS:
+            predicates.append((key, compile_text_predicate(key, val)))
     
-    # C. 成分字段 SQL 粗筛
-    if 'elem' in strict_query and strict_query['elem']:
-        elem_clause, elem_params = build_elem_sql_filter(strict_query['elem'])
-        if elem_clause:
-            sql_template += f" AND {elem_clause}"
-            params.extend(elem_params)
-
-    sql_template += " LIMIT 5000"
-
-    # 4. 执行查询
-    try:
-        logger.info(f"Executing SQL: {sql_template} with params: {params}")
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql_template, params)
-            rows = cursor.fetchall()
-        conn.close()
-        logger.info(f"SQL returned {len(rows)} rows")
-    except Exception as e:
-        result = {
-            "total": 0, 
-            "list": [], 
-            "error": f"Database Error: {str(e)}"
-        }
-        return result
-
-    # 5. Python 筛选 (精细逻辑)
-    filtered_rows = []
-    for row in rows:
-        # 筛选时，克重为空的需要过滤 (如果是在 mode=1 模式下)
-        if str(mode) == '1':
-            weight_val = row.get('weight')
-            if weight_val is None or str(weight_val).strip() == '' or float(weight_val or 0) <= 0:
-                continue
-
-        match = True
-        for key, val in strict_query.items():
-            if key in NUMERIC_FIELDS: continue
-            if key in sql_filtered_fields: continue # SQL 已完全过滤
-            
-            # 成分精细筛选 (>95% 等逻辑在此处理)
-            if key == 'elem':
-                if not check_composition_logic(row.get('elem'), val): match = False; break
-            elif key in STRICT_TEXT_FIELDS:
-                # 兼容列表格式
-                if isinstance(val, list):
-                    val = "/".join(str(i) for i in val)
-                if not check_text_logic(row.get(key), val): match = False; break
-        
-        if match:
-            filtered_rows.append(row)
-
-    # 6. 计算总数
-    total_count = len(filtered_rows)
-
-    # 7. 排序与截断
+    # D. 成分字段：SQL 粗筛 + 比例精细筛选
+    if strict_query.get('elem'):
+        f = parse_elem_filter(strict_query['elem'])
+        if f: filters.append(f)
+        predicates.append(('elem', compile_elem_predicate(strict_query['elem'])))
+
+    # 4. SQL 渲染
+    fields_sql = ", ".join(sorted(required_fields))
+    base_sql = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE 1=1"
+    params = []
+    for f in filters:
+        clause, c_params = f.sql()
+        base_sql += f" AND {clause}"
+        params.extend(c_params)
+    sql_template = base_sql + " LIMIT 5000"
+
+    # 5. 排序 (处理类似 "price ASC" 的情况)
+    sort_field = None
+    sort_reverse = True
     if user_sort:
-        # 处理类似 "price ASC" 的情况
         sort_parts = str(user_sort).strip().split()
         sort_field = sort_parts[0]
-        reverse_order = True
         if len(sort_parts) > 1 and sort_parts[1].upper() == 'ASC':
-            reverse_order = False
-            
+            sort_reverse = False
+    # 如果是价格相关字段排序，过滤掉价格为空或为 0 的记录
+    sort_positive_only = sort_field in PRICE_RELATED_FIELDS
+
+    # 6. 排序与分页下推：没有 Python 精细筛选条件且排序可由 SQL 等价表达时，数据库只返回当前页
+    # (多取一行，用于判断是否还有更多结果)
+    pushdown_sql = None
+    if not predicates:
+        order_by = build_order_by(sort_field, sort_reverse, sort_positive_only,
+                                  search_code_val, soft_query, required_fields)
+        if order_by:
+            pushdown_sql = f"{base_sql} ORDER BY {order_by} LIMIT {limit + 1}"
+
+    return QueryPlan(
+        limit=limit,
+        mode=mode,
+        requested_fields=list(requested_fields),
+        required_fields=sorted(required_fields),
+        strict_query=strict_query,
+        soft_query=soft_query,
+        search_code=str(search_code_val),
+        filters=filters,
+        sql=sql_template,
+        pushdown_sql=pushdown_sql,
+        params=params,
+        predicates=predicates,
+        sort_field=sort_field,
+        sort_reverse=sort_reverse,
+        sort_positive_only=sort_positive_only,
+        sort_key=make_sort_key(str(search_code_val), soft_query),
+        soft_terms=compile_soft_terms(soft_query)
+    )
+
+QUERY_PLAN_CACHE_SIZE = int(os.getenv('QUERY_PLAN_CACHE_SIZE', 512))
+query_plan_cache = PlanCache(compile_query_plan, maxsize=QUERY_PLAN_CACHE_SIZE)
+
+def get_plan(query: Dict[str, Any]) -> QueryPlan:
+    """获取 (或编译) 查询计划"""
+    with stage('plan'):
+        return query_plan_cache.get(query)
+
+# --- 搜索结果缓存 ---
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 60))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+result_cache = SearchResultCache(ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+# 目录快照更新后，旧结果全部失效
+catalog_engine.on_refresh(lambda snapshot: result_cache.invalidate())
+
+# 同时进行中的等价查询 (归一化后相同) 只执行一次
+search_flight = SingleFlight("search")
+
+async def cached_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
+    """带结果缓存的单条搜索，等价查询直接返回缓存结果，或等待进行中的等价查询"""
+    key = canonical_key(query)
+    result = result_cache.get(key)
+    if result is not None:
+        return result
+
+    async def compute():
+        result = await perform_single_search(query)
+        # 出错的结果不缓存
+        if not result.get("error"):
+            result_cache.set(key, result)
+        return result
+
+    return await search_flight.do(key, compute)
+
+def rank_rows(rows: List[Dict], plan: QueryPlan) -> List[Dict]:
+    """对已筛选的行排序并截取前 limit 条 (有界 Top-K，结果与全量排序后截断一致)"""
+    # 数据库返回顺序不确定，先按款号排列，使排序键相同的行顺序稳定
+    rows = by_code(rows)
+    if plan.sort_field:
+        sort_field = plan.sort_field
         # 如果是价格相关字段排序，过滤掉价格为空或为 0 的记录
-        price_related_fields = {
-            'price', 'taxkgprice', 'taxmprice', 'fewprice', 
-            'mprice', 'yprice', 'kgprice', 'taxyprice', 
-            'gkgprice', 'gtaxkgprice'
-        }
-        if sort_field in price_related_fields:
-            filtered_rows = [
-                r for r in filtered_rows 
+        if plan.sort_positive_only:
+            rows = [
+                r for r in rows 
                 if r.get(sort_field) and float(r.get(sort_field)) > 0
             ]
-            
         try:
-            filtered_rows.sort(key=lambda r: float(r.get(sort_field) or 0), reverse=reverse_order)
+            return top_k_rows(rows, plan.limit, key=lambda r: float(r.get(sort_field) or 0), reverse=plan.sort_reverse)
         except:
-            filtered_rows.sort(key=lambda r: str(r.get(sort_field) or ''), reverse=reverse_order)
+            return top_k_rows(rows, plan.limit, key=lambda r: str(r.get(sort_field) or ''), reverse=plan.sort_reverse)
+    return top_k_rows(rows, plan.limit, key=plan.sort_key)
+
+def rank_snapshot(snapshot, indices, plan: QueryPlan,
+                  after: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], int, Optional[Dict[str, Any]]]:
+    """
+    在快照上排序并截取前 limit 条，静态分量已预计算，仅物化最终返回的行
+    after 为上一页最后一行的排序位置 (续页)；返回 (行, 参与排序的行数, 本页最后一行的位置 (没有更多结果时为 None))
+    """
+    sort_field = plan.sort_field
+    if not sort_field:
+        keys = default_keys(snapshot, indices, plan.search_code, plan.soft_terms)
+    elif sort_field in snapshot.sortable and sort_field in plan.required_fields:
+        values = snapshot.numbers[sort_field]
+        if plan.sort_positive_only:
+            indices = indices[values[indices] > 0]
+        keys = numeric_keys(values, indices, plan.sort_reverse)
     else:
-        filtered_rows.sort(key=lambda r: get_sort_score(r, str(search_code_val), soft_query))
+        # 非数值列排序走通用逻辑 (不支持续页)
+        if after is not None:
+            raise CursorError(f"Cursor pagination is not supported when sorting by {sort_field}")
+        return rank_rows(snapshot.rows(indices, plan.required_fields), plan), len(indices), None
+
+    if after is not None:
+        mask = after_position(keys, indices, after['k'], after['i'])
+        indices, keys = indices[mask], keys[mask]
+    order = top_k_order(keys, plan.limit)
+    ordered = indices[order]
+    last = None
+    if len(indices) > len(ordered) > 0:
+        last = {"v": snapshot.version, "k": keys[order[-1]].item(), "i": int(ordered[-1])}
+    return snapshot.rows(ordered, plan.required_fields), len(indices), last
+
+def search_snapshot(snapshot, plan: QueryPlan,
+                    after: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], int, Optional[Dict[str, Any]]]:
+    """在内存快照上筛选、排序，返回 (截断后的行, 总数, 续页位置)；续页时总数为该位置之后的行数"""
+    if after is not None and after.get('v') != snapshot.version:
+        raise CursorError("Cursor expired, catalog has been refreshed")
+
+    # 快照上已精确求值的字段 (如成分索引) 无需再做 Python 精细筛选
+    with stage('snapshot_filter', rows_in=snapshot.size) as s:
+        indices, resolved_fields = catalog_engine.search(snapshot, plan)
+        s.rows_out = len(indices)
+    logger.info(f"Catalog snapshot v{snapshot.version} returned {len(indices)} rows")
+
+    # Python 筛选 (仅剩快照无法表达的条件时才物化行)
+    if plan.has_predicates(resolved_fields):
+        with stage('python_filter', rows_in=len(indices)) as s:
+            row_filter = plan.row_filter(resolved_fields)
+            rows = snapshot.rows(indices, plan.required_fields)
+            indices = indices[[i for i, row in enumerate(rows) if row_filter(row)]]
+            s.rows_out = len(indices)
+
+    with stage('rank', rows_in=len(indices)) as s:
+        final_rows, remaining, last = rank_snapshot(snapshot, indices, plan, after)
+        s.rows_out = len(final_rows)
+    return final_rows, remaining if after is not None else len(indices), last
+
+async def fetch_plan_rows(plan: QueryPlan,
+                          after: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], int, Optional[Dict[str, Any]]]:
+    """按查询计划筛选、排序，返回 (截断后的行, 总数, 续页位置)；数据库异常向上抛出"""
+    # 内存快照可用时直接在快照上筛选，否则回退到数据库
+    snapshot = catalog_engine.current()
+    if snapshot is not None and snapshot.has_fields(plan.required_fields):
+        # 快照筛选与排序是纯 CPU 计算，放到线程池执行，避免阻塞事件循环
+        return await run_blocking(search_snapshot, snapshot, plan, after)
+    # 续页位置基于快照行号，快照不可用时无法续页
+    if after is not None:
+        raise CursorError("Cursor expired, catalog snapshot is not available")
+
+    # 可下推时数据库已完成排序并只返回当前页
+    sql = plan.pushdown_sql or plan.sql
+    log_sql("search_sql", sql, plan.params)
+    with stage('sql') as s:
+        rows = await db_fetchall(sql, plan.params)
+        s.rows_out = len(rows)
+    logger.info(f"SQL returned {len(rows)} rows")
+
+    # Python 筛选 (精细逻辑)
+    with stage('python_filter', rows_in=len(rows)) as s:
+        row_filter = plan.row_filter()
+        filtered_rows = [row for row in rows if row_filter(row)]
+        s.rows_out = len(filtered_rows)
+
+    # 排序与截断
+    with stage('rank', rows_in=len(filtered_rows)) as s:
+        final_rows = rank_rows(filtered_rows, plan)
+        s.rows_out = len(final_rows)
+    return final_rows, len(filtered_rows), None
+
+def page_fingerprint(query: Dict[str, Any]) -> str:
+    """续页游标绑定的查询指纹 (不含游标本身与每页条数)"""
+    return query_fingerprint(canonical_query({k: v for k, v in query.items() if k not in ('cursor', 'limit')}))
+
+def decode_page_cursor(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """解析查询中的续页游标，返回上一页最后一行的排序位置"""
+    if not query.get('cursor'):
+        return None
+    return decode_cursor(query['cursor'], page_fingerprint(query))
+
+def search_error(e: Exception) -> Dict[str, Any]:
+    if isinstance(e, CursorError):
+        return {"total": 0, "list": [], "error": str(e)}
+    return {"total": 0, "list": [], "error": f"Database Error: {str(e)}"}
+
+def build_search_result(plan: QueryPlan, final_rows: List[Dict], total_count: int,
+                        next_cursor: Optional[str] = None) -> Dict[str, Any]:
+    """序列化并按请求字段裁剪"""
+    # 仅保留请求的字段，保持英文键名；限制列表中的图片和报告数量，防止 JSON 过大导致 LLM 输出截断
+    with stage('serialize', rows_in=len(final_rows)):
+        cleaned_rows = serialize_rows(final_rows, plan.requested_fields, max_items=3)
 
-    # 8. 分页
-    final_rows = filtered_rows[:limit]
-    
-    # 9. 批量获取素材图 (如果请求了 image_urls)
-    if 'image_urls' in requested_fields:
+    result = {
+        "total": min(total_count, plan.limit),
+        "list": cleaned_rows
+    }
+    # 还有更多结果时返回续页游标；无法续页时 (数据库路径、不支持续页的排序) 明确标记，避免被当作最后一页
+    if next_cursor:
+        result["next_cursor"] = next_cursor
+    elif len(final_rows) >= plan.limit and total_count > len(final_rows):
+        result["cursor_unsupported"] = True
+    return result
+
+async def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
+    """执行单条搜索逻辑"""
+    # 1. 获取 (或编译) 查询计划
+    plan = get_plan(query)
+
+    # 2-5. 筛选、计数、排序与截断 (带游标时从上一页最后一行之后继续)
+    try:
+        after = decode_page_cursor(query)
+        final_rows, total_count, last = await fetch_plan_rows(plan, after)
+    except Exception as e:
+        return search_error(e)
+
+    # 6. 批量获取素材图 (如果请求了 image_urls)
+    if 'image_urls' in plan.requested_fields:
         final_codes = [str(r.get('code', '')) for r in final_rows if r.get('code')]
-        process_material_images(final_rows, final_codes)
-
-    # 10. 构建结果
-    cleaned_rows = []
-    for row in final_rows:
-        serialized = serialize_row(row)
-        # 仅保留请求的字段，保持英文键名
-        filtered_row = {k: v for k, v in serialized.items() if k in requested_fields}
-        
-        # 限制列表中的图片和报告数量，防止 JSON 过大导致 LLM 输出截断
-        if 'image_urls' in filtered_row and isinstance(filtered_row['image_urls'], list):
-            filtered_row['image_urls'] = filtered_row['image_urls'][:3]
-        if 'report_urls' in filtered_row and isinstance(filtered_row['report_urls'], list):
-            filtered_row['report_urls'] = filtered_row['report_urls'][:3]
-            
-        cleaned_rows.append(filtered_row)
+        await process_material_images(final_rows, final_codes)
+
+    # 7. 构建结果
+    next_cursor = encode_cursor(page_fingerprint(query), **last) if last else None
+    return build_search_result(plan, final_rows, total_count, next_cursor)
+
+# --- 批量查询 (tool_call 列表) ---
+# 同一批次中共享过滤条件的子查询只查询一次数据库 (候选超集)，再在内存中按子查询分别筛选、排序
+BATCH_SUPERSET_LIMIT = int(os.getenv('BATCH_SUPERSET_LIMIT', 20000))
+
+def partition_superset(rows: List[Dict], fields: List[str], plans: List[QueryPlan]) -> List[Tuple]:
+    """把候选超集构建为临时快照，在其上逐个执行子查询计划"""
+    snapshot = CatalogSnapshot(rows, fields, NUMERIC_FIELDS, version=0)
+    # 临时快照上的行号不能作为续页位置
+    return [search_snapshot(snapshot, plan)[:2] + (None,) for plan in plans]
+
+async def fetch_group_rows(plans: List[QueryPlan], shared_filters: List[ColumnFilter]) -> List[Tuple]:
+    """
+    一组共享过滤条件的子查询：按共享条件取一次候选超集，再分区执行
+    超集超过 BATCH_SUPERSET_LIMIT 或查询失败时回退为逐条查询
+    """
+    fields = set()
+    for plan in plans:
+        fields.update(plan.required_fields)
+        fields.update(f.column for f in plan.filters)
+    fields = sorted(fields)
 
+    sql = f"SELECT {', '.join(fields)} FROM ai_product_app_v1 WHERE 1=1"
+    params = []
+    for f in shared_filters:
+        clause, c_params = f.sql()
+        sql += f" AND {clause}"
+        params.extend(c_params)
+    sql += f" LIMIT {BATCH_SUPERSET_LIMIT + 1}"
+
+    try:
+        log_sql("shared_sql", sql, params, queries=len(plans))
+        with stage('shared_sql') as s:
+            rows = await db_fetchall(sql, params)
+            s.rows_out = len(rows)
+        logger.info(f"Shared SQL returned {len(rows)} rows")
+    except Exception as e:
+        logger.error(f"Shared SQL failed, falling back to per-query SQL: {e}")
+        rows = None
+    if rows is not None and len(rows) <= BATCH_SUPERSET_LIMIT:
+        try:
+            with stage('partition', rows_in=len(rows)):
+                return await run_blocking(partition_superset, rows, fields, plans)
+        except Exception as e:
+            logger.error(f"Partitioning shared rows failed, falling back to per-query SQL: {e}")
+    return await asyncio.gather(*[fetch_plan_rows(plan) for plan in plans], return_exceptions=True)
+
+async def finish_batch_unit(plans: List[QueryPlan], fingerprints: List[str], selected: List[Any]) -> List[Dict[str, Any]]:
+    """一组子查询的筛选结果：一次获取素材图后构建结果"""
+    image_rows, image_codes = [], []
+    for plan, item in zip(plans, selected):
+        if isinstance(item, Exception) or 'image_urls' not in plan.requested_fields: continue
+        image_rows.extend(item[0])
+        image_codes.extend(str(r.get('code', '')) for r in item[0] if r.get('code'))
+    if image_rows:
+        await process_material_images(image_rows, list(dict.fromkeys(image_codes)))
+
+    results = []
+    for plan, fingerprint, item in zip(plans, fingerprints, selected):
+        if isinstance(item, Exception):
+            results.append(search_error(item))
+            continue
+        final_rows, total_count, last = item
+        next_cursor = encode_cursor(fingerprint, **last) if last else None
+        results.append(build_search_result(plan, final_rows, total_count, next_cursor))
+    return results
+
+async def iter_batch_search(queries: List[Dict[str, Any]],
+                            incremental: bool = True) -> AsyncIterator[Tuple[List[int], Dict[str, Any]]]:
+    """
+    批量执行子查询，产出 (原始下标列表, 结果)，结果与逐条调用 cached_single_search 一致：
+    1. 等价子查询 (归一化后相同) 只执行一次，已缓存的立即产出，其他请求正在执行的等待其结果
+    2. 快照可用时每个子查询在快照上独立执行；否则共享过滤条件的子查询合并为一次候选超集查询
+    3. incremental 为真时每完成一个 (或一组) 子查询就获取素材图并产出；否则全部完成后整批只获取一次素材图
+    """
+    # 1. 去重
+    positions: Dict[str, List[int]] = {}
+    cached_items = []
+    pending: Dict[str, Dict[str, Any]] = {}
+    joined = []
+    for i, q in enumerate(queries):
+        positions.setdefault(canonical_key(q), []).append(i)
+    for key, indexes in positions.items():
+        cached = result_cache.get(key)
+        if cached is not None:
+            cached_items.append((indexes, cached))
+        elif search_flight.in_flight(key):
+            joined.append(join_search(indexes, queries[indexes[0]]))
+        else:
+            pending[key] = queries[indexes[0]]
+    # 登记为其余查询的执行者 (与上面的检查之间没有 await)，同时到达的等价查询等待本批次的结果
+    flights = {key: search_flight.lead(key) for key in pending}
+    try:
+        for item in cached_items:
+            yield item
+        if pending or joined:
+            async for item in run_pending_queries(pending, positions, flights, joined, incremental):
+                yield item
+    finally:
+        # 未完成 (出错或流被中断) 的查询：等待者改为自行执行
+        for key, future in flights.items():
+            search_flight.abandon(key, future)
+
+async def join_search(indexes: List[int], query: Dict[str, Any]) -> List[Tuple[List[int], Dict[str, Any]]]:
+    """等待其他请求正在执行的等价查询"""
+    return [(indexes, await cached_single_search(query))]
+
+async def run_pending_queries(pending: Dict[str, Dict[str, Any]], positions: Dict[str, List[int]],
+                              flights: Dict[str, asyncio.Future], joined: List[Awaitable],
+                              incremental: bool) -> AsyncIterator[Tuple[List[int], Dict[str, Any]]]:
+    """执行未缓存的子查询 (iter_batch_search 的 2、3 步)，完成后 resolve 对应的进行中登记"""
+    keys = list(pending)
+    plans = [get_plan(q) for q in pending.values()]
+    fingerprints = [page_fingerprint(q) for q in pending.values()]
+
+    async def run_unit(members: List[int], fetch) -> Tuple[List[int], List[Any]]:
+        return members, await fetch
+
+    async def failed(error: Exception) -> List[Any]:
+        return [error]
+
+    async def finish(members: List[int], selected: List[Any]):
+        results = await finish_batch_unit([plans[m] for m in members], [fingerprints[m] for m in members], selected)
+        for m, result in zip(members, results):
+            # 出错的结果不缓存
+            if not result.get("error"):
+                result_cache.set(keys[m], result)
+            search_flight.resolve(keys[m], flights[keys[m]], result)
+        return [(positions[keys[m]], r) for m, r in zip(members, results)]
+
+    async def finish_unit(unit) -> List[Tuple[List[int], Dict[str, Any]]]:
+        return await finish(*await unit)
+
+    # 2. 快照可用的子查询各自执行；其余按共享过滤条件分组查询数据库
+    units = []
+    snapshot = catalog_engine.current()
+    sql_ids = []
+    for i, (plan, q) in enumerate(zip(plans, pending.values())):
+        try:
+            after = decode_page_cursor(q)
+        except CursorError as e:
+            units.append(run_unit([i], failed(e)))
+            continue
+        if snapshot is not None and snapshot.has_fields(plan.required_fields):
+            fetch = asyncio.gather(run_blocking(search_snapshot, snapshot, plan, after), return_exceptions=True)
+            units.append(run_unit([i], fetch))
+        elif after is not None:
+            # 续页位置基于快照行号，快照不可用时无法续页
+            units.append(run_unit([i], failed(CursorError("Cursor expired, catalog snapshot is not available"))))
+        else:
+            sql_ids.append(i)
+    if sql_ids:
+        groups = group_by_shared_filters([plans[i] for i in sql_ids], ignored=frozenset(MODE1_FILTERS))
+        for members, shared_filters in groups:
+            members = [sql_ids[m] for m in members]
+            group_plans = [plans[m] for m in members]
+            if len(group_plans) == 1:
+                fetch = asyncio.gather(fetch_plan_rows(group_plans[0]), return_exceptions=True)
+            else:
+                fetch = fetch_group_rows(group_plans, shared_filters)
+            units.append(run_unit(members, fetch))
+
+    # 3. 获取素材图、写入缓存并产出 (等待中的等价查询一并产出)
+    if incremental:
+        for items in asyncio.as_completed([finish_unit(unit) for unit in units] + joined):
+            for item in await items:
+                yield item
+    else:
+        all_members, all_selected = [], []
+        for members, selected in await asyncio.gather(*units):
+            all_members.extend(members)
+            all_selected.extend(selected)
+        for item in await finish(all_members, all_selected):
+            yield item
+        for items in await asyncio.gather(*joined):
+            for item in items:
+                yield item
+
+async def perform_batch_search(queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """批量执行子查询，按输入顺序返回结果"""
+    results: List[Any] = [None] * len(queries)
+    async for indexes, result in iter_batch_search(queries, incremental=False):
+        for i in indexes:
+            results[i] = result
+    return results
+
+def format_search_result(q: Any, search_res: Dict[str, Any]) -> Dict[str, Any]:
+    # 即使 q 不是字典，也返回一个基础结构以保持数组长度一致
+    if not isinstance(q, dict):
+        return {
+            "title": "",
+            "query": {},
+            "total": 0,
+            "list": []
+        }
+    # 始终返回结果结构，即使 total 为 0
     result = {
-        "total": min(total_count, limit),
-        "list": cleaned_rows
+        "title": q.get("title", ""),
+        "query": translate_dict_keys(q),
+        "total": search_res.get("total", 0),
+        "list": search_res.get("list", [])
     }
+    if search_res.get("next_cursor"):
+        result["next_cursor"] = search_res["next_cursor"]
+    if search_res.get("cursor_unsupported"):
+        result["cursor_unsupported"] = True
+    # 游标过期 / 不匹配等错误需要透传，否则调用方会把空结果当作最后一页
+    if search_res.get("error"):
+        result["error"] = search_res["error"]
     return result
 
+async def stream_search_results(queries: List[Any]) -> AsyncIterator[bytes]:
+    """NDJSON 流：每个子查询完成后立即输出一行，index 为其在请求中的原始位置"""
+    search_ids = [i for i, q in enumerate(queries) if isinstance(q, dict)]
+    for i, q in enumerate(queries):
+        if not isinstance(q, dict):
+            yield dumps({"index": i, **format_search_result(q, {})}) + b"\n"
+    async for indexes, search_res in iter_batch_search([queries[i] for i in search_ids]):
+        for j in indexes:
+            i = search_ids[j]
+            yield dumps({"index": i, **format_search_result(queries[i], search_res)}) + b"\n"
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    """流式输出开关：?stream=true、X-Stream: true 或 Accept: application/x-ndjson"""
+    if stream or request.headers.get('x-stream', '').lower() in ('1', 'true'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('accept', '')
+
 @app.post("/api/product_search")
-async def product_search(request_data: Any = Body(...)):
+async def product_search(request: Request, request_data: Any = Body(...), stream: bool = False):
     # 1. 参数归一化：统一转为列表处理
-    logger.info(f"\n Received request_data: {json.dumps(request_data, ensure_ascii=False)} \n")
+    log_payload("product_search", request_data)
     queries = []
     is_list_input = isinstance(request_data, list)
     
@@ -794,36 +1192,19 @@ async def product_search(request_data: Any = Body(...)):
     else:
         return {"error": "Invalid request format", "title": "", "query": {}, "total": 0, "list": []}
 
-    # 2. 逐条执行查询并合并结果 (并行执行)
-    async def process_query(q):
-        # 即使 q 不是字典，也返回一个基础结构以保持数组长度一致
-        if not isinstance(q, dict):
-            return {
-                "title": "",
-                "query": {},
-                "total": 0,
-                "list": []
-            }
-        
-        # 使用 run_in_threadpool 执行同步的数据库查询逻辑，避免阻塞事件循环
-        search_res = await run_in_threadpool(perform_single_search, q)
-        
-        # 始终返回结果结构，即使 total 为 0
-        return {
-            "title": q.get("title", ""),
-            "query": translate_dict_keys(q),
-            "total": search_res.get("total", 0),
-            "list": search_res.get("list", [])
-        }
+    # 流式模式：每个子查询完成后立即输出一行 NDJSON
+    if wants_stream(request, stream):
+        return StreamingResponse(stream_search_results(queries), media_type="application/x-ndjson")
 
-    # 并行处理所有查询
-    tasks = [process_query(q) for q in queries]
-    results = await asyncio.gather(*tasks)
+    # 2. 批量执行查询 (去重、共享扫描) 并合并结果
+    search_results = await perform_batch_search([q for q in queries if isinstance(q, dict)])
+    search_iter = iter(search_results)
+    results = [format_search_result(q, next(search_iter) if isinstance(q, dict) else {}) for q in queries]
     
     # 3. 兼容返回格式
     if not is_list_input:
         if results:
-            return results[0]
+            return json_response(results[0])
         # 如果 queries 为空（极少发生），返回默认空对象
         return {
             "title": "",
@@ -833,7 +1214,142 @@ async def product_search(request_data: Any = Body(...)):
         }
     else:
         # 如果是列表输入，直接返回所有处理后的结果（包含空结果）
-        return results
+        return json_response(results)
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """查看结果缓存与查询计划缓存的命中情况"""
+    return {
+        "result_cache": result_cache.stats(),
+        "query_plan_cache": query_plan_cache.stats(),
+        "detail_cache": detail_cache.stats(),
+        "catalog": catalog_engine.stats(),
+        "material_image_index": material_index.stats(),
+        "admission": {name: c.stats() for name, c in REQUEST_CLASSES.items()},
+        "singleflight": {f.name: f.stats() for f in (search_flight, detail_flight, source_flight)},
+        "db_pool": {**pool_stats(), "wait": {labels[0]: s for labels, s in POOL_WAIT_SECONDS.snapshot().items()}},
+        "logging": logging_stats(),
+        "stages": stage_summary()
+    }
+
+@app.post("/api/cache/invalidate")
+async def cache_invalidate():
+    """显式清空搜索结果缓存 (如后台修改了产品数据)"""
+    removed = result_cache.invalidate()
+    return {"success": True, "removed": removed}
+
+# --- 指标 ---
+REGISTRY.add_collector(cache_collector({
+    "result": result_cache.stats,
+    "query_plan": query_plan_cache.stats,
+    "detail": lambda: detail_cache.stats(),
+}))
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {"sync": pool.stats()}
+    if async_db is not None:
+        stats["async"] = async_db.stats()
+    return stats
+
+REGISTRY.add_collector(gauge_collector(
+    "db_pool_connections", "Database pool connections", "pool", pool_stats))
+REGISTRY.add_collector(gauge_collector(
+    "request_class", "Admission control per request class", "request_class",
+    lambda: {name: c.stats() for name, c in REQUEST_CLASSES.items()}))
+REGISTRY.add_collector(gauge_collector(
+    "singleflight", "Coalesced in-flight queries", "flight",
+    lambda: {f.name: f.stats() for f in (search_flight, detail_flight, source_flight)}))
+REGISTRY.add_collector(gauge_collector(
+    "log_queue", "Background log writer queue", "queue", lambda: {"log": logging_stats()}))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式指标"""
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- 产品详情 ---
+DETAIL_CACHE_TTL = float(os.getenv('DETAIL_CACHE_TTL', 300))
+DETAIL_CACHE_MAX_BYTES = int(os.getenv('DETAIL_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+# 批量详情接口单次最多款号数
+DETAIL_BATCH_LIMIT = int(os.getenv('DETAIL_BATCH_LIMIT', 100))
+# 款号 -> 按分类整理后的详情
+detail_cache = TTLCache(ttl=DETAIL_CACHE_TTL, max_bytes=DETAIL_CACHE_MAX_BYTES)
+
+# 目录快照更新后，详情同样失效
+catalog_engine.on_refresh(lambda snapshot: detail_cache.invalidate())
+
+# 同时进行中的同一款号详情只查询一次
+detail_flight = SingleFlight("detail")
+
+async def fetch_product_details(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    批量获取产品详情，返回 款号 -> 分类详情 (未找到的款号不在结果中)
+    已缓存的款号直接返回，其他请求正在查询的款号等待其结果，其余款号一次 IN 查询 + 一次素材图查询
+    """
+    details = {}
+    missing = []
+    for code in dict.fromkeys(codes):
+        cached = detail_cache.get(code)
+        if cached is not None:
+            details[code] = cached
+        else:
+            missing.append(code)
+    if not missing:
+        return details
+
+    async def load_one(code: str) -> Optional[Dict[str, Any]]:
+        return (await load_product_details([code])).get(code)
+
+    # 其他请求正在查询的款号等待其结果，其余款号登记后由本次查询 (检查与登记之间没有 await)
+    joined = [c for c in missing if detail_flight.in_flight(c)]
+    flights = {c: detail_flight.lead(c) for c in missing if c not in joined}
+    waits = asyncio.gather(*[detail_flight.do(c, lambda c=c: load_one(c)) for c in joined])
+    try:
+        try:
+            loaded = await load_product_details(list(flights)) if flights else {}
+            for c, future in flights.items():
+                detail_flight.resolve(c, future, loaded.get(c))
+        finally:
+            for c, future in flights.items():
+                detail_flight.abandon(c, future)
+    except BaseException:
+        # 本次查询失败或被取消时取消并回收等待，避免遗留未 await 的 gather
+        waits.cancel()
+        await asyncio.gather(waits, return_exceptions=True)
+        raise
+    details.update(loaded)
+    details.update((c, d) for c, d in zip(joined, await waits) if d is not None)
+    return details
+
+async def load_product_details(missing: List[str]) -> Dict[str, Dict[str, Any]]:
+    """从数据库读取详情并写入缓存 (查询出错时返回空结果)"""
+    details = {}
+    # 仅查询 FIELD_MAPPING 中定义的字段
+    allowed_fields = list(FIELD_MAPPING.keys())
+    fields_sql = ", ".join([f"`{f}`" for f in allowed_fields])
+    placeholders = ", ".join(["%s"] * len(missing))
+    sql = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE code IN ({placeholders})"
+    try:
+        rows = await db_fetchall(sql, missing)
+    except Exception as e:
+        logger.error(f"Database error in get_product_detail for codes {missing}: {e}")
+        return details
+
+    # 同一款号存在多行时取第一行
+    # 款号比较与数据库排序规则一致，不区分大小写
+    rows_by_code = {}
+    for row in rows:
+        rows_by_code.setdefault(str(row.get('code')).lower(), row)
+    found = {c: rows_by_code[c.lower()] for c in missing if c.lower() in rows_by_code}
+
+    # 批量获取素材图逻辑
+    await process_material_images(list(found.values()), [str(row.get('code')) for row in found.values()])
+
+    for code, row in found.items():
+        # 返回清洗后的详情数据，并按分类整理
+        categorized_row = organize_detail_by_categories(serialize_row(row))
+        detail_cache.set(code, categorized_row)
+        details[code] = categorized_row
+    return details
 
 @app.get("/api/get_product_detail")
 async def get_product_detail(code: str):
@@ -841,66 +1357,71 @@ async def get_product_detail(code: str):
     if not code:
         raise HTTPException(status_code=400, detail="Code parameter is required")
     
-    def fetch_detail(p_code):
-        # 仅查询 FIELD_MAPPING 中定义的字段
-        allowed_fields = list(FIELD_MAPPING.keys())
-        fields_sql = ", ".join([f"`{f}`" for f in allowed_fields])
-        sql = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE code = %s"
-        
-        try:
-            conn = get_db_connection()
-            with conn.cursor() as cursor:
-                # 获取产品详情
-                cursor.execute(sql, [p_code])
-                row = cursor.fetchone()
-            conn.close()
-            return row
-        except Exception as e:
-            logger.error(f"Database error in get_product_detail for code {p_code}: {e}")
-            return None
-
-    row = await run_in_threadpool(fetch_detail, code)
+    details = await fetch_product_details([code])
 
-    if not row:
+    if code not in details:
         return {
             "success": False,
             "message": f"Product with code '{code}' not found",
             "data": None
         }
 
-    # 批量获取素材图逻辑 (这里只有一行)
-    process_material_images([row], [code])
-
-    # 返回清洗后的详情数据，并按分类整理（自动转换键名为中文）
-    serialized_row = serialize_row(row)
-
-    categorized_row = organize_detail_by_categories(serialized_row)
-    
     return {
         "success": True,
-        "data": categorized_row
+        "data": details[code]
     }
 
+def normalize_codes(request_data: Any) -> List[str]:
+    """款号列表归一化：支持列表、{"codes": ...} 以及 , / 分隔的字符串"""
+    codes = request_data.get('codes', []) if isinstance(request_data, dict) else request_data
+    if isinstance(codes, str):
+        codes = re.split(r'[/,，、\s]+', codes)
+    elif not isinstance(codes, list):
+        codes = []
+    return list(dict.fromkeys(str(c).strip() for c in codes if str(c).strip()))
+
+@app.post("/api/get_product_details")
+async def get_product_details(request_data: Any = Body(...)):
+    """批量获取产品详情，data 按请求顺序返回，未找到的款号列在 not_found 中"""
+    codes = normalize_codes(request_data)
+    if not codes:
+        raise HTTPException(status_code=400, detail="codes parameter is required")
+    if len(codes) > DETAIL_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {DETAIL_BATCH_LIMIT} codes per request")
+
+    details = await fetch_product_details(codes)
+    return json_response({
+        "success": True,
+        "data": [{"code": c, "detail": details[c]} for c in codes if c in details],
+        "not_found": [c for c in codes if c not in details]
+    })
+
+@app.post("/api/product_detail/invalidate")
+async def invalidate_product_detail(request_data: Any = Body(None)):
+    """显式失效详情缓存：传入款号时只删除对应条目，否则全部清空"""
+    codes = normalize_codes(request_data) if request_data else []
+    if codes:
+        code_set = set(codes)
+        removed = detail_cache.invalidate(lambda code: code in code_set)
+    else:
+        removed = detail_cache.invalidate()
+    return {"success": True, "removed": removed}
+
 @app.get("/api/get_user_info")
 async def get_user_info(user_id: str):
     """获取用户信息接口"""
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id parameter is required")
     
-    def fetch_user(uid):
+    async def fetch_user(uid):
         sql = "SELECT * FROM ai_user WHERE id = %s AND product = 'sale'"
         try:
-            conn = get_db_connection()
-            with conn.cursor() as cursor:
-                cursor.execute(sql, [uid])
-                row = cursor.fetchone()
-            conn.close()
-            return row
+            return await db_fetchone(sql, [uid])
         except Exception as e:
             logger.error(f"Database error in get_user_info for user_id {uid}: {e}")
             return None
 
-    row = await run_in_threadpool(fetch_user, user_id)
+    row = await fetch_user(user_id)
     
     if not row:
         return {
@@ -917,10 +1438,12 @@ async def get_user_info(user_id: str):
         "data": serialized_row
     }
 
+source_flight = SingleFlight("source")
+
 @app.post("/api/search_source")
 async def search_source(request_data: Any = Body(...)):
     """素材查询接口，兼容多关键词"""
-    logger.info(f"Received search_source request: {request_data}")
+    log_payload("search_source", request_data)
     
     # 兼容多种入参格式
     search_type = "all"
@@ -951,7 +1474,16 @@ async def search_source(request_data: Any = Body(...)):
     
     logger.info(f"Normalized kw_list: {kw_list}, search_type: {search_type}")
 
-    def fetch_sources(kws, s_type):
+    # 续页游标：上一页最后一条素材的 id
+    fingerprint = query_fingerprint({"keywords": kw_list, "type": search_type})
+    before_id = None
+    if isinstance(request_data, dict) and request_data.get('cursor'):
+        try:
+            before_id = int(decode_cursor(request_data['cursor'], fingerprint)['id'])
+        except (CursorError, KeyError, TypeError, ValueError) as e:
+            return json_response({"success": False, "message": str(e) or "Invalid cursor", "total": 0, "list": []})
+
+    async def fetch_sources(kws, s_type, before):
         # 构造多关键词模糊查询 SQL
         # 逻辑：(name LIKE %kw1% OR tags LIKE %kw1%) OR (name LIKE %kw2% OR tags LIKE %kw2%) ...
         clauses = []
@@ -973,52 +1505,53 @@ async def search_source(request_data: Any = Body(...)):
         # 获取总数
         count_sql = f"SELECT COUNT(*) as total FROM ai_source_app_v1 WHERE {where_clause} AND is_delete = 0"
         
+        # 分页数据：续页时从上一页最后一条之后开始，多取一条用于判断是否还有下一页
+        page_clause = where_clause
+        page_params = list(params)
+        if before is not None:
+            page_clause += " AND id < %s"
+            page_params.append(before)
         sql = f"""
-            SELECT name, file_type, pic_url, video_path 
+            SELECT id, name, file_type, pic_url, video_path 
             FROM ai_source_app_v1 
-            WHERE {where_clause} AND is_delete = 0
+            WHERE {page_clause} AND is_delete = 0
             ORDER BY id DESC
-            LIMIT 100
+            LIMIT 101
         """
         try:
-            conn = get_db_connection()
-            with conn.cursor() as cursor:
-                # 先查总数
-                cursor.execute(count_sql, params)
-                res = cursor.fetchone()
-                total_count = res.get('total', 0) if res else 0
-                
-                # 再查分页数据
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-            conn.close()
-            return rows, total_count
+            # 总数与分页数据并行查询
+            res, rows = await asyncio.gather(db_fetchone(count_sql, params), db_fetchall(sql, page_params))
+            total_count = res.get('total', 0) if res else 0
+            last_id = rows[99].get('id') if len(rows) > 100 else None
+            return rows[:100], total_count, last_id
         except Exception as e:
             logger.error(f"Database error in search_source for keywords {kws}, type {s_type}: {e}")
-            return [], 0
-
-    rows, total = await run_in_threadpool(fetch_sources, kw_list, search_type)
+            return [], 0, None
+
+    async def search_page():
+        # 素材快照可用时一次索引求值得到前 100 条与总数，否则回退到数据库
+        source_snapshot = material_search.current()
+        if source_snapshot is not None:
+            return await run_blocking(source_snapshot.search, kw_list, search_type, 100, before_id)
+        rows, total, last_id = await fetch_sources(kw_list, search_type, before_id)
+        # 清洗数据并处理 pic_url 和 video_path 域名
+        return [format_source_row(row) for row in rows], total, last_id
+
+    # 同时进行中的相同查询 (关键词、类型与续页位置相同) 只执行一次
+    cleaned_rows, total, last_id = await source_flight.do((fingerprint, before_id), search_page)
     
     # 增加调试日志
     logger.info(f"Search result: found {total} items for keywords {kw_list}")
     
-    # 清洗数据并处理 pic_url 和 video_path 域名
-    cleaned_rows = []
-    for row in rows:
-        serialized = serialize_row(row)
-        # 处理图片域名
-        if serialized.get('pic_url') and serialized['pic_url'].startswith('/'):
-            serialized['pic_url'] = f"https://lobe.wyoooni.net{serialized['pic_url']}"
-        # 处理视频域名
-        if serialized.get('video_path') and serialized['video_path'].startswith('/'):
-            serialized['video_path'] = f"https://lobe.wyoooni.net{serialized['video_path']}"
-        cleaned_rows.append(serialized)
-    
-    return {
+    result = {
         "success": True,
         "total": total,
         "list": cleaned_rows
     }
+    # 还有更多结果时返回续页游标
+    if last_id is not None:
+        result["next_cursor"] = encode_cursor(fingerprint, id=last_id)
+    return json_response(result)
 
 @app.get("/api/wechat_login")
 async def wechat_login(code: str, type: str = "rs"):
@@ -1039,20 +1572,15 @@ async def wechat_login(code: str, type: str = "rs"):
     userid = user_info.get("userid") or user_info.get("UserId")
     
     # 检查数据库中是否存在该用户
-    def fetch_user(uid):
+    async def fetch_user(uid):
         sql = "SELECT * FROM ai_user WHERE id = %s"
         try:
-            conn = get_db_connection()
-            with conn.cursor() as cursor:
-                cursor.execute(sql, [uid])
-                row = cursor.fetchone()
-            conn.close()
-            return row
+            return await db_fetchone(sql, [uid])
         except Exception as e:
             logger.error(f"Database error in wechat_login for userid {uid}: {e}")
             return None
 
-    user_row = await run_in_threadpool(fetch_user, userid)
+    user_row = await fetch_user(userid)
     
     if not user_row:
         return {
@@ -1,12 +1,21 @@
+import os
 import json
 import re
+import asyncio
 import pymysql
 import datetime
+import time
 import logging
-from dbutils.pooled_db import PooledDB
 from decimal import Decimal
 from fastmcp import FastMCP
 from typing import Dict, Any, Optional, List, Tuple, Union
+from starlette.responses import PlainTextResponse
+from metrics import REGISTRY, observe_stage, gauge_collector
+from db_pool import ManagedPool
+from serializer import columnar, dumps
+from result_cache import canonical_key
+from query_plan import resolve_sort, resolve_mode
+from singleflight import SingleFlight
 
 # --- 日志配置 ---
 logging.basicConfig(
@@ -32,19 +41,68 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
-# 初始化连接池
-pool = PooledDB(
+# 初始化连接池 (懒连接，DB_POOL_WARMUP > 0 时在后台预热；配置项与 fastapi_server 相同)
+pool = ManagedPool(
     creator=pymysql,
-    mincached=10,
-    maxcached=50,
-    maxconnections=100,
-    blocking=True,
+    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 100)),
+    acquire_timeout=float(os.getenv('DB_ACQUIRE_TIMEOUT', 10)),
+    grow_wait=float(os.getenv('DB_POOL_GROW_WAIT', 0.05)),
+    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+    health_check_interval=float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 60)),
     **DB_CONFIG
 )
+REGISTRY.add_collector(gauge_collector(
+    "db_pool_connections", "Database pool connections", "pool", lambda: {"sync": pool.stats()}))
 
 def get_db_connection():
     return pool.connection()
 
+def fetch_all(sql: str, params: List[Any]) -> List[Dict]:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+def fetch_one(sql: str, params: List[Any]) -> Optional[Dict]:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+    finally:
+        conn.close()
+
+# --- 进行中请求合并 ---
+# 同时进行中的等价搜索 (归一化后相同)、同一款号详情、相同素材查询只执行一次
+search_flight = SingleFlight("search")
+detail_flight = SingleFlight("detail")
+source_flight = SingleFlight("source")
+REGISTRY.add_collector(gauge_collector(
+    "singleflight", "Coalesced in-flight queries", "flight",
+    lambda: {f.name: f.stats() for f in (search_flight, detail_flight, source_flight)}))
+
+# --- 输出格式 ---
+# compact: 无缩进的 JSON；columnar: 在 compact 基础上 list 改为 columns (表头只出现一次) + rows；
+# pretty: 原来的 indent=2 格式。各工具可通过 output 参数单独指定
+OUTPUT_FORMATS = ('compact', 'columnar', 'pretty')
+DEFAULT_OUTPUT_FORMAT = os.getenv('MCP_OUTPUT_FORMAT', 'compact')
+
+def render(content: Dict[str, Any], output: Optional[str] = None) -> str:
+    """按输出格式编码工具返回值"""
+    output = output if output in OUTPUT_FORMATS else DEFAULT_OUTPUT_FORMAT
+    if output == 'columnar' and isinstance(content.get('list'), list):
+        columns, rows = columnar(content['list'])
+        content = {k: v for k, v in content.items() if k != 'list'}
+        content['columns'] = columns
+        content['rows'] = rows
+    if output == 'pretty':
+        return json.dumps(content, ensure_ascii=False, indent=2)
+    return dumps(content).decode('utf-8')
+
 # --- 字段定义 ---
 # 默认返回字段
 DEFAULT_RETURN_FIELDS = [
@@ -395,11 +453,7 @@ def process_material_images(rows: List[Dict], codes: List[str]):
     img_sql = "SELECT name, pic_url FROM ai_source_app_v1 WHERE name REGEXP %s"
     
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(img_sql, [regexp_pattern])
-            img_rows = cursor.fetchall()
-        conn.close()
+        img_rows = fetch_all(img_sql, [regexp_pattern])
         
         # 将图片按款号归类
         code_to_imgs = {}
@@ -473,8 +527,7 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         limit = 20
     
     # 兼容 sort 和 sort_by
-    user_sort = query.get('sort', query.get('sort_by'))
-    if not user_sort: user_sort = None
+    user_sort = resolve_sort(query)
     
     requested_fields = query.get('fields', DEFAULT_RETURN_FIELDS)
     if not requested_fields:
@@ -493,7 +546,7 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         else: strict_query[k] = v
             
     search_code_val = strict_query.get('code', '')
-    mode = query.get('mode')
+    mode = resolve_mode(query, default=None)
 
     # 3. SQL 构造
     required_fields = set(requested_fields) | {'code', 'sale_num_year', 'elem', 'weight'}
@@ -505,7 +558,7 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
     sql_template = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE 1=1"
     
     # A. 模式过滤 (mode=1 时仅筛选 6/9/3 开头的款号)
-    if str(mode) == '1':
+    if mode == '1':
         sql_template += " AND (code LIKE '6%' OR code LIKE '9%' OR code LIKE '3%')"
     
     params = []
@@ -539,12 +592,10 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
     sql_template += " LIMIT 5000"
 
     # 4. 执行查询
+    start = time.perf_counter()
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql_template, params)
-            rows = cursor.fetchall()
-        conn.close()
+        rows = fetch_all(sql_template, params)
+        observe_stage('sql', time.perf_counter() - start, rows_out=len(rows))
     except Exception as e:
         logger.error(f"Database error in perform_single_search: {e}")
         return {
@@ -554,6 +605,7 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         }
 
     # 5. Python 筛选
+    start = time.perf_counter()
     filtered_rows = []
     for row in rows:
         weight_val = row.get('weight')
@@ -575,10 +627,13 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
         if match:
             filtered_rows.append(row)
 
+    observe_stage('python_filter', time.perf_counter() - start, len(rows), len(filtered_rows))
+
     # 6. 计算总数
     total_count = len(filtered_rows)
 
     # 7. 排序
+    start = time.perf_counter()
     if user_sort:
         sort_parts = str(user_sort).strip().split()
         sort_field = sort_parts[0]
@@ -603,18 +658,23 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
 
     # 8. 分页
     final_rows = filtered_rows[:limit]
+    observe_stage('rank', time.perf_counter() - start, total_count, len(final_rows))
     
     # 9. 批量获取素材图
     if 'image_urls' in requested_fields:
+        start = time.perf_counter()
         final_codes = [str(r.get('code', '')) for r in final_rows if r.get('code')]
         process_material_images(final_rows, final_codes)
+        observe_stage('material_images', time.perf_counter() - start, len(final_rows))
 
     # 10. 构建结果
+    start = time.perf_counter()
     cleaned_rows = []
     for row in final_rows:
         serialized = serialize_row(row)
         filtered_row = {k: v for k, v in serialized.items() if k in requested_fields}
         cleaned_rows.append(filtered_row)
+    observe_stage('serialize', time.perf_counter() - start, len(final_rows))
 
     return {
         "total": total_count,
@@ -622,7 +682,7 @@ def perform_single_search(query: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 @mcp.tool()
-def product_search(query_json: str) -> str:
+async def product_search(query_json: str, output: Optional[str] = None) -> str:
     """
     面料产品通用搜索工具。
     支持数值范围 (如 "100-200", ">50")、成分逻辑 (如 "棉>30% + 氨纶")、文本模糊匹配 (如 "卫衣布 / 毛圈")。
@@ -630,6 +690,7 @@ def product_search(query_json: str) -> str:
     Args:
         query_json (str): 包含筛选条件的 JSON 字符串。
         示例: '{"weight": ">300", "fabric_structure_two": "卫衣布", "limit": 10}'
+        output (str): 输出格式 "compact" / "columnar" (columns 表头 + rows 列表) / "pretty"，默认 compact。
     """
     try:
         data = json.loads(query_json)
@@ -650,9 +711,10 @@ def product_search(query_json: str) -> str:
             query = data
             
         if not isinstance(query, dict):
-            return json.dumps({"error": "Invalid query format", "total": 0, "list": []})
+            return render({"error": "Invalid query format", "total": 0, "list": []}, output)
             
-        res = perform_single_search(query)
+        # 查询与筛选在线程中执行，不阻塞其他工具调用
+        res = await search_flight.do(canonical_key(query, default_mode=None), lambda: asyncio.to_thread(perform_single_search, query))
         
         # 构建统一的返回结构，包含标题和翻译后的查询条件
         final_res = {
@@ -661,53 +723,54 @@ def product_search(query_json: str) -> str:
             "total": res.get("total", 0),
             "list": res.get("list", [])
         }
-        return json.dumps(final_res, ensure_ascii=False, indent=2)
+        return render(final_res, output)
     except Exception as e:
-        return json.dumps({"error": str(e), "total": 0, "list": []})
+        return render({"error": str(e), "total": 0, "list": []}, output)
 
 @mcp.tool()
-def get_product_detail(code: str) -> str:
+async def get_product_detail(code: str, output: Optional[str] = None) -> str:
     """
     通过款号获取产品详细信息。
     
     Args:
         code (str): 产品款号，如 "6228"。
+        output (str): 输出格式 "compact" / "pretty"，默认 compact。
     """
     allowed_fields = list(FIELD_MAPPING.keys())
     fields_sql = ", ".join([f"`{f}`" for f in allowed_fields])
     sql = f"SELECT {fields_sql} FROM ai_product_app_v1 WHERE code = %s"
     
+    async def load():
+        row = await asyncio.to_thread(fetch_one, sql, [code])
+        if not row:
+            return None
+        await asyncio.to_thread(process_material_images, [row], [code])
+        return organize_detail_by_categories(serialize_row(row))
+
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, [code])
-            row = cursor.fetchone()
-        conn.close()
+        categorized_row = await detail_flight.do(code, load)
         
-        if not row:
-            return json.dumps({
+        if not categorized_row:
+            return render({
                 "success": False, 
                 "message": f"Product with code '{code}' not found",
                 "data": None
-            }, ensure_ascii=False, indent=2)
-            
-        process_material_images([row], [code])
-        serialized_row = serialize_row(row)
-        categorized_row = organize_detail_by_categories(serialized_row)
+            }, output)
         
-        return json.dumps({"success": True, "data": categorized_row}, ensure_ascii=False, indent=2)
+        return render({"success": True, "data": categorized_row}, output)
     except Exception as e:
-        logger.error(f"Database error in search_source for keywords {kw_list}, type {type}: {e}")
-        return json.dumps({"success": False, "message": str(e)})
+        logger.error(f"Database error in get_product_detail for code {code}: {e}")
+        return render({"success": False, "message": str(e)}, output)
 
 @mcp.tool()
-def search_source(keywords: Union[str, List[str]], type: str = "all") -> str:
+async def search_source(keywords: Union[str, List[str]], type: str = "all", output: Optional[str] = None) -> str:
     """
     素材查询工具，支持按名称或标签搜索素材图/视频。
     
     Args:
         keywords (Union[str, List[str]]): 关键词，支持字符串或列表。
         type (str): 素材类型，如 "pic", "video", "all"。
+        output (str): 输出格式 "compact" / "columnar" (columns 表头 + rows 列表) / "pretty"，默认 compact。
     """
     if isinstance(keywords, str):
         kw_list = [k.strip() for k in re.split(r'[/,，、\s+]', keywords) if k.strip()]
@@ -740,45 +803,45 @@ def search_source(keywords: Union[str, List[str]], type: str = "all") -> str:
         LIMIT 20
     """
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, params)
-            rows = cursor.fetchall()
-        conn.close()
+        rows = await source_flight.do((sql, tuple(params)), lambda: asyncio.to_thread(fetch_all, sql, params))
         
         cleaned_rows = [serialize_row(row) for row in rows]
-        return json.dumps({"success": True, "total": len(cleaned_rows), "list": cleaned_rows}, ensure_ascii=False, indent=2)
+        return render({"success": True, "total": len(cleaned_rows), "list": cleaned_rows}, output)
     except Exception as e:
-        return json.dumps({"success": False, "message": str(e)})
+        return render({"success": False, "message": str(e)}, output)
 
 @mcp.tool()
-def get_user_info(user_id: str) -> str:
+async def get_user_info(user_id: str, output: Optional[str] = None) -> str:
     """
     获取用户信息。
     
     Args:
         user_id (str): 用户 ID。
+        output (str): 输出格式 "compact" / "pretty"，默认 compact。
     """
     sql = "SELECT * FROM ai_user WHERE id = %s AND product = 'sale'"
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, [user_id])
-            row = cursor.fetchone()
-        conn.close()
+        row = await asyncio.to_thread(fetch_one, sql, [user_id])
         
         if not row:
-            return json.dumps({
+            return render({
                 "success": False, 
                 "message": f"User with id '{user_id}' and product 'sale' not found",
                 "data": None
-            }, ensure_ascii=False, indent=2)
+            }, output)
             
         serialized_row = serialize_row(row)
-        return json.dumps({"success": True, "data": serialized_row}, ensure_ascii=False, indent=2)
+        return render({"success": True, "data": serialized_row}, output)
     except Exception as e:
-        return json.dumps({"success": False, "message": str(e)})
+        return render({"success": False, "message": str(e)}, output)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    """Prometheus 文本格式指标 (与 fastapi_server 相同的指标名)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
+    pool.start_warmup(int(os.getenv('DB_POOL_WARMUP', 0)))
     mcp.run(transport="sse", host="0.0.0.0", port=8011)
\ No newline at end of file
@@ -0,0 +1,294 @@
+# load_test.py
+# /api/product_search 压测：回放工作负载 (test_cases_20 或采集的 JSON-lines 请求)，按并发级别依次运行，
+# 输出每个级别的吞吐、延迟分位数、错误率与连接池饱和度 (通过 /metrics 采样)。
+# 可自动在本地启动使用替身库 (DB_STANDIN) 的服务。
+#
+#   python load_test.py --start-server --db bench_100k.db --concurrency 1,8,32,128 --duration 20
+#   python load_test.py --url http://localhost:8012 --workload query_events.jsonl --rate 200
+#   python load_test.py --start-server --workers 4 --shared-dir /dev/shm/ai-chat-catalog
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from typing import Dict, Any, Optional, List, Tuple
+
+import httpx
+
+from bench_search import percentile
+
+
+def load_workload(path: Optional[str]) -> List[Any]:
+    """
+    工作负载：每项为一个 /api/product_search 请求体
+    - 未指定文件时使用 test_cases_20 中的场景
+    - JSON-lines 文件：每行为请求体，或 logs.log_payload 写出的事件 (取 event=product_search 且未截断的 payload)
+    """
+    if not path:
+        from test_cases_20 import test_cases
+        return [payload for _, _, payload in test_cases]
+    bodies = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict) and 'event' in item:
+                if item['event'] != 'product_search' or item.get('payload_truncated'):
+                    continue
+                item = item.get('payload')
+            if isinstance(item, (dict, list)):
+                bodies.append(item)
+    return bodies
+
+
+def batched(body: Any, rng: random.Random, workload: List[Any], size: int) -> Any:
+    """把单条查询组合成 tool_call 列表 (模拟智能体一次发出多个子查询)"""
+    queries = [q for q in rng.sample(workload, min(size, len(workload))) if isinstance(q, dict)]
+    return [{"title": "load test", "tool_call": queries or [body]}]
+
+
+def parse_prometheus(text: str) -> Dict[str, float]:
+    """只解析 名称{标签} 值 形式的样本行"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        try:
+            samples[name] = float(value)
+        except ValueError:
+            continue
+    return samples
+
+
+class PoolSampler:
+    """压测期间定期抓取 /metrics，记录连接池占用峰值与等待时间"""
+
+    def __init__(self, base_url: str, interval: float = 0.25):
+        # 使用独立连接，不与压测请求争用连接数上限
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=10)
+        self.interval = interval
+        self.max_used = 0.0
+        self.maxsize = 0.0
+        self.first: Dict[str, float] = {}
+        self.last: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def sample(self) -> Dict[str, float]:
+        try:
+            response = await self.client.get('/metrics')
+            samples = parse_prometheus(response.text)
+        except httpx.HTTPError:
+            return {}
+        self.max_used = max(self.max_used, samples.get('db_pool_connections{pool="async",field="used"}', 0))
+        self.maxsize = samples.get('db_pool_connections{pool="async",field="maxsize"}', self.maxsize)
+        return samples
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sample()
+
+    async def __aenter__(self):
+        self.first = await self.sample()
+        self._task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.last = await self.sample()
+        await self.client.aclose()
+
+    def summary(self) -> Dict[str, Any]:
+        def delta(name):
+            return self.last.get(name, 0) - self.first.get(name, 0)
+        waits = delta('db_pool_wait_seconds_count{pool="async"}') or delta('db_pool_wait_seconds_count{pool="sync"}')
+        wait_sum = delta('db_pool_wait_seconds_sum{pool="async"}') or delta('db_pool_wait_seconds_sum{pool="sync"}')
+        return {
+            "pool_max_used": int(self.max_used),
+            "pool_maxsize": int(self.maxsize),
+            "pool_saturation": round(self.max_used / self.maxsize, 3) if self.maxsize else None,
+            "pool_wait_mean_ms": round(wait_sum / waits * 1000, 3) if waits else 0.0,
+        }
+
+
+async def run_level(client: httpx.AsyncClient, workload: List[Any], concurrency: int, duration: float,
+                    rate: Optional[float], batch_ratio: float, batch_size: int, seed: int) -> Dict[str, Any]:
+    """
+    运行一个并发级别
+    rate 为空时为闭环模式 (concurrency 个客户端连续发送)；
+    否则按泊松到达以 rate 请求/秒发送，同时在途请求不超过 concurrency
+    """
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    kinds = {"single": 0, "batch": 0}
+    deadline = time.perf_counter() + duration
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def next_body() -> Tuple[str, Any]:
+        body = rng.choice(workload)
+        if batch_size > 1 and rng.random() < batch_ratio:
+            return "batch", batched(body, rng, workload, batch_size)
+        return "single", body
+
+    async def send(kind: str, body: Any):
+        start = time.perf_counter()
+        try:
+            response = await client.post('/api/product_search', json=body)
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors[f"http_{response.status_code}"] = errors.get(f"http_{response.status_code}", 0) + 1
+                return
+            data = response.json()
+            results = data if isinstance(data, list) else [data]
+            if any(isinstance(r, dict) and r.get('error') for r in results):
+                errors["search_error"] = errors.get("search_error", 0) + 1
+                return
+            latencies.append(elapsed)
+            kinds[kind] += 1
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    async def closed_loop():
+        while time.perf_counter() < deadline:
+            await send(*next_body())
+
+    async def open_loop():
+        pending = set()
+        while time.perf_counter() < deadline:
+            await semaphore.acquire()
+            task = asyncio.create_task(send(*next_body()))
+            task.add_done_callback(lambda t: (semaphore.release(), pending.discard(t)))
+            pending.add(task)
+            await asyncio.sleep(rng.expovariate(rate))
+        if pending:
+            await asyncio.gather(*pending)
+
+    start = time.perf_counter()
+    async with PoolSampler(str(client.base_url)) as sampler:
+        if rate:
+            await open_loop()
+        else:
+            await asyncio.gather(*[closed_loop() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    values = sorted(latencies)
+    error_count = sum(errors.values())
+    total = len(values) + error_count
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        "requests": total,
+        "throughput": round(len(values) / elapsed, 1),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "error_rate": round(error_count / total, 4) if total else 0.0,
+        "errors": errors,
+        **kinds,
+        **sampler.summary(),
+    }
+
+
+def start_server(db: str, port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    """在本地启动使用替身库的服务"""
+    server_env = {**os.environ, "DB_STANDIN": os.path.abspath(db), "LOG_EVENT_FILE": "", **env}
+    cmd = [sys.executable, "-m", "uvicorn", "fastapi_server:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=server_env)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float, snapshot: bool):
+    """等待服务可用；snapshot 为真时还要等目录快照与素材图索引加载完成"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get('/api/cache/stats')
+            if response.status_code == 200:
+                stats = response.json()
+                if not snapshot or (stats.get('catalog', {}).get('ready')
+                                    and stats.get('material_image_index', {}).get('ready')):
+                    return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("Server did not become ready")
+
+
+async def main_async(args) -> List[Dict[str, Any]]:
+    workload = load_workload(args.workload)
+    if not workload:
+        raise SystemExit("Empty workload")
+    levels = [int(c) for c in args.concurrency.split(',')]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client, args.ready_timeout, args.wait_snapshot)
+        print(f"{'conc':>5} {'req':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err%':>6} "
+              f"{'batch':>6} {'pool':>9} {'wait ms':>8}")
+        for i, concurrency in enumerate(levels):
+            if args.invalidate_cache:
+                await client.post('/api/cache/invalidate')
+            r = await run_level(client, workload, concurrency, args.duration, args.rate,
+                                args.batch_ratio, args.batch_size, args.seed + i)
+            results.append(r)
+            print(f"{r['concurrency']:>5} {r['requests']:>7} {r['throughput']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                  f"{r['p99_ms']:>9} {r['error_rate'] * 100:>6.2f} {r['batch']:>6} "
+                  f"{r['pool_max_used']:>4}/{r['pool_maxsize']:<4} {r['pool_wait_mean_ms']:>8}")
+            if r["errors"]:
+                print(f"      errors: {r['errors']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/product_search 并发压测")
+    parser.add_argument("--url", default=None, help="服务地址，默认 http://127.0.0.1:<port>")
+    parser.add_argument("--workload", default=None, help="JSON-lines 请求文件，默认使用 test_cases_20")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="依次运行的并发级别")
+    parser.add_argument("--duration", type=float, default=15, help="每个并发级别的持续时间 (秒)")
+    parser.add_argument("--rate", type=float, default=None, help="到达速率 (请求/秒)，不指定时为闭环模式")
+    parser.add_argument("--batch-ratio", type=float, default=0.3, help="以 tool_call 列表发送的请求比例")
+    parser.add_argument("--batch-size", type=int, default=4, help="tool_call 列表中的子查询数")
+    parser.add_argument("--invalidate-cache", action="store_true", help="每个级别开始前清空结果缓存")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", default=None, help="结果写入 JSON 文件")
+    parser.add_argument("--start-server", action="store_true", help="在本地启动使用替身库的服务")
+    parser.add_argument("--db", default="bench_10k.db", help="--start-server 使用的 SQLite 文件 (bench_data.py 生成)")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-snapshot", action="store_true", help="服务不加载内存快照 (压测数据库路径)")
+    parser.add_argument("--shared-dir", default=None, help="多 worker 共享目录快照文件的目录 (CATALOG_SHARED_DIR)")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    args.url = args.url or f"http://127.0.0.1:{args.port}"
+    args.wait_snapshot = args.start_server and not args.no_snapshot
+    server = None
+    if args.start_server:
+        if not os.path.exists(args.db):
+            raise SystemExit(f"{args.db} not found, generate it with bench_data.py first")
+        env = {"CATALOG_ENABLED": "0", "MATERIAL_INDEX_ENABLED": "0"} if args.no_snapshot else {}
+        if args.shared_dir:
+            env["CATALOG_SHARED_DIR"] = os.path.abspath(args.shared_dir)
+        server = start_server(args.db, args.port, args.workers, env)
+    try:
+        results = asyncio.run(main_async(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
+import os
+import json
+import time
+import queue
+import random
+import atexit
 import logging
+import threading
+import logging.handlers
+from typing import Any, Optional, List, Tuple
 
 # 配置日志
 logging.basicConfig(
@@ -9,3 +18,228 @@ logger = logging.getLogger('wechat')
 
 def log(tag, message):
     logger.info(f"[{tag}] {message}")
+
+
+# --- 后台批量写日志 ---
+# 请求线程只把日志记录放入队列，由后台线程按批写入文件并统一 flush，请求路径上不再有同步磁盘 I/O
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 200))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.5))
+# 请求体 / SQL 日志的采样率 (0~1) 与最大长度 (字符)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 4096))
+LOG_SQL_SAMPLE_RATE = float(os.getenv("LOG_SQL_SAMPLE_RATE", 1.0))
+LOG_SQL_MAX_CHARS = int(os.getenv("LOG_SQL_MAX_CHARS", 2048))
+
+# 结构化事件 (JSON-lines) 使用的 logger，只写入事件文件
+EVENT_LOGGER = 'events'
+event_logger = logging.getLogger(EVENT_LOGGER)
+event_logger.propagate = False
+# 调用 setup_logging 指定事件文件之前不记录事件
+event_logger.setLevel(logging.CRITICAL + 1)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，不阻塞请求"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 事件记录携带原始内容，由后台线程的 JsonLineFormatter 编码，请求线程上不做格式化
+        if record.name == EVENT_LOGGER:
+            return record
+        return super().prepare(record)
+
+
+class BatchingQueueListener:
+    """
+    后台线程消费日志队列：攒够 LOG_BATCH_SIZE 条或等待 LOG_FLUSH_INTERVAL 秒后，
+    每个输出流一次写入整批并 flush 一次
+    """
+
+    def __init__(self, q: queue.Queue, handlers: List[logging.Handler],
+                 batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.queue = q
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.records = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _drain(self) -> List[logging.LogRecord]:
+        """取出一批记录：至少等到一条，之后在刷新间隔内尽量攒满一批"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[logging.LogRecord]):
+        for handler in self.handlers:
+            records = [r for r in batch if r.levelno >= handler.level and handler.filter(r)]
+            if not records:
+                continue
+            if isinstance(handler, logging.StreamHandler):
+                try:
+                    text = ''.join(handler.format(r) + handler.terminator for r in records)
+                    with handler.lock:
+                        handler.stream.write(text)
+                        handler.stream.flush()
+                except Exception:
+                    handler.handleError(records[0])
+            else:
+                for r in records:
+                    handler.handle(r)
+        self.batches += 1
+        self.records += len(batch)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set() or not self.queue.empty():
+                batch = self._drain()
+                if batch:
+                    self._write(batch)
+
+        self._thread = threading.Thread(target=run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止前写完队列中剩余的日志"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class JsonLineFormatter(logging.Formatter):
+    """(后台线程) 把事件记录编码为一行 JSON，见 _event_line"""
+
+    def format(self, record):
+        return _event_line(record.event_fields, record.event_values)
+
+
+_listener: Optional[BatchingQueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def setup_logging(log_file: str, event_file: Optional[str] = None, level: int = logging.INFO,
+                  fmt: str = '%(asctime)s - %(levelname)s - %(message)s'):
+    """
+    替换根 logger 的处理器：文本日志写入 log_file 与控制台，结构化事件 (log_payload / log_sql) 写入 event_file
+    所有写入都经由队列在后台线程完成
+    """
+    global _listener, _queue_handler
+    stop_logging()
+    formatter = logging.Formatter(fmt)
+    not_event = lambda r: r.name != EVENT_LOGGER
+    handlers: List[logging.Handler] = []
+    for handler in (logging.FileHandler(log_file, encoding='utf-8'), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        handler.addFilter(not_event)
+        handlers.append(handler)
+    if event_file:
+        handler = logging.FileHandler(event_file, encoding='utf-8')
+        handler.setFormatter(JsonLineFormatter())
+        handler.addFilter(lambda r: r.name == EVENT_LOGGER)
+        handlers.append(handler)
+
+    q = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(q)
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    event_logger.handlers = [_queue_handler]
+    event_logger.setLevel(logging.INFO if event_file else logging.CRITICAL + 1)
+
+    _listener = BatchingQueueListener(q, handlers)
+    _listener.start()
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def logging_stats() -> dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "batches": _listener.batches if _listener else 0,
+        "records": _listener.records if _listener else 0,
+    }
+
+
+# --- 结构化事件 (JSON-lines，可供回放工具读取) ---
+
+def _sampled(rate: float) -> bool:
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _event(event: str, values: List[Tuple[str, Any, int]], **fields):
+    """
+    每个事件一行：{"ts", "event", 其他字段..., 事件内容}
+    请求线程只把原始内容 (键, 值, 最大长度) 放入队列，编码与截断在后台线程完成
+    """
+    event_logger.info(event, extra={"event_fields": {"ts": round(time.time(), 3), "event": event, **fields},
+                                    "event_values": values})
+
+
+def _event_line(fields: dict, values: List[Tuple[str, Any, int]]) -> str:
+    """
+    每个值只编码一次：编码后不超过 max_chars 时原样写入 (回放时可直接使用)；
+    超过时写入截断后的文本，并标记 {key}_truncated 与原始长度 {key}_size
+    """
+    parts = [_encode(fields)[:-1]]
+    for key, value, max_chars in values:
+        text = value if isinstance(value, str) else _encode(value)
+        if len(text) <= max_chars:
+            # 非字符串的值已编码为 JSON，直接拼入
+            parts.append(f"{_encode(key)}:{_encode(value) if isinstance(value, str) else text}")
+        else:
+            parts.append(_encode({key: text[:max_chars], f"{key}_truncated": True, f"{key}_size": len(text)})[1:-1])
+    return ",".join(parts) + "}"
+
+
+def log_payload(event: str, payload: Any, **fields):
+    """按采样率记录请求体 (在后台线程编码，记录后调用方不应再修改 payload)"""
+    if not event_logger.isEnabledFor(logging.INFO) or not _sampled(LOG_PAYLOAD_SAMPLE_RATE):
+        return
+    _event(event, [("payload", payload, LOG_PAYLOAD_MAX_CHARS)], **fields)
+
+
+def log_sql(event: str, sql: str, params: Any = None, **fields):
+    """按采样率记录 SQL 与参数"""
+    if not event_logger.isEnabledFor(logging.INFO) or not _sampled(LOG_SQL_SAMPLE_RATE):
+        return
+    _event(event, [("sql", sql, LOG_SQL_MAX_CHARS), ("params", list(params or []), LOG_SQL_MAX_CHARS)], **fields)
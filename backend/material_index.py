@@ -0,0 +1,268 @@
+# material_index.py
+# 款号 -> 素材图索引：后台加载 ai_source_app_v1 中的图片素材，按名称建立字符 n-gram 倒排表，
+# 按 id 增量追加新素材并定期全量重建。搜索时按款号查字典，不再对素材表做 LIKE 扫描。
+# 配置共享目录时素材行由一个进程加载并发布为共享列式文件 (catalog_store)，其余进程从映射的文件追加。
+import time
+import logging
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, List, Callable, Iterable, Tuple
+
+from catalog_store import CatalogStore
+from ngram_index import _grams, _query_grams
+
+logger = logging.getLogger(__name__)
+
+
+def _image_entries(rows: Iterable[Dict]) -> Tuple[List[Tuple[str, str]], Optional[int]]:
+    """筛出有图片的素材，返回 ([(名称, 图片)], 最大 id)"""
+    entries = []
+    last_id = None
+    for row in rows:
+        row_id = row.get('id')
+        if row_id is not None and (last_id is None or row_id > last_id):
+            last_id = row_id
+        pic_url = row.get('pic_url')
+        if not pic_url or str(row.get('file_type') or '').lower() != 'image':
+            continue
+        # 直接使用原始路径，前端会负责拼接域名
+        entries.append((str(row.get('name') or ''), f"素材:{pic_url}"))
+    return entries, last_id
+
+
+class _ImageTable:
+    """素材名称、图片与名称 n-gram 倒排表；款号 -> 素材图在首次查询时计算，新增素材时同步更新"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.images: List[str] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.by_code: Dict[str, List[str]] = {}
+        # gram -> 以该 gram 登记的已缓存款号，新增素材只需检查与其名称共有 gram 的款号
+        self.code_anchors: Dict[str, List[str]] = {}
+
+    def add(self, entries: Iterable[Tuple[str, str]]):
+        for name, image in entries:
+            entry = len(self.names)
+            self.names.append(name)
+            self.images.append(image)
+            grams = set(_grams(name))
+            for g in grams:
+                self.postings.setdefault(g, []).append(entry)
+            for g in grams:
+                for code in self.code_anchors.get(g, ()):
+                    if code in name:
+                        self.by_code[code].append(image)
+
+    def lookup(self, code: str) -> List[str]:
+        """款号对应的素材图 (首次查询时计算并缓存)"""
+        images = self.by_code.get(code)
+        if images is None:
+            images = self.by_code[code] = self.match(code)
+            grams = _query_grams(code)
+            if grams:
+                # 匹配的素材名必然包含款号的每个 gram，以倒排表最短的 gram 登记，追加时检查的款号最少
+                anchor = min(grams, key=lambda g: len(self.postings.get(g, ())))
+                self.code_anchors.setdefault(anchor, []).append(code)
+        return images
+
+    def match(self, code: str) -> List[str]:
+        """在倒排表上求候选素材并校验子串"""
+        candidates = None
+        for g in sorted(_query_grams(code), key=lambda g: len(self.postings.get(g, ()))):
+            entries = self.postings.get(g)
+            if not entries:
+                return []
+            candidates = set(entries) if candidates is None else candidates.intersection(entries)
+            if not candidates:
+                return []
+        if candidates is None:
+            return []
+        return [self.images[i] for i in sorted(candidates) if code in self.names[i]]
+
+
+class MaterialImageIndex:
+    """
+    素材图索引，匹配规则与原 SQL 一致：图片类素材名包含款号 (区分大小写)，pic_url 为空的跳过
+    loader(after_id) 返回 id 大于 after_id 的素材 (至少含 id, name, file_type, pic_url)，按 id 升序；
+    after_id 为 None 时全量。加载到的行同时通过 on_load 回调提供给其他使用方 (如素材检索)
+    全量重建在锁外建立新表后整体替换，lookup 只在替换与少量追加时等待
+    store 不为空时：拿到发布锁的进程按上述规则加载，与已发布的行按 id 合并后发布新版本；
+    各进程每隔 poll_interval 映射新版本，on_load 回调收到整张映射表 (MappedTable)
+    """
+
+    def __init__(self, loader: Callable[[Optional[int]], List[Dict]], refresh_interval: float = 60,
+                 full_refresh_interval: float = 3600, store: Optional[CatalogStore] = None,
+                 poll_interval: float = 5):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.store = store
+        self.poll_interval = poll_interval
+        # 已映射的共享版本
+        self._version: Optional[int] = None
+        self._table = _ImageTable()
+        self._last_id: Optional[int] = None
+        self._ready = False
+        self._full_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[List[Dict], bool], None]] = []
+
+    def on_load(self, callback: Callable[[List[Dict], bool], None]):
+        """注册加载回调 callback(rows, full)；共享模式下 rows 为映射的整表，full 恒为真"""
+        self._listeners.append(callback)
+
+    def _notify(self, rows: List[Dict], full: bool):
+        for callback in self._listeners:
+            try:
+                callback(rows, full)
+            except Exception as e:
+                logger.error(f"Material load callback failed: {e}")
+
+    @property
+    def ready(self) -> bool:
+        """至少完成过一次全量加载"""
+        return self._ready
+
+    def _replace(self, entries: List[Tuple[str, str]], last_id: Optional[int], full_loaded_at: float):
+        """在锁外建立新表，再在锁内整体替换"""
+        table = _ImageTable()
+        table.add(entries)
+        with self._lock:
+            self._table = table
+            self._last_id = last_id
+            self._ready = True
+            self._full_loaded_at = full_loaded_at
+
+    def _extend(self, entries: List[Tuple[str, str]], last_id: Optional[int]):
+        """追加新增素材 (条目已在锁外准备好)"""
+        with self._lock:
+            self._table.add(entries)
+            if last_id is not None and (self._last_id is None or last_id > self._last_id):
+                self._last_id = last_id
+
+    def load_full(self):
+        """全量重建，失败时保留旧索引"""
+        start = time.time()
+        try:
+            rows = self.loader(None)
+        except Exception as e:
+            logger.error(f"Material image index load failed: {e}")
+            return
+        entries, last_id = _image_entries(rows)
+        self._replace(entries, last_id, time.time())
+        logger.info(f"Material image index loaded: {len(entries)} images in {time.time() - start:.2f}s")
+        self._notify(rows, True)
+
+    def load_incremental(self):
+        """只拉取 id 大于上次最大 id 的新素材"""
+        try:
+            rows = self.loader(self._last_id)
+        except Exception as e:
+            logger.error(f"Material image index incremental load failed: {e}")
+            return
+        if rows:
+            entries, last_id = _image_entries(rows)
+            self._extend(entries, last_id)
+            logger.info(f"Material image index appended {len(entries)} images")
+        # 没有新素材时也通知，监听方可借此同步删除 (如素材检索)
+        self._notify(rows, False)
+
+    def _publish(self):
+        """(持有发布锁时调用) 全量或增量加载，与已发布的行按 id 合并后发布；没有新素材时只更新检查时间"""
+        start = time.time()
+        table = self.store.open()
+        full = table is None or time.time() - table.meta['full_loaded_at'] >= self.full_refresh_interval
+        try:
+            rows = self.loader(None if full else table.meta['last_id'])
+        except Exception as e:
+            logger.error(f"Material image index load failed: {e}")
+            return
+        if not full:
+            if not rows:
+                self.store.touch()
+                return
+            merged = {r['id']: r for r in table.iter_rows(table.fields)}
+            for row in rows:
+                merged[row['id']] = row
+            rows = sorted(merged.values(), key=lambda r: r['id'])
+        fields = list(rows[0].keys()) if rows else []
+        meta = {"full_loaded_at": time.time() if full else table.meta['full_loaded_at'],
+                "last_id": rows[-1]['id'] if rows else None}
+        pointer = self.store.publish(rows, fields, {"id": np.array([r['id'] for r in rows], dtype=np.int64)}, meta)
+        logger.info(f"Material table v{pointer['version']} published: {len(rows)} rows in {time.time() - start:.2f}s")
+
+    def refresh_shared(self):
+        """必要时发布新版本；映射到新版本时，全量时间点相同则只追加新增的行，否则重建"""
+        try:
+            pointer = self.store.refresh(self._publish, self.refresh_interval)
+            if pointer is None or pointer['version'] == self._version:
+                return
+            table = self.store.open(pointer)
+        except Exception as e:
+            logger.error(f"Shared material table load failed: {e}")
+            return
+        full = table.meta['full_loaded_at'] != self._full_loaded_at
+        start = 0 if full or self._last_id is None else \
+            int(np.searchsorted(table.arrays['id'], self._last_id, side='right'))
+        entries, last_id = _image_entries(table.iter_rows(table.fields, start))
+        if full:
+            self._replace(entries, last_id, table.meta['full_loaded_at'])
+        else:
+            self._extend(entries, last_id)
+        self._version = table.version
+        count = len(entries)
+        logger.info(f"Material image index mapped v{table.version}: {'loaded' if full else 'appended'} {count} images")
+        self._notify(table, True)
+
+    def refresh(self):
+        """到达全量重建间隔时全量加载 (可感知删除与修改)，否则增量追加"""
+        if self.store is not None:
+            self.refresh_shared()
+        elif not self._ready or time.time() - self._full_loaded_at >= self.full_refresh_interval:
+            self.load_full()
+        else:
+            self.load_incremental()
+
+    def lookup(self, codes: Iterable[str]) -> Dict[str, List[str]]:
+        """批量获取款号对应的素材图 (保持素材 id 顺序)，没有素材的款号不出现在结果中"""
+        result = {}
+        with self._lock:
+            table = self._table
+            for code in codes:
+                code = str(code)
+                images = table.lookup(code)
+                if images:
+                    result[code] = list(images)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self._ready,
+                "images": len(self._table.images),
+                "cached_codes": len(self._table.by_code),
+                "last_id": self._last_id,
+                "full_loaded_at": self._full_loaded_at,
+                "shared_version": self._version,
+            }
+
+    def start(self):
+        """启动后台线程：立即全量加载一次，之后按间隔增量刷新"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self.refresh()
+                self._stop.wait(self.refresh_interval if self.store is None
+                                else min(self.poll_interval, self.refresh_interval))
+
+        self._thread = threading.Thread(target=run, name="material-image-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
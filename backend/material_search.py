@@ -0,0 +1,263 @@
+# material_search.py
+# 素材检索：ai_source_app_v1 中未删除的素材按 id 倒序建立内存快照，名称与标签各建 n-gram 倒排索引，
+# 文件类型预先拆分为掩码。一次索引求值同时得到精确总数与前 N 条，返回内容 (含域名改写) 在建立快照时已生成。
+# 增量加载的新素材追加为新的一段，删除在所在段上标记，不重建整个快照。
+import time
+import logging
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, List, Callable, Iterable, Tuple, Set
+
+from catalog_store import MappedTable
+from ngram_index import NgramIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _not_deleted(v: Any) -> bool:
+    """与 SQL is_delete = 0 一致 (NULL 不满足)"""
+    if v is None:
+        return False
+    try:
+        return float(v) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+# 追加的段超过该数量时整体重建快照
+MAX_SEGMENTS = 8
+
+
+class _Segment:
+    """一段素材 (行按 id 倒序)：名称 / 标签 n-gram 索引、文件类型掩码与返回内容"""
+
+    def __init__(self, rows: List[Dict], formatter: Callable[[Dict], Dict]):
+        self.size = len(rows)
+        self.table: Optional[MappedTable] = None
+        self.ids = np.array([r['id'] for r in rows], dtype=np.int64)
+        self.name_index = NgramIndex(r.get('name') for r in rows)
+        self.tags_index = NgramIndex(r.get('tags') for r in rows)
+        # 文件类型 (大小写不敏感) -> 行掩码
+        self.type_masks: Dict[str, np.ndarray] = {}
+        file_types = np.array([str(r.get('file_type') or '').lower() for r in rows], dtype=object)
+        for t in set(file_types):
+            self.type_masks[t] = file_types == t
+        self.payloads: List[Dict] = [formatter(r) for r in rows]
+
+    @classmethod
+    def from_table(cls, table: MappedTable, formatter: Callable[[Dict], Dict]) -> '_Segment':
+        """由共享素材表 (按 id 升序) 建立：只在本进程建立索引与掩码，返回内容在命中时才由映射的行生成"""
+        segment = cls.__new__(cls)
+        segment.table = table
+        segment.formatter = formatter
+        if table.size == 0:
+            segment.size = 0
+            segment.positions = segment.ids = np.empty(0, dtype=np.int64)
+            segment.name_index = segment.tags_index = NgramIndex([])
+            segment.type_masks = {}
+            return segment
+
+        deleted = table.columns['is_delete']
+        keep = np.array([_not_deleted(v) for v in deleted.values()] + [False], dtype=bool)[deleted.codes]
+        segment.positions = np.flatnonzero(keep)[::-1]
+        segment.size = len(segment.positions)
+        segment.ids = np.asarray(table.arrays['id'][segment.positions])
+        for field in ('name', 'tags'):
+            col = table.columns[field]
+            setattr(segment, f"{field}_index", NgramIndex.from_dictionary(col.values(), col.codes[segment.positions]))
+        # 文件类型按去重取值小写 (NULL 对应最后一项)，再映射回行
+        file_type = table.columns['file_type']
+        lowered = [str(v or '').lower() for v in file_type.values()] + ['']
+        file_types = np.array(lowered, dtype=object)[file_type.codes[segment.positions]]
+        segment.type_masks = {t: file_types == t for t in set(file_types)}
+        return segment
+
+    def match(self, keywords: List[str], file_type: Optional[str]) -> np.ndarray:
+        """任一关键词命中名称或标签 (关键词为空时不过滤)，file_type 为空或 all 时不按类型过滤"""
+        if keywords:
+            patterns = [f"%{kw}%" for kw in keywords]
+            mask = self.name_index.like(patterns, any_of=True) | self.tags_index.like(patterns, any_of=True)
+        else:
+            mask = np.ones(self.size, dtype=bool)
+        if file_type and file_type != 'all':
+            type_mask = self.type_masks.get(str(file_type).lower())
+            if type_mask is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= type_mask
+        return mask
+
+    def page_payloads(self, page: np.ndarray) -> List[Dict]:
+        if self.table is None:
+            return [self.payloads[i] for i in page]
+        return [self.formatter(r) for r in self.table.rows(self.positions[page], self.table.fields)]
+
+
+class MaterialSearchSnapshot:
+    """
+    只读素材快照，由若干段组成：后追加的段 id 更大，排在前面，整体按 id 倒序
+    增量加载只为新增素材建立一段，删除的素材在所在段上标记，不重建已有的段
+    """
+
+    def __init__(self, rows: Iterable[Dict], formatter: Callable[[Dict], Dict], version: int):
+        rows = sorted((r for r in rows if _not_deleted(r.get('is_delete'))),
+                      key=lambda r: r['id'], reverse=True)
+        self.version = version
+        self.formatter = formatter
+        self.segments: List[_Segment] = [_Segment(rows, formatter)]
+        # 各段的存活掩码，None 表示没有删除标记
+        self.live: List[Optional[np.ndarray]] = [None]
+
+    @classmethod
+    def from_table(cls, table: MappedTable, formatter: Callable[[Dict], Dict]) -> 'MaterialSearchSnapshot':
+        snapshot = cls.__new__(cls)
+        snapshot.version = table.version
+        snapshot.formatter = formatter
+        snapshot.segments = [_Segment.from_table(table, formatter)]
+        snapshot.live = [None]
+        return snapshot
+
+    @property
+    def size(self) -> int:
+        return sum(seg.size if live is None else int(live.sum()) for seg, live in zip(self.segments, self.live))
+
+    def _derive(self, segments: List[_Segment], live: List[Optional[np.ndarray]], version: int) -> 'MaterialSearchSnapshot':
+        snapshot = self.__class__.__new__(self.__class__)
+        snapshot.version = version
+        snapshot.formatter = self.formatter
+        snapshot.segments = segments
+        snapshot.live = live
+        return snapshot
+
+    def appended(self, rows: Iterable[Dict], version: int) -> 'MaterialSearchSnapshot':
+        """追加新素材 (id 均大于已有素材) 为新的一段，已删除的跳过"""
+        rows = sorted((r for r in rows if _not_deleted(r.get('is_delete'))),
+                      key=lambda r: r['id'], reverse=True)
+        if not rows:
+            return self._derive(self.segments, self.live, version)
+        return self._derive([_Segment(rows, self.formatter)] + self.segments, [None] + self.live, version)
+
+    def without(self, ids: Iterable[int], version: int) -> 'MaterialSearchSnapshot':
+        """在所在段上标记删除的素材"""
+        ids = np.fromiter(ids, dtype=np.int64)
+        live = []
+        for seg, mask in zip(self.segments, self.live):
+            hit = np.isin(seg.ids, ids)
+            if hit.any():
+                mask = ~hit if mask is None else mask & ~hit
+            live.append(mask)
+        return self._derive(self.segments, live, version)
+
+    def search(self, keywords: List[str], file_type: Optional[str], limit: int = 100,
+               before_id: Optional[int] = None) -> Tuple[List[Dict], int, Optional[int]]:
+        """
+        任一关键词命中名称或标签 (关键词为空时不过滤)，file_type 为空或 all 时不按类型过滤
+        before_id 为上一页最后一条的 id (续页)
+        返回 (按 id 倒序的前 limit 条, 总数, 还有更多结果时本页最后一条的 id)
+        """
+        total = 0
+        remaining = 0
+        pages: List[Tuple[_Segment, np.ndarray]] = []
+        taken = 0
+        for seg, live in zip(self.segments, self.live):
+            mask = seg.match(keywords, file_type)
+            if live is not None:
+                mask &= live
+            positions = np.flatnonzero(mask)
+            total += len(positions)
+            if before_id is not None:
+                # 行按 id 倒序排列，id 小于 before_id 的部分是连续的后缀
+                positions = positions[seg.ids[positions] < before_id]
+            remaining += len(positions)
+            if taken < limit and len(positions):
+                page = positions[:limit - taken]
+                pages.append((seg, page))
+                taken += len(page)
+        payloads = [p for seg, page in pages for p in seg.page_payloads(page)]
+        last_id = None
+        if remaining > limit:
+            seg, page = pages[-1]
+            last_id = int(seg.ids[page[-1]])
+        return payloads, total, last_id
+
+
+class MaterialSearchEngine:
+    """
+    维护素材行并在变化时更新快照；行数据由素材图索引的加载回调提供 (与其共用一次加载)
+    全量加载时替换全部行并重建；增量加载时新增素材追加为一段，
+    并按 live_ids() (当前未删除素材的 id) 标记已删除的素材，使删除在下一次增量刷新时即生效
+    """
+
+    def __init__(self, formatter: Callable[[Dict], Dict], live_ids: Optional[Callable[[], Iterable[int]]] = None):
+        self.formatter = formatter
+        self.live_ids = live_ids
+        self._rows: Dict[Any, Dict] = {}
+        self._snapshot: Optional[MaterialSearchSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[MaterialSearchSnapshot]:
+        """当前可用快照；尚未加载时返回 None，调用方应回退到数据库"""
+        return self._snapshot
+
+    def on_load(self, rows: List[Dict], full: bool):
+        start = time.time()
+        if isinstance(rows, MappedTable):
+            # 共享模式：直接在映射的素材表上建立快照，本进程不保留行数据
+            snapshot = MaterialSearchSnapshot.from_table(rows, self.formatter)
+            self._snapshot = snapshot
+            logger.info(f"Material search snapshot v{snapshot.version} mapped: {snapshot.size} items in {time.time() - start:.2f}s")
+            return
+        live = None
+        if not full and self.live_ids is not None:
+            try:
+                live = set(self.live_ids())
+            except Exception as e:
+                logger.error(f"Material live id query failed: {e}")
+        with self._lock:
+            current = self._snapshot
+            if full or current is None:
+                if full:
+                    self._rows = {}
+                for row in rows:
+                    self._rows[row['id']] = row
+                self._rebuild(start, "built")
+                return
+            self._update(current, rows, live, start)
+
+    def _rebuild(self, start: float, action: str):
+        """(持有锁时调用) 由全部行重建快照"""
+        self._version += 1
+        snapshot = MaterialSearchSnapshot(self._rows.values(), self.formatter, self._version)
+        self._snapshot = snapshot
+        logger.info(f"Material search snapshot v{snapshot.version} {action}: {snapshot.size} items in {time.time() - start:.2f}s")
+
+    def _update(self, current: MaterialSearchSnapshot, rows: List[Dict], live: Optional[Set[int]], start: float):
+        """(持有锁时调用) 增量更新：追加新素材、标记删除；已有素材被修改或恢复时重建"""
+        # 增量行的 id 大于已有的全部素材，已存在的 id 说明素材被修改
+        changed = any(row['id'] in self._rows for row in rows)
+        for row in rows:
+            self._rows[row['id']] = row
+        deleted = []
+        if live is not None:
+            for row_id, row in self._rows.items():
+                alive = _not_deleted(row.get('is_delete'))
+                if alive == (row_id in live):
+                    continue
+                # 只同步删除标记，其余字段在全量刷新时更新
+                self._rows[row_id] = {**row, 'is_delete': 0 if row_id in live else 1}
+                if alive:
+                    deleted.append(row_id)
+                else:
+                    changed = True
+        if changed or len(current.segments) >= MAX_SEGMENTS:
+            self._rebuild(start, "rebuilt")
+            return
+        if not rows and not deleted:
+            return
+        self._version += 1
+        snapshot = current.appended(rows, self._version)
+        if deleted:
+            snapshot = snapshot.without(deleted, self._version)
+        self._snapshot = snapshot
+        logger.info(f"Material search snapshot v{snapshot.version} updated: {len(rows)} added, {len(deleted)} deleted "
+                    f"in {time.time() - start:.2f}s")
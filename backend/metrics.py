@@ -0,0 +1,233 @@
+# metrics.py
+# 轻量指标：搜索流水线分阶段耗时直方图、各阶段输入/输出行数、连接池等待时间与缓存命中，
+# 以 Prometheus 文本格式导出。记录一次观测只做一次二分查找和几次加法，可常开。
+import time
+import bisect
+import threading
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterable
+
+# 耗时直方图的桶上界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INF_LABEL = 'le="+Inf"'
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(v: float) -> str:
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各桶计数 (非累计，最后一格为 +Inf), 总和, 次数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+        """各序列的次数、总和与分位数估计 (按桶上界)，供 JSON 形式的统计接口使用"""
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        result = {}
+        for labels, counts, total, count in items:
+            result[labels] = {
+                "count": count,
+                "sum": round(total, 6),
+                "p50": self._quantile(counts, count, 0.5),
+                "p95": self._quantile(counts, count, 0.95),
+                "p99": self._quantile(counts, count, 0.99),
+            }
+        return result
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> Optional[float]:
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            seen += c
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items())
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """指标注册表；collector 在导出时调用，用于把已有的 stats() (缓存、连接池) 转为指标"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'search_stage_seconds', 'Duration of each search pipeline stage in seconds', ('stage',))
+STAGE_ROWS_IN = REGISTRY.counter(
+    'search_stage_rows_in_total', 'Rows entering each search pipeline stage', ('stage',))
+STAGE_ROWS_OUT = REGISTRY.counter(
+    'search_stage_rows_out_total', 'Rows leaving each search pipeline stage', ('stage',))
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a database connection in seconds', ('pool',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'request_seconds', 'End-to-end handler duration in seconds', ('endpoint',))
+
+
+class stage:
+    """
+    记录一个阶段的耗时与行数：
+        with stage('filter', rows_in=len(rows)) as s:
+            ...
+            s.rows_out = len(filtered)
+    """
+    __slots__ = ('name', 'rows_in', 'rows_out', '_start')
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+
+    def __enter__(self) -> 'stage':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self._start, self.rows_in, self.rows_out)
+        return False
+
+
+def observe_stage(name: str, seconds: float, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+    STAGE_SECONDS.observe(seconds, name)
+    if rows_in is not None:
+        STAGE_ROWS_IN.inc(rows_in, name)
+    if rows_out is not None:
+        STAGE_ROWS_OUT.inc(rows_out, name)
+
+
+def cache_collector(caches: Dict[str, Callable[[], Dict[str, Any]]]) -> Callable[[], List[str]]:
+    """把各缓存 stats() 中的 hits / misses / entries 导出为指标"""
+    def collect() -> List[str]:
+        stats = {name: fn() for name, fn in caches.items()}
+        lines = []
+        for metric, key, kind, help in (
+            ('cache_hits_total', 'hits', 'counter', 'Cache hits'),
+            ('cache_misses_total', 'misses', 'counter', 'Cache misses'),
+            ('cache_entries', 'entries', 'gauge', 'Entries currently cached'),
+        ):
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+            for name, s in stats.items():
+                if key in s:
+                    lines.append(f'{metric}{{cache="{_escape(name)}"}} {_number(s[key])}')
+        return lines
+    return collect
+
+
+def gauge_collector(name: str, help: str, label: str,
+                    values: Callable[[], Dict[str, Dict[str, Any]]]) -> Callable[[], List[str]]:
+    """values() 返回 {标签值: {字段: 数值}}，每个字段导出为 name{label=..., field=...}"""
+    def collect() -> List[str]:
+        lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        for label_value, fields in values().items():
+            for field, v in fields.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    lines.append(f'{name}{{{label}="{_escape(label_value)}",field="{_escape(field)}"}} {_number(v)}')
+        return lines
+    return collect
+
+
+def stage_summary() -> Dict[str, Dict[str, Any]]:
+    """各阶段耗时分位数 (桶上界估计) 与行数，JSON 形式"""
+    rows_in, rows_out = STAGE_ROWS_IN.values(), STAGE_ROWS_OUT.values()
+    summary = {}
+    for labels, s in STAGE_SECONDS.snapshot().items():
+        s["rows_in"] = rows_in.get(labels, 0)
+        s["rows_out"] = rows_out.get(labels, 0)
+        summary[labels[0]] = s
+    return summary
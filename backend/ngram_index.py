@@ -0,0 +1,223 @@
+# ngram_index.py
+# 字符 n-gram 倒排索引：替代 LIKE '%kw%' 全表扫描。
+# 同一列中的相同取值只索引一次，子串 / OR (/) / AND (+ ,) 条件先在倒排表上求交集、并集，
+# 仅对候选取值做最终校验，再映射回行。
+import re
+import bisect
+import numpy as np
+from typing import Dict, Any, List, Iterable, Callable, Optional
+
+from catalog_store import StringArray, encode_strings
+
+GRAM_SIZE = 2  # 中文以二元组为主
+
+
+def _grams(text: str) -> Iterable[str]:
+    """文本中的全部一元组与二元组"""
+    for i in range(len(text)):
+        yield text[i]
+        if i + GRAM_SIZE <= len(text):
+            yield text[i:i + GRAM_SIZE]
+
+
+def _query_grams(literal: str) -> List[str]:
+    """查询片段用于检索的 gram：长度 >= 2 时只取二元组，否则取单字"""
+    if len(literal) < GRAM_SIZE:
+        return [literal] if literal else []
+    return list(dict.fromkeys(literal[i:i + GRAM_SIZE] for i in range(len(literal) - GRAM_SIZE + 1)))
+
+
+def like_to_matcher(pattern: str) -> Callable[[str], bool]:
+    """SQL LIKE 模式 (已小写) 转为匹配函数"""
+    body = pattern[1:-1] if len(pattern) >= 2 else ''
+    if pattern.startswith('%') and pattern.endswith('%') and '%' not in body and '_' not in body:
+        # 最常见的 %kw% 直接走子串判断
+        return lambda s: body in s
+    prefix = pattern[:-1]
+    if pattern.endswith('%') and '%' not in prefix and '_' not in prefix:
+        # kw% 前缀匹配
+        return lambda s: s.startswith(prefix)
+    regex = re.compile(''.join(
+        '.*' if ch == '%' else '.' if ch == '_' else re.escape(ch) for ch in pattern
+    ), re.S)
+    return lambda s: regex.fullmatch(s) is not None
+
+
+class _SortedLookup:
+    """字符串 -> 编号 (dict.get 接口)，在按字符串排序的编号上二分查找"""
+
+    def __init__(self, strings: StringArray, order: np.ndarray):
+        self._strings = strings
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i) -> str:
+        return self._strings[self._order[i]]
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        i = bisect.bisect_left(self, key)
+        if i < len(self._order) and self[i] == key:
+            return int(self._order[i])
+        return default
+
+
+class _Postings:
+    """gram -> 取值编号数组 (dict.get 接口)，有序 gram 表 + CSR 倒排表"""
+
+    def __init__(self, grams: np.ndarray, offsets: np.ndarray, ids: np.ndarray):
+        self._grams = grams
+        self._offsets = offsets
+        self._ids = ids
+
+    def get(self, gram: str, default: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        i = int(np.searchsorted(self._grams, gram))
+        if i < len(self._grams) and self._grams[i] == gram:
+            return self._ids[self._offsets[i]:self._offsets[i + 1]]
+        return default
+
+
+class NgramIndex:
+    """单列的 n-gram 倒排索引 (大小写不敏感，NULL 不参与匹配)"""
+
+    def __init__(self, values: Iterable[Any]):
+        unique: Dict[str, int] = {}
+        inverse = []
+        for v in values:
+            if v is None:
+                inverse.append(-1)
+                continue
+            s = str(v).lower()
+            inverse.append(unique.setdefault(s, len(unique)))
+        self._build(unique, np.asarray(inverse, dtype=np.int64))
+
+    @classmethod
+    def from_dictionary(cls, values: List[Any], codes: np.ndarray) -> 'NgramIndex':
+        """
+        由字典编码列建立：values 为去重后的取值 (不含 NULL)，codes 为每行的取值编号 (-1 为 NULL)
+        只处理去重取值；小写后没有合并的取值时直接使用 codes 作为行映射
+        """
+        unique: Dict[str, int] = {}
+        remap = np.empty(len(values) + 1, dtype=np.int64)
+        for i, v in enumerate(values):
+            remap[i] = unique.setdefault(str(v).lower(), len(unique))
+        remap[-1] = -1
+        index = cls.__new__(cls)
+        index._build(unique, codes if len(unique) == len(values) else remap[codes])
+        return index
+
+    def _build(self, unique: Dict[str, int], inverse: np.ndarray):
+        self.inverse = inverse
+        self.lookup = unique
+        self.strings: List[str] = list(unique.keys())
+
+        postings: Dict[str, List[int]] = {}
+        for uid, s in enumerate(self.strings):
+            for g in set(_grams(s)):
+                postings.setdefault(g, []).append(uid)
+        self.postings: Dict[str, np.ndarray] = {g: np.asarray(ids, dtype=np.int64) for g, ids in postings.items()}
+        self._finish()
+
+    def _finish(self):
+        self.unique_count = len(self.strings)
+        # 按编号取出候选取值 (映射的串表批量解码)
+        self._select: Callable[[np.ndarray], List[str]] = self.strings.take if isinstance(self.strings, StringArray) \
+            else (lambda ids: [self.strings[i] for i in ids])
+        self._empty = np.empty(0, dtype=np.int64)
+        self._all = np.arange(self.unique_count, dtype=np.int64)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为扁平数组 (共享列式文件)：取值串表、按字符串排序的编号、有序 gram 表与 CSR 倒排表、行映射"""
+        grams = sorted(self.postings)
+        posting_offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[g]) for g in grams], out=posting_offsets[1:])
+        posting_ids = np.concatenate([self.postings[g] for g in grams]) if grams else self._empty
+        offsets, blob = encode_strings(self.strings)
+        order = sorted(range(self.unique_count), key=self.strings.__getitem__)
+        return {
+            "offsets": offsets, "blob": blob, "order": np.asarray(order, dtype=np.int32),
+            "grams": np.array(grams, dtype=f"<U{GRAM_SIZE}"), "posting_offsets": posting_offsets,
+            "posting_ids": posting_ids.astype(np.int32), "inverse": self.inverse.astype(np.int32),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'NgramIndex':
+        """由 to_arrays 导出 (并映射) 的数组建立，不复制数据"""
+        index = cls.__new__(cls)
+        index.inverse = arrays["inverse"]
+        index.strings = StringArray(arrays["offsets"], arrays["blob"])
+        index.lookup = _SortedLookup(index.strings, arrays["order"])
+        index.postings = _Postings(arrays["grams"], arrays["posting_offsets"], arrays["posting_ids"])
+        index._finish()
+        return index
+
+    def _rows(self, unique_mask: np.ndarray) -> np.ndarray:
+        """取值级掩码映射为行级掩码 (NULL 行恒为 False)"""
+        padded = np.append(unique_mask, False)
+        return padded[self.inverse]
+
+    def candidates(self, pattern: str) -> np.ndarray:
+        """按 LIKE 模式中的字面片段求倒排表交集，得到候选取值编号"""
+        literals = [p for p in re.split(r'[%_]', pattern) if p]
+        result = None
+        for literal in literals:
+            for g in _query_grams(literal):
+                ids = self.postings.get(g)
+                if ids is None:
+                    return self._empty
+                result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+                if result.size == 0:
+                    return result
+        return self._all if result is None else result
+
+    def like_unique(self, pattern: str) -> np.ndarray:
+        """单个 LIKE 模式在取值上的匹配结果 (只校验候选取值)"""
+        pattern = pattern.lower()
+        mask = np.zeros(self.unique_count, dtype=bool)
+        matcher = like_to_matcher(pattern)
+        candidates = self.candidates(pattern)
+        for uid, s in zip(candidates, self._select(candidates)):
+            if matcher(s):
+                mask[uid] = True
+        return mask
+
+    def contains(self, literal: str) -> np.ndarray:
+        """字面子串匹配 (不解释 % 与 _ 通配符)，返回行级掩码"""
+        literal = literal.lower()
+        mask = np.zeros(self.unique_count, dtype=bool)
+        result = None
+        for g in _query_grams(literal):
+            ids = self.postings.get(g)
+            if ids is None:
+                return self._rows(mask)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        candidates = self._all if result is None else result
+        for uid, s in zip(candidates, self._select(candidates)):
+            if literal in s:
+                mask[uid] = True
+        return self._rows(mask)
+
+    def like(self, patterns: Iterable[str], any_of: bool) -> np.ndarray:
+        """多个 LIKE 模式按 OR (并集) / AND (交集) 组合，返回行级掩码"""
+        result = None
+        for p in patterns:
+            m = self.like_unique(p)
+            if result is None:
+                result = m
+            elif any_of:
+                result |= m
+            else:
+                result &= m
+        if result is None:
+            result = np.zeros(self.unique_count, dtype=bool)
+        return self._rows(result)
+
+    def equals(self, values: Iterable[Any]) -> np.ndarray:
+        """精确匹配 (IN / =)，返回行级掩码"""
+        mask = np.zeros(self.unique_count, dtype=bool)
+        for v in values:
+            uid = self.lookup.get(str(v).lower())
+            if uid is not None:
+                mask[uid] = True
+        return self._rows(mask)
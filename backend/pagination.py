@@ -0,0 +1,34 @@
+# pagination.py
+# 续页游标：把上一页最后一行的排序位置编码为不透明字符串，续页时从该位置之后继续，
+# 不再重新查询、排序前面的结果。游标与查询绑定 (查询指纹)，换了查询条件的游标会被拒绝。
+import json
+import base64
+import hashlib
+from typing import Dict, Any
+
+
+class CursorError(ValueError):
+    """游标无效、与查询不匹配或已过期"""
+
+
+def query_fingerprint(query: Any) -> str:
+    """查询指纹 (调用方负责先去掉游标本身)"""
+    text = json.dumps(query, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, **position: Any) -> str:
+    payload = json.dumps({"f": fingerprint, **position}, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: Any, fingerprint: str) -> Dict[str, Any]:
+    """解码并校验游标，返回编码时的位置信息"""
+    try:
+        token = str(token)
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+    except Exception:
+        raise CursorError("Invalid cursor")
+    if not isinstance(payload, dict) or payload.pop('f', None) != fingerprint:
+        raise CursorError("Cursor does not match query")
+    return payload
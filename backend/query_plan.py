@@ -0,0 +1,274 @@
+# query_plan.py
+# 查询计划：把归一化后的查询字典编译为可复用的计划对象 (SQL 文本、参数、Python 精细筛选谓词、排序函数)，
+# 并按查询结构与取值放入有界 LRU，Agent 反复发送的相同查询模板无需重复解析。
+import re
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from composition import compile_composition_query, elem_keyword_terms
+
+
+class ColumnFilter:
+    """
+    单列过滤条件，既可渲染为 SQL，也可在内存快照上求值
+    kind:
+        range   - values = (lo, hi)          -> col BETWEEN lo AND hi
+        compare - values = (op, target)      -> col op target
+        in      - values = (v1, v2, ...)     -> col IN (...) / col = v
+        like_any / like_all - values = 模式  -> (col LIKE a OR ...) / col LIKE a AND ...
+        elem    - values = (query_str,)      -> 成分名 LIKE 粗筛 (含别名展开)
+    """
+    __slots__ = ('column', 'kind', 'values')
+
+    def __init__(self, column: str, kind: str, values: Tuple):
+        self.column = column
+        self.kind = kind
+        self.values = values
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ColumnFilter) and \
+            (self.column, self.kind, self.values) == (other.column, other.kind, other.values)
+
+    def __hash__(self) -> int:
+        return hash((self.column, self.kind, self.values))
+
+    def sql(self) -> Tuple[str, List[Any]]:
+        column, values = self.column, self.values
+        if self.kind == 'range':
+            return f"{column} BETWEEN {values[0]} AND {values[1]}", []
+        if self.kind == 'compare':
+            return f"{column} {values[0]} {values[1]}", []
+        if self.kind == 'in':
+            if len(values) == 1:
+                return f"{column} = %s", list(values)
+            placeholders = ", ".join(["%s"] * len(values))
+            return f"{column} IN ({placeholders})", list(values)
+        if self.kind == 'like_any':
+            if len(values) == 1:
+                return f"{column} LIKE %s", list(values)
+            return f"({' OR '.join([f'{column} LIKE %s'] * len(values))})", list(values)
+        if self.kind == 'like_all':
+            return " AND ".join([f"{column} LIKE %s"] * len(values)), list(values)
+        if self.kind == 'elem':
+            query_str = values[0]
+            conditions = []
+            params = []
+            for variants in elem_keyword_terms(query_str):
+                if len(variants) == 1:
+                    conditions.append(f"{column} LIKE %s")
+                else:
+                    conditions.append(f"({' OR '.join([f'{column} LIKE %s'] * len(variants))})")
+                params.extend(f"%{v}%" for v in variants)
+            if '/' in query_str:
+                return f"({' OR '.join(conditions)})", params
+            return " AND ".join(conditions), params
+        raise ValueError(f"Unknown filter kind: {self.kind}")
+
+
+# --- 查询 DSL 解析 ---
+
+def resolve_sort(query: Dict[str, Any]) -> Any:
+    """排序字段：兼容 sort 和 sort_by，sort 存在时优先 (即使为空)，空值视为不指定"""
+    return query.get('sort', query.get('sort_by')) or None
+
+
+def resolve_mode(query: Dict[str, Any], default: Any = 1) -> Optional[str]:
+    """查询模式：未指定或为 None 时取 default (空字符串不是缺省值)"""
+    mode = query.get('mode')
+    if mode is None:
+        mode = default
+    return None if mode is None else str(mode)
+
+
+def parse_numeric_filter(column: str, query_str: Any) -> Optional[ColumnFilter]:
+    """数值条件：范围 "200-300" 或比较 ">50" / "<=100" 等"""
+    if not query_str: return None
+    clean_str = re.sub(r'[^\d\.\-<>=]', '', str(query_str))
+    range_match = re.match(r'^(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?)$', clean_str)
+    if range_match: return ColumnFilter(column, 'range', (range_match.group(1), range_match.group(2)))
+    compare_match = re.match(r'^(>=|<=|>|<|=)(\d+(?:\.\d+)?)$', clean_str)
+    if compare_match: return ColumnFilter(column, 'compare', (compare_match.group(1), compare_match.group(2)))
+    return None
+
+
+def parse_text_filter(column: str, query_val: Any) -> Optional[ColumnFilter]:
+    """
+    文本条件 (可由 SQL 完整表达的部分)
+    支持:
+    1. 字符串 (含 / 和 +)
+    2. 列表 (code_start 转为 IN，其他转为 OR)
+    既有 / 又有 + 的复杂逻辑返回 None，交给 Python 精细筛选
+    """
+    if not query_val: return None
+
+    if isinstance(query_val, list):
+        if column == 'code_start':
+            return ColumnFilter(column, 'in', tuple(str(i) for i in query_val))
+        query_val = "/".join(str(i) for i in query_val)
+
+    val = str(query_val).strip()
+    if not val: return None
+
+    # 简单的单个词 (无 /、+ 和 ,)；款号保持模糊匹配以支持 6228 与 6228A 等关联查询
+    if '/' not in val and '+' not in val and ',' not in val:
+        if column == 'code_start':
+            return ColumnFilter(column, 'in', (val,))
+        return ColumnFilter(column, 'like_all', (val if '%' in val else f"%{val}%",))
+
+    # OR 逻辑 (/)
+    if '/' in val and '+' not in val:
+        parts = [p.strip() for p in val.split('/') if p.strip()]
+        if not parts: return None
+        if column == 'code_start':
+            return ColumnFilter(column, 'in', tuple(parts))
+        return ColumnFilter(column, 'like_any', tuple(p if '%' in p else f"%{p}%" for p in parts))
+
+    # AND 逻辑 (+ 或 ,)
+    if ('+' in val or ',' in val) and '/' not in val:
+        parts = [p.strip() for p in re.split(r'[+,]', val) if p.strip()]
+        if not parts: return None
+        return ColumnFilter(column, 'like_all', tuple(p if '%' in p else f"%{p}%" for p in parts))
+
+    return None
+
+
+def parse_elem_filter(query_str: Any) -> Optional[ColumnFilter]:
+    """成分条件的 SQL 粗筛 (精确比例判断由成分谓词完成)"""
+    if not query_str or not elem_keyword_terms(query_str): return None
+    return ColumnFilter('elem', 'elem', (str(query_str),))
+
+
+def compile_text_predicate(column: str, query_str: Any) -> Callable[[Dict], bool]:
+    """文本精细筛选：'/' 分组为 OR，组内 + , ， 、 为 AND，大小写不敏感"""
+    if isinstance(query_str, list):
+        query_str = "/".join(str(i) for i in query_str)
+    groups = []
+    for group in str(query_str).lower().split('/'):
+        groups.append([c.strip() for c in re.split(r'[+,，、]', group) if c.strip()])
+
+    def predicate(row: Dict) -> bool:
+        target_text = str(row.get(column) or "").lower()
+        return any(all(c in target_text for c in conds) for conds in groups)
+    return predicate
+
+
+def compile_elem_predicate(query_str: Any) -> Callable[[Dict], bool]:
+    """成分精细筛选 (比例比较)"""
+    composition = compile_composition_query(str(query_str))
+    return lambda row: composition.match(row.get('elem'))
+
+
+def compile_soft_terms(soft_query: Dict[str, Any]) -> List[Tuple[str, List[str]]]:
+    """软指标关键词：按字段拆分为小写关键词列表"""
+    terms = []
+    for key, query_val in soft_query.items():
+        if not query_val: continue
+        if isinstance(query_val, list):
+            keywords = [str(i) for i in query_val]
+        else:
+            keywords = re.split(r'[/,，、+]', str(query_val))
+        keywords = [kw.strip().lower() for kw in keywords if kw.strip()]
+        if keywords:
+            terms.append((key, keywords))
+    return terms
+
+
+class QueryPlan:
+    """编译后的查询计划 (只读，可在线程间共享)"""
+
+    def __init__(self, **kwargs):
+        self.limit: int = kwargs['limit']
+        self.mode: str = kwargs['mode']
+        self.requested_fields: List[str] = kwargs['requested_fields']
+        self.required_fields: List[str] = kwargs['required_fields']
+        self.strict_query: Dict[str, Any] = kwargs['strict_query']
+        self.soft_query: Dict[str, Any] = kwargs['soft_query']
+        self.search_code: str = kwargs['search_code']
+        # SQL 可表达的过滤条件及渲染结果
+        self.filters: List[ColumnFilter] = kwargs['filters']
+        self.sql: str = kwargs['sql']
+        # 排序与分页可由数据库完成时的 SQL (含 ORDER BY ... LIMIT k)，否则为 None
+        self.pushdown_sql: Optional[str] = kwargs['pushdown_sql']
+        self.params: List[Any] = kwargs['params']
+        # Python 精细筛选：(字段, 谓词)，字段用于跳过已被快照精确求值的条件
+        self.predicates: List[Tuple[str, Callable[[Dict], bool]]] = kwargs['predicates']
+        # 排序：sort_field 为空时使用 sort_key 综合评分
+        self.sort_field: Optional[str] = kwargs['sort_field']
+        self.sort_reverse: bool = kwargs['sort_reverse']
+        self.sort_positive_only: bool = kwargs['sort_positive_only']
+        self.sort_key: Callable[[Dict], Tuple] = kwargs['sort_key']
+        self.soft_terms: List[Tuple[str, List[str]]] = kwargs['soft_terms']
+
+    def has_predicates(self, resolved_fields=()) -> bool:
+        return any(key not in resolved_fields for key, _ in self.predicates)
+
+    def row_filter(self, resolved_fields=()) -> Callable[[Dict], bool]:
+        """组合剩余的精细筛选谓词"""
+        predicates = [fn for key, fn in self.predicates if key not in resolved_fields]
+        if not predicates:
+            return lambda row: True
+        return lambda row: all(fn(row) for fn in predicates)
+
+
+def group_by_shared_filters(plans: List[QueryPlan], ignored=frozenset()) -> List[Tuple[List[int], List[ColumnFilter]]]:
+    """
+    批量查询分组：含有相同过滤条件的计划归为一组，返回 [(计划下标, 组内共享条件)]
+    ignored 中的宽泛条件 (如 mode=1 的默认条件) 不作为分组依据，但仍计入共享条件
+    """
+    groups: List[Tuple[List[int], set]] = []
+    for i, plan in enumerate(plans):
+        own = set(plan.filters)
+        for members, shared in groups:
+            if (shared & own) - ignored:
+                members.append(i)
+                shared &= own
+                break
+        else:
+            groups.append(([i], own))
+    # 共享条件保持第一个计划中的顺序，保证生成的 SQL 稳定
+    return [(members, [f for f in plans[members[0]].filters if f in shared]) for members, shared in groups]
+
+
+def plan_cache_key(query: Dict[str, Any], ignored=('title', 'cursor')) -> str:
+    """按查询结构与取值生成缓存键 (忽略不影响执行的字段)"""
+    return json.dumps({k: v for k, v in query.items() if k not in ignored},
+                      sort_keys=True, ensure_ascii=False, default=str)
+
+
+class PlanCache:
+    """有界 LRU 查询计划缓存"""
+
+    def __init__(self, compiler: Callable[[Dict[str, Any]], QueryPlan], maxsize: int = 512):
+        self.compiler = compiler
+        self.maxsize = maxsize
+        self._plans: 'OrderedDict[str, QueryPlan]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: Dict[str, Any]) -> QueryPlan:
+        key = plan_cache_key(query)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        plan = self.compiler(query)
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._plans), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,123 @@
+# ranking.py
+# 排序阶段：有界 Top-K 选择替代全量排序。
+# 系列分与年销量这类只与产品有关的静态分量在快照加载时预先算好，
+# 每次查询只计算款号匹配分与软指标命中数这两个动态分量。
+import heapq
+import numpy as np
+from typing import Dict, Any, List, Callable, Optional
+
+# 款号开头 -> 系列分 (越小越靠前)
+SERIES_SCORES = {'6': 1, '9': 2, '3': 4, '2': 5}
+DEFAULT_SERIES_SCORE = 6
+
+
+def series_score(code: str) -> int:
+    return SERIES_SCORES.get(code[:1], DEFAULT_SERIES_SCORE)
+
+
+def by_code(rows: List[Dict]) -> List[Dict]:
+    """按款号排列行：排序键相同的行按款号先后，数据库路径与快照路径 (行号即款号顺序) 的结果顺序一致"""
+    return sorted(rows, key=lambda r: str(r.get('code') or ''))
+
+
+def top_k_rows(rows: List[Dict], k: int, key: Callable[[Dict], Any], reverse: bool = False) -> List[Dict]:
+    """等价于 sorted(rows, key=key, reverse=reverse)[:k]，但只维护大小为 k 的堆"""
+    if k >= len(rows):
+        return sorted(rows, key=key, reverse=reverse)
+    if reverse:
+        return heapq.nlargest(k, rows, key=key)
+    return heapq.nsmallest(k, rows, key=key)
+
+
+def top_k_order(keys: np.ndarray, k: int) -> np.ndarray:
+    """
+    返回 keys 中最小的 k 个元素的位置 (升序；相同键保持原有先后顺序)
+    先用 partition 找到第 k 小的阈值，只对阈值以内的元素做稳定排序
+    """
+    n = len(keys)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if n > k:
+        kth = np.partition(keys, k - 1)[k - 1]
+        selected = np.flatnonzero(keys <= kth)
+    else:
+        selected = np.arange(n)
+    order = selected[np.argsort(keys[selected], kind='stable')]
+    return order[:k]
+
+
+def static_rank(codes: np.ndarray, sales: np.ndarray) -> np.ndarray:
+    """
+    按 (系列分, -年销量) 计算每个产品的稠密名次，静态分量相同的产品名次相同
+    sales 中的 NaN 视为 0
+    """
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    series = np.fromiter((series_score(str(c if c is not None else '')) for c in codes), dtype=np.int64, count=n)
+    neg_sales = -np.nan_to_num(sales, nan=0.0)
+    order = np.lexsort((neg_sales, series))
+    s_sorted, v_sorted = series[order], neg_sales[order]
+    changed = np.empty(n, dtype=bool)
+    changed[0] = False
+    changed[1:] = (s_sorted[1:] != s_sorted[:-1]) | (v_sorted[1:] != v_sorted[:-1])
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.cumsum(changed)
+    return ranks
+
+
+def clean_search_code(search_code: str) -> str:
+    return search_code.strip().replace('%', '') if search_code else ''
+
+
+def match_scores(codes: np.ndarray, search_code: str) -> Optional[np.ndarray]:
+    """款号匹配分：完全一致 0，前缀 1，包含 2，否则 10 (区分大小写，与 make_sort_key 一致)"""
+    clean_search = clean_search_code(search_code)
+    if not clean_search:
+        return None
+
+    def score(code) -> int:
+        code = str(code if code is not None else '')
+        if code == clean_search: return 0
+        if code.startswith(clean_search): return 1
+        if clean_search in code: return 2
+        return 10
+    return np.fromiter((score(c) for c in codes), dtype=np.int64, count=len(codes))
+
+
+def default_keys(snapshot, indices: np.ndarray, search_code: str, soft_terms: List) -> np.ndarray:
+    """
+    默认综合评分 (款号匹配, 软指标, 系列, -销量) 压缩为单个整数键，越小越靠前
+    软指标命中数通过 n-gram 索引按关键词整列求值
+    """
+    static = snapshot.static_rank[indices]
+    width = int(snapshot.static_rank.max()) + 1 if snapshot.size else 1
+
+    soft_total = sum(len(keywords) for _, keywords in soft_terms)
+    soft = np.zeros(len(indices), dtype=np.int64)
+    for key, keywords in soft_terms:
+        if key not in snapshot.field_set: continue
+        index = snapshot.text_index(key)
+        for kw in keywords:
+            soft += index.contains(kw)[indices]
+
+    # 没有款号检索词时不必取出款号列 (共享快照中需逐个解码)
+    matches = match_scores(snapshot.columns['code'][indices], search_code) if clean_search_code(search_code) else None
+    if matches is None:
+        matches = np.full(len(indices), 10, dtype=np.int64)
+
+    return (matches * (soft_total + 1) + (soft_total - soft)) * width + static
+
+
+def numeric_keys(values: np.ndarray, indices: np.ndarray, reverse: bool) -> np.ndarray:
+    """数值列排序键 (NaN 视为 0；降序时取负)，越小越靠前"""
+    keys = np.nan_to_num(values[indices], nan=0.0)
+    return -keys if reverse else keys
+
+
+def after_position(keys: np.ndarray, indices: np.ndarray, key: Any, index: int) -> np.ndarray:
+    """
+    排序位置在 (key, index) 之后的元素掩码
+    Top-K 对相同键保持行号升序，因此 (键, 行号) 构成全序，可作为续页位置
+    """
+    return (keys > key) | ((keys == key) & (indices > index))
@@ -0,0 +1,141 @@
+# result_cache.py
+# 搜索结果缓存：等价查询归一化为同一个键，带 TTL、按字节预算的 LRU 淘汰、命中统计与显式失效。
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from query_plan import resolve_sort, resolve_mode
+
+# 不影响查询结果的字段
+IGNORED_QUERY_KEYS = {'title'}
+# 由 resolve_sort / resolve_mode 解析后写入键的字段
+RESOLVED_QUERY_KEYS = {'sort', 'sort_by', 'mode'}
+
+
+def _canonical_value(v: Any) -> Any:
+    """取值归一化：去除首尾空白，'/' 分隔的 OR 列表与数组排序"""
+    if isinstance(v, str):
+        v = v.strip()
+        if '/' in v:
+            v = "/".join(sorted(p.strip() for p in v.split('/') if p.strip()))
+        return v
+    if isinstance(v, (list, tuple)):
+        # 数组中的空白项保留 (如 code_start 的 IN 条件)，只排序
+        return sorted(str(i).strip() for i in v)
+    return v
+
+
+def canonical_query(query: Dict[str, Any], default_mode: Any = 1) -> Dict[str, Any]:
+    """
+    查询归一化，与查询计划读取查询的方式一致 (等价查询同键，结果不同的查询不同键)：
+    1. 忽略 title 及空值 (None / 空字符串 / 空数组)
+    2. 排序与模式按 resolve_sort / resolve_mode 解析：sort 优先于 sort_by，mode 缺省时为 default_mode
+    3. 取值去空白，'/' 列表与数组排序
+    """
+    result = {}
+    for k, v in query.items():
+        if k in IGNORED_QUERY_KEYS or k in RESOLVED_QUERY_KEYS or v is None: continue
+        v = _canonical_value(v)
+        if v == '' or v == []: continue
+        result[k] = v
+    sort = resolve_sort(query)
+    if sort:
+        result['sort_by'] = _canonical_value(sort)
+    mode = resolve_mode(query, default_mode)
+    if mode is not None:
+        result['mode'] = mode
+    return result
+
+
+def canonical_key(query: Dict[str, Any], default_mode: Any = 1) -> str:
+    return json.dumps(canonical_query(query, default_mode), sort_keys=True, ensure_ascii=False, default=str)
+
+
+def estimate_size(value: Any) -> int:
+    """按 JSON 编码后的字节数估算缓存占用"""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class TTLCache:
+    """带 TTL 与字节预算的线程安全 LRU 缓存"""
+
+    def __init__(self, ttl: float = 60, max_bytes: int = 64 * 1024 * 1024,
+                 sizeof: Callable[[Any], int] = estimate_size):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._items: 'OrderedDict[Any, Tuple[float, int, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = item
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Any, value: Any):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._items:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def _remove(self, key: Any):
+        _, size, _ = self._items.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, predicate: Optional[Callable[[Any], bool]] = None) -> int:
+        """显式失效：不传参数时清空全部，否则删除 predicate(key) 为真的条目，返回删除条数"""
+        with self._lock:
+            if predicate is None:
+                count = len(self._items)
+                self._items.clear()
+                self.bytes = 0
+                return count
+            keys = [k for k in self._items if predicate(k)]
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SearchResultCache(TTLCache):
+    """product_search 结果缓存，键为 canonical_key 归一化后的查询"""
@@ -0,0 +1,142 @@
+# scheduler.py
+# 按请求类别 (search / detail / source / auth) 的准入控制：每类有独立的并发上限、有界等待队列与线程池，
+# 重查询排满时不会挤占轻量请求；队列已满或排队超时立即拒绝 (Overloaded -> 503 + Retry-After)。
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from metrics import REGISTRY
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'request_queue_wait_seconds', 'Time spent waiting for admission in seconds', ('request_class',))
+
+# 当前请求所属类别，供 run_blocking 选择线程池
+current_class: contextvars.ContextVar[Optional['RequestClass']] = contextvars.ContextVar('request_class', default=None)
+
+
+class Overloaded(Exception):
+    """请求类别过载 (队列已满或排队超时)"""
+
+    def __init__(self, request_class: str, reason: str, retry_after: int):
+        super().__init__(f"{request_class} overloaded: {reason}")
+        self.request_class = request_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RequestClass:
+    def __init__(self, name: str, concurrency: int, queue_size: int, threads: int,
+                 queue_timeout: float = 10, retry_after: int = 1):
+        """
+        concurrency: 同时处理的请求数
+        queue_size: 等待准入的请求数上限，超出时立即拒绝
+        threads: 该类别专用线程池大小 (快照检索等 CPU 工作)
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"{name}-worker")
+        self.threads = threads
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._queued = 0
+        self._counters = {"admitted": 0, "rejected": 0, "timeouts": 0}
+
+    async def acquire(self):
+        """等待准入；过载时抛出 Overloaded"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked() and self._queued >= self.queue_size:
+            self._counters["rejected"] += 1
+            raise Overloaded(self.name, "queue full", self.retry_after)
+        start = time.perf_counter()
+        self._queued += 1
+        # 不用 wait_for：Python < 3.12 中超时与获取同时发生时，已获得的名额会随 TimeoutError 丢失
+        waiter = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        finally:
+            self._queued -= 1
+        if not waiter.done():
+            self._abandon(waiter)
+            self._counters["timeouts"] += 1
+            raise Overloaded(self.name, "queue timeout", self.retry_after)
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, self.name)
+        self._active += 1
+        self._counters["admitted"] += 1
+
+    def _abandon(self, waiter: asyncio.Future):
+        """放弃等待：已获得名额时归还，否则取消等待"""
+        if waiter.done():
+            if not waiter.cancelled() and waiter.exception() is None:
+                self._semaphore.release()
+        else:
+            waiter.cancel()
+
+    def release(self):
+        self._active -= 1
+        self._semaphore.release()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "threads": self.threads,
+            **self._counters,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_blocking(fn: Callable, *args) -> Any:
+    """在当前请求类别的线程池中执行同步函数；不在任何类别中时使用 Starlette 的默认线程池"""
+    request_class = current_class.get()
+    if request_class is None:
+        return await run_in_threadpool(fn, *args)
+    return await request_class.run(fn, *args)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI 中间件：按路径把请求归入类别并做准入控制，应用处理完毕 (含流式响应发送完毕) 后释放名额
+    routes: 路径 -> 类别名；不在其中的路径不受限制
+    """
+
+    def __init__(self, app, classes: Dict[str, RequestClass], routes: Dict[str, str]):
+        self.app = app
+        self.classes = classes
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        request_class = self.classes.get(self.routes.get(scope.get("path"))) if scope["type"] == "http" else None
+        if request_class is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await request_class.acquire()
+        except Overloaded as e:
+            response = JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        token = current_class.set(request_class)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_class.reset(token)
+            request_class.release()
@@ -0,0 +1,163 @@
+# serializer.py
+# 行序列化：按结果形态 (字段列表 + 各列类型) 编译一次转换函数，序列化与字段裁剪一次完成；
+# 响应体使用 orjson 直接编码为字节 (未安装时回退到标准库 json)。
+import json
+import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Any, List, Callable, Iterable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def _url_items(v: Any) -> List[str]:
+    """URL 列表 (支持字符串和列表格式)"""
+    if isinstance(v, str) and v:
+        return [item.strip().replace('`', '') for item in v.split(',') if item.strip()]
+    if isinstance(v, list):
+        return [str(item).strip().replace('`', '') for item in v]
+    return []
+
+
+def convert_image_urls(v: Any) -> Any:
+    """图片列表中只保留图片类型 (过滤 PDF)；根据数量返回字符串或列表"""
+    final_imgs = []
+    for item in _url_items(v):
+        path_part = item.split(':')[-1].split('?')[0].lower()
+        if path_part.endswith('.pdf'):
+            continue
+        # 图片以及其他未知类型暂留
+        final_imgs.append(item)
+    if not final_imgs:
+        return []
+    return final_imgs if len(final_imgs) > 1 else final_imgs[0]
+
+
+def convert_report_urls(v: Any) -> List[str]:
+    """报告字段统一返回列表"""
+    return _url_items(v)
+
+
+def _decimal(v: Any) -> Any:
+    return float(v) if isinstance(v, Decimal) else v
+
+
+def _date(v: Any) -> Any:
+    return str(v) if isinstance(v, (datetime.date, datetime.datetime)) else v
+
+
+def _bytes(v: Any) -> Any:
+    return v.decode('utf-8', errors='ignore') if isinstance(v, bytes) else v
+
+
+def convert_value(key: str, v: Any) -> Any:
+    """单个取值的通用转换：Decimal -> float, Date -> str, bytes -> str, 处理 URL 列表"""
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return str(v)
+    if isinstance(v, bytes):
+        return v.decode('utf-8', errors='ignore')
+    if key == 'image_urls':
+        return convert_image_urls(v)
+    if key == 'report_urls':
+        return convert_report_urls(v)
+    return v
+
+
+def column_kind(value: Any) -> str:
+    """列类型：decimal / date / bytes / plain"""
+    if isinstance(value, Decimal): return 'decimal'
+    if isinstance(value, (datetime.date, datetime.datetime)): return 'date'
+    if isinstance(value, bytes): return 'bytes'
+    return 'plain'
+
+
+def infer_kinds(rows: List[Dict], fields: Iterable[str]) -> Tuple[str, ...]:
+    """按每列第一个非空值确定列类型 (同一列的取值来自同一数据库类型)"""
+    kinds = []
+    for f in fields:
+        kind = 'plain'
+        for row in rows:
+            v = row.get(f)
+            if v is not None:
+                kind = column_kind(v)
+                break
+        kinds.append(kind)
+    return tuple(kinds)
+
+
+def _converter(field: str, kind: str, max_items: Optional[int]) -> Optional[Callable[[Any], Any]]:
+    """单列转换函数，无需转换时返回 None"""
+    if kind == 'decimal': return _decimal
+    if kind == 'date': return _date
+    if kind == 'bytes': return _bytes
+    if field == 'image_urls':
+        if max_items is None: return convert_image_urls
+        def capped_images(v):
+            v = convert_image_urls(v)
+            return v[:max_items] if isinstance(v, list) else v
+        return capped_images
+    if field == 'report_urls':
+        if max_items is None: return convert_report_urls
+        return lambda v: convert_report_urls(v)[:max_items]
+    return None
+
+
+class RowSerializer:
+    """针对一种结果形态编译的序列化器：只遍历需要输出的列，每列一个确定的转换函数"""
+
+    def __init__(self, fields: Tuple[str, ...], kinds: Tuple[str, ...], max_items: Optional[int] = None):
+        self.fields = fields
+        converters = [(f, _converter(f, k, max_items)) for f, k in zip(fields, kinds)]
+        self.converted = [(f, convert) for f, convert in converters if convert is not None]
+
+    def __call__(self, row: Dict) -> Dict:
+        out = {f: row[f] for f in self.fields}
+        for f, convert in self.converted:
+            out[f] = convert(out[f])
+        return out
+
+
+@lru_cache(maxsize=256)
+def compile_serializer(fields: Tuple[str, ...], kinds: Tuple[str, ...], max_items: Optional[int] = None) -> RowSerializer:
+    return RowSerializer(fields, kinds, max_items)
+
+
+def serialize_rows(rows: List[Dict], requested_fields: Iterable[str], max_items: Optional[int] = None) -> List[Dict]:
+    """
+    序列化并裁剪字段 (输出字段顺序与行中字段顺序一致)
+    max_items: 图片与报告列表的最大条数
+    """
+    if not rows:
+        return []
+    requested = set(requested_fields)
+    fields = tuple(k for k in rows[0] if k in requested)
+    serializer = compile_serializer(fields, infer_kinds(rows, fields), max_items)
+    return [serializer(row) for row in rows]
+
+
+def _default(v: Any) -> Any:
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, bytes):
+        return v.decode('utf-8', errors='ignore')
+    return str(v)
+
+
+def dumps(content: Any) -> bytes:
+    """编码为 JSON 字节 (UTF-8，紧凑格式)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode('utf-8')
+
+
+def columnar(rows: List[Dict]) -> Tuple[List[str], List[List[Any]]]:
+    """列式结构：表头只出现一次，每行为与表头对应的取值列表"""
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    return columns, [[row.get(c) for c in columns] for row in rows]
@@ -0,0 +1,89 @@
+# singleflight.py
+# 进行中请求合并：同一个键 (归一化后的查询、款号等) 的并发调用只执行一次，其余调用等待并共享结果。
+# 只合并同时进行中的调用，完成后即移除，结果的复用由各自的缓存负责。
+import asyncio
+from typing import Dict, Any, Optional, Callable, Awaitable, Hashable
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        # 每个进行中的键上正在等待的调用数
+        self._waiters: Dict[Hashable, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def lead(self, key: Hashable) -> asyncio.Future:
+        """登记为该键的执行者，完成后必须调用 resolve 或 abandon"""
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.executions += 1
+        return future
+
+    def _pop(self, key: Hashable, future: asyncio.Future) -> bool:
+        """移除自己登记的执行 (该键可能已由其他执行者重新登记)"""
+        if self._flights.get(key) is not future:
+            return False
+        del self._flights[key]
+        return not future.done()
+
+    def resolve(self, key: Hashable, future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        if not self._pop(key, future):
+            return
+        if error is not None:
+            future.set_exception(error)
+            # 没有等待者时避免 "exception was never retrieved"
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def abandon(self, key: Hashable, future: asyncio.Future):
+        """执行者放弃 (如被取消)：等待者改为自行执行；已 resolve 的执行不受影响"""
+        if self._pop(key, future):
+            future.cancel()
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """该键已在执行时等待其结果，否则自己执行"""
+        while True:
+            future = self._flights.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            waiters = self._waiters[key] = self._waiters.get(key, 0) + 1
+            self.max_waiters = max(self.max_waiters, waiters)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 执行者放弃时重新竞争执行；自身被取消时照常抛出
+                if not future.cancelled():
+                    raise
+            finally:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    del self._waiters[key]
+
+        future = self.lead(key)
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            self.abandon(key, future)
+            raise
+        except Exception as e:
+            self.resolve(key, future, error=e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "waiting": sum(self._waiters.values()),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "max_waiters": self.max_waiters,
+        }
@@ -1,4 +1,4 @@
-import requests
+import httpx
 import json
 import time
 
@@ -12,7 +12,7 @@ def run_test(case_id, title, payload):
     
     try:
         start_time = time.time()
-        response = requests.post(BASE_URL, json=payload)
+        response = httpx.post(BASE_URL, json=payload, timeout=None)
         duration = time.time() - start_time
         
         if response.status_code == 200:
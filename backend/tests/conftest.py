@@ -0,0 +1,62 @@
+# conftest.py
+# 测试夹具：用 bench_data 生成小规模 SQLite 替身库 (db_standin)，导入 fastapi_server 前通过 DB_STANDIN 指向它。
+# 不触发 startup 事件，目录快照与素材图索引由夹具按需加载，不启动后台刷新线程。
+import os
+import sys
+import asyncio
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_PRODUCTS = 3000
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """使用替身库的 fastapi_server 模块 (文本日志写在临时目录，不写事件日志)"""
+    from bench_data import build_database
+    directory = tmp_path_factory.mktemp("standin")
+    path = str(directory / "products.db")
+    build_database(path, TEST_PRODUCTS)
+    os.environ["DB_STANDIN"] = path
+    os.environ["LOG_EVENT_FILE"] = ""
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import fastapi_server
+    finally:
+        os.chdir(cwd)
+    yield fastapi_server
+    # 日志在后台线程写出，在 pytest 关闭输出捕获之前停止
+    from logs import stop_logging
+    stop_logging()
+
+
+def unload(server):
+    """回到数据库路径：丢弃目录快照，素材图改为按 SQL 查询"""
+    server.catalog_engine._snapshot = None
+    server.material_index._ready = False
+
+
+@pytest.fixture
+def database(server):
+    """不加载快照，查询全部走数据库"""
+    unload(server)
+    yield server
+
+
+@pytest.fixture
+def catalog(server):
+    """加载目录快照与素材图索引，用完回到数据库路径"""
+    server.catalog_engine.load()
+    server.material_index.load_full()
+    yield server
+    unload(server)
+
+
+def run_searches(server, queries):
+    """逐个执行 perform_single_search (不经过结果缓存)"""
+    async def run_all():
+        return [await server.perform_single_search(dict(q)) for q in queries]
+    return asyncio.run(run_all())
@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+
+from catalog import CatalogEngine
+from catalog_store import CatalogStore
+
+FIELDS = ["code", "name", "price", "elem"]
+
+
+class Loader:
+    """模拟数据库：记录全量加载次数"""
+
+    def __init__(self, size):
+        self.calls = 0
+        self.rows = [{"code": f"{6000 + i}", "name": f"卫衣{i % 7}", "price": float(i % 50) or None,
+                      "elem": "棉95% 氨纶5%" if i % 2 else "涤纶100%"} for i in range(size)]
+
+    def __call__(self, fields):
+        self.calls += 1
+        return [{f: r.get(f) for f in fields} for r in self.rows]
+
+
+def make_engine(directory, loader):
+    engine = CatalogEngine(loader=loader, fields=FIELDS, numeric_fields={"price"}, index_fields={"name"},
+                           refresh_interval=3600, store=CatalogStore(str(directory), "product"))
+    swaps = []
+    engine.on_refresh(swaps.append)
+    return engine, swaps
+
+
+def all_rows(snapshot):
+    return snapshot.rows(np.arange(snapshot.size), FIELDS)
+
+
+def test_second_engine_maps_published_version(tmp_path):
+    loader = Loader(200)
+    first, _ = make_engine(tmp_path, loader)
+    published = first.load()
+    assert published.version == 1 and loader.calls == 1
+    pointer = json.loads((tmp_path / "product.current").read_text())
+    assert pointer["version"] == 1 and os.path.isdir(tmp_path / pointer["path"])
+
+    # 同一目录上的第二个进程直接映射已发布的版本，不访问数据库
+    second, _ = make_engine(tmp_path, loader)
+    mapped = second.load()
+    assert loader.calls == 1
+    assert mapped.version == published.version
+    assert all_rows(mapped) == all_rows(published) == loader(FIELDS)
+    assert second.stats() == {"ready": True, "version": 1, "rows": 200, "shared": True}
+
+
+def test_pointer_swap_is_picked_up_without_reloading_unchanged_version(tmp_path):
+    loader = Loader(50)
+    first, _ = make_engine(tmp_path, loader)
+    second, swaps = make_engine(tmp_path, loader)
+    first.load()
+    v1 = second.load()
+
+    # 版本未变化时保留已映射的快照
+    assert second.load() is v1 and len(swaps) == 1
+
+    # 发布进程写出新版本并切换指针
+    loader.rows = loader.rows[:30]
+    with first.store.publishing(blocking=True):
+        first._publish()
+    v2 = second.load()
+    assert v2.version == 2 and v2.size == 30 and len(swaps) == 2
+    assert all_rows(v2) == loader(FIELDS)
+    assert second.load() is v2 and len(swaps) == 2
+    # 旧快照仍可读 (仍在使用旧版本的请求不受影响)
+    assert v1.size == 50 and all_rows(v1)[0]["code"] == "6000"
+
+
+def test_old_versions_are_pruned(tmp_path):
+    loader = Loader(10)
+    engine, _ = make_engine(tmp_path, loader)
+    engine.load()
+    for _ in range(3):
+        with engine.store.publishing(blocking=True):
+            engine._publish()
+    versions = sorted(e for e in os.listdir(tmp_path) if e.startswith("product-v"))
+    assert versions == ["product-v3", "product-v4"]
+    assert engine.load().version == 4
+
+
+def test_stale_version_is_republished_by_lock_holder(tmp_path):
+    loader = Loader(10)
+    engine, _ = make_engine(tmp_path, loader)
+    engine.load()
+    engine.refresh_interval = 0
+    assert engine.load().version == 2 and loader.calls == 2
+
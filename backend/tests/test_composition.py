@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from composition import CompositionIndex
+
+ELEMS = ["棉95% 氨纶5%", "涤纶100%", "天丝60% 棉40%", None, "粘纤50% 涤纶50%"]
+
+
+def expected(terms):
+    return np.array([any(t in str(e or "").lower() for t in terms) for e in ELEMS])
+
+
+def test_contains_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(CompositionIndex, "CONTAINS_CACHE_SIZE", 4)
+    index = CompositionIndex(ELEMS)
+    queries = [[t] for t in ("棉", "涤", "天丝", "粘", "氨纶", "麻")] + [["棉", "麻"]]
+    for terms in queries * 3:
+        assert (index.contains_any(terms)[index.inverse] == expected(terms)).all()
+        assert len(index._contains) <= 4
+    # 最近使用的条目保留
+    assert list(index._contains)[-1] == ("棉", "麻")
+
+
+def test_contains_concurrent_queries():
+    index = CompositionIndex(ELEMS * 200)
+    queries = [[f"{t}{i % 7}"] for i, t in enumerate(["棉", "涤纶"] * 100)] + [["棉"], ["涤纶"]] * 100
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(index.contains_any, queries))
+    for terms, mask in zip(queries, results):
+        assert (mask[index.inverse] == np.tile(expected(terms), 200)).all()
+    assert len(index._contains) <= CompositionIndex.CONTAINS_CACHE_SIZE
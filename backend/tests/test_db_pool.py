@@ -0,0 +1,182 @@
+import threading
+import time
+
+import pytest
+
+from db_pool import ManagedPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise ConnectionError("server has gone away")
+
+    def rollback(self):
+        if not self.alive:
+            raise ConnectionError("server has gone away")
+        self.rollbacks += 1
+
+    def cursor(self):
+        return "cursor"
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDriver:
+    """模拟 pymysql：记录建立的连接，可设置为连接失败"""
+
+    def __init__(self):
+        self.connections = []
+        self.kwargs = []
+        self.fail = False
+
+    def connect(self, **kwargs):
+        if self.fail:
+            raise ConnectionError("can't connect")
+        self.kwargs.append(kwargs)
+        self.connections.append(FakeConnection(len(self.connections) + 1))
+        return self.connections[-1]
+
+
+def borrow_in_thread(pool):
+    """在另一个线程借出连接 (不归还)，返回线程与借到的连接"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pool.connection()))
+    thread.start()
+    return thread, result
+
+
+def test_connects_lazily_and_reuses_connections():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=2, max_size=4, host="db", port=3306)
+    assert driver.connections == []
+
+    with pool.connection() as conn:
+        assert conn.cursor() == "cursor" and conn.number == 1
+    with pool.connection() as conn:
+        assert conn.number == 1
+    assert len(driver.connections) == 1
+    assert driver.kwargs == [{"host": "db", "port": 3306}]
+    # 归还前结束未提交的事务
+    assert driver.connections[0].rollbacks == 2
+
+
+def test_stats():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, name="test", min_size=1, max_size=3)
+    conn = pool.connection()
+    assert pool.stats() == {"size": 1, "used": 1, "free": 0, "limit": 1, "minsize": 1, "maxsize": 3,
+                            "created": 1, "closed": 0, "health_failures": 0, "connect_errors": 0,
+                            "waits": 0, "timeouts": 0, "grown": 0, "shrunk": 0}
+    conn.close()
+    conn.close()
+    stats = pool.stats()
+    assert (stats["used"], stats["free"]) == (0, 1)
+
+
+def test_limit_grows_when_callers_wait():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=1, max_size=2, grow_wait=0.01, acquire_timeout=5)
+    held = pool.connection()
+    thread, borrowed = borrow_in_thread(pool)
+    thread.join(2)
+    assert borrowed and borrowed[0].number == 2
+    stats = pool.stats()
+    assert (stats["limit"], stats["grown"], stats["waits"], stats["created"]) == (2, 1, 1, 2)
+
+    # 已达 max_size 时不再扩容，等待超时后抛出 PoolTimeoutError
+    pool.acquire_timeout = 0.05
+    with pytest.raises(PoolTimeoutError):
+        pool.connection()
+    assert pool.stats()["limit"] == 2 and pool.stats()["timeouts"] == 1
+    held.close()
+    borrowed[0].close()
+
+
+def test_idle_connections_and_limit_shrink():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=1, max_size=4, grow_wait=0.01, idle_timeout=0.1)
+    first = pool.connection()
+    thread, borrowed = borrow_in_thread(pool)
+    thread.join(2)
+    first.close()
+    borrowed[0].close()
+    assert pool.stats()["limit"] == 2 and pool.stats()["free"] == 2
+
+    time.sleep(0.15)
+    # 归还时关闭空闲过久的连接 (保留 min_size 个)，并收回容量上限
+    pool.connection().close()
+    stats = pool.stats()
+    assert (stats["size"], stats["free"], stats["limit"], stats["closed"], stats["shrunk"]) == (1, 1, 1, 1, 1)
+    assert [c.closed for c in driver.connections] == [True, False]
+
+
+def test_health_check_replaces_dead_connection():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=1, max_size=2, health_check_interval=0)
+    pool.connection().close()
+    driver.connections[0].alive = False
+
+    with pool.connection() as conn:
+        assert conn.number == 2
+    assert driver.connections[0].closed
+    stats = pool.stats()
+    assert (stats["health_failures"], stats["closed"], stats["created"], stats["size"]) == (1, 1, 2, 1)
+
+
+def test_recently_returned_connection_skips_ping():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, health_check_interval=60)
+    pool.connection().close()
+    driver.connections[0].ping = None  # 调用即失败
+    with pool.connection() as conn:
+        assert conn.number == 1
+
+
+def test_failed_rollback_discards_connection():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=1, max_size=1)
+    conn = pool.connection()
+    driver.connections[0].alive = False
+    conn.close()
+    assert pool.stats()["size"] == 0 and driver.connections[0].closed
+    # 空出的名额可以重新建立连接
+    with pool.connection() as conn:
+        assert conn.number == 2
+
+
+def test_connect_error_frees_reservation():
+    driver = FakeDriver()
+    driver.fail = True
+    pool = ManagedPool(driver, min_size=1, max_size=1, acquire_timeout=0.05)
+    with pytest.raises(ConnectionError):
+        pool.connection()
+    assert pool.stats()["connect_errors"] == 1 and pool.stats()["size"] == 0
+    driver.fail = False
+    with pool.connection() as conn:
+        assert conn.number == 1
+
+
+def test_warmup_opens_idle_connections():
+    driver = FakeDriver()
+    pool = ManagedPool(driver, min_size=1, max_size=10)
+    pool.start_warmup(3).join(2)
+    stats = pool.stats()
+    assert (stats["size"], stats["free"], stats["limit"], stats["created"]) == (3, 3, 3, 3)
+    assert pool.start_warmup(0) is None
+    pool.close()
+    assert pool.stats()["free"] == 0 and all(c.closed for c in driver.connections)
+
+    # 数据库不可用时只记录警告
+    failing = FakeDriver()
+    failing.fail = True
+    pool = ManagedPool(failing, max_size=10)
+    pool.warmup(3)
+    assert pool.stats()["size"] == 0 and pool.stats()["connect_errors"] == 1
@@ -0,0 +1,81 @@
+import json
+import logging
+import queue
+
+import pytest
+
+import logs
+
+
+class Counted:
+    """记录被编码 (str) 的次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "counted"
+
+
+@pytest.fixture
+def events(tmp_path, monkeypatch):
+    """把事件 logger 接到独立的队列与事件文件，返回 (停止写入并读出各行, 队列)"""
+    q = queue.Queue()
+    handler = logging.FileHandler(tmp_path / "events.jsonl", encoding="utf-8")
+    handler.setFormatter(logs.JsonLineFormatter())
+    listener = logs.BatchingQueueListener(q, [handler], flush_interval=0.01)
+    monkeypatch.setattr(logs.event_logger, "handlers", [logs.DroppingQueueHandler(q)])
+    level = logs.event_logger.level
+    logs.event_logger.setLevel(logging.INFO)
+
+    def read():
+        listener.start()
+        listener.stop()
+        handler.close()
+        return [json.loads(line) for line in (tmp_path / "events.jsonl").read_text(encoding="utf-8").splitlines()]
+
+    yield read, q
+    logs.event_logger.setLevel(level)
+    listener.stop()
+    handler.close()
+
+
+def test_payload_is_encoded_once_in_writer(events):
+    read, q = events
+    value = Counted()
+    logs.log_payload("product_search", {"code": "6228", "obj": value}, worker=1)
+    # 请求线程上只入队原始内容
+    assert value.calls == 0 and q.qsize() == 1
+    [line] = read()
+    assert value.calls == 1
+    assert line.pop("ts") > 0
+    assert line == {"event": "product_search", "worker": 1, "payload": {"code": "6228", "obj": "counted"}}
+
+
+def test_long_payload_and_sql_are_truncated(events, monkeypatch):
+    read, _ = events
+    monkeypatch.setattr(logs, "LOG_PAYLOAD_MAX_CHARS", 20)
+    monkeypatch.setattr(logs, "LOG_SQL_MAX_CHARS", 10)
+    payload = {"name": "卫衣" * 20}
+    logs.log_payload("product_search", payload)
+    logs.log_payload("product_search", {"a": 1})
+    logs.log_sql("search_sql", "SELECT code FROM ai_product_app_v1", ("6%", "x" * 20))
+    long_payload, short_payload, sql = read()
+
+    text = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    assert long_payload["payload"] == text[:20]
+    assert long_payload["payload_truncated"] is True and long_payload["payload_size"] == len(text)
+    assert short_payload["payload"] == {"a": 1} and "payload_truncated" not in short_payload
+    assert sql["sql"] == "SELECT cod" and sql["sql_size"] == 34
+    assert sql["params"] == '["6%","xxx' and sql["params_truncated"] is True
+
+
+def test_disabled_events_are_not_queued(events, monkeypatch):
+    _, q = events
+    logs.event_logger.setLevel(logging.CRITICAL + 1)
+    logs.log_payload("product_search", {"a": 1})
+    logs.event_logger.setLevel(logging.INFO)
+    monkeypatch.setattr(logs, "LOG_SQL_SAMPLE_RATE", 0)
+    logs.log_sql("search_sql", "SELECT 1")
+    assert q.qsize() == 0
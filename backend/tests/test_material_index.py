@@ -0,0 +1,41 @@
+import random
+
+from material_index import MaterialImageIndex, _ImageTable
+
+CODES = ["6228", "6228A", "62", "9", "A", "33787", "卫衣", ""]
+
+
+def make_entries(rng, start, count):
+    parts = ["6228", "6228A", "62", "933", "33787", "卫衣", "新品", "_", "A"]
+    return [(f"{rng.choice(parts)}{rng.choice(parts)}{i}", f"素材:/p/{i}.jpg") for i in range(start, start + count)]
+
+
+def test_cached_codes_follow_appended_entries():
+    rng = random.Random(5)
+    entries = make_entries(rng, 0, 300)
+    table = _ImageTable()
+    table.add(entries)
+    for code in CODES:
+        table.lookup(code)
+
+    for step in range(5):
+        batch = make_entries(rng, len(entries), rng.choice([0, 1, 40]))
+        entries += batch
+        table.add(batch)
+        fresh = _ImageTable()
+        fresh.add(entries)
+        for code in CODES:
+            assert table.lookup(code) == fresh.match(code), (step, code)
+
+
+def test_incremental_load_updates_looked_up_codes():
+    rows = [{"id": i, "name": f"6228A_{i}", "file_type": "image", "pic_url": f"/p/{i}.jpg"} for i in range(3)]
+    added = [{"id": 3, "name": "新品6228", "file_type": "image", "pic_url": "/p/3.jpg"},
+             {"id": 4, "name": "6327", "file_type": "IMAGE", "pic_url": "/p/4.jpg"},
+             {"id": 5, "name": "6228视频", "file_type": "video", "pic_url": "/p/5.jpg"}]
+    index = MaterialImageIndex(loader=lambda after_id: rows if after_id is None else [r for r in added if r["id"] > after_id])
+    index.load_full()
+    assert index.lookup(["6228", "6327"]) == {"6228": ["素材:/p/0.jpg", "素材:/p/1.jpg", "素材:/p/2.jpg"]}
+    index.load_incremental()
+    assert index.lookup(["6228", "6327"]) == {"6228": ["素材:/p/0.jpg", "素材:/p/1.jpg", "素材:/p/2.jpg", "素材:/p/3.jpg"],
+                                              "6327": ["素材:/p/4.jpg"]}
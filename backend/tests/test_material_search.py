@@ -0,0 +1,93 @@
+import random
+
+import material_search
+from material_search import MaterialSearchEngine, MaterialSearchSnapshot
+
+WORDS = ['春季', '卫衣', '新品', '6228', '6327', '图', 'A']
+TYPES = ['image', 'video', 'IMAGE', None]
+
+
+def make_row(i, rng):
+    return {"id": i, "name": f"{rng.choice(WORDS)}{rng.choice(WORDS)}_{i}", "tags": rng.choice(WORDS),
+            "file_type": rng.choice(TYPES), "pic_url": f"/p/{i}.jpg", "video_path": None,
+            "is_delete": rng.choice([0, 0, 0, 1])}
+
+
+def formatter(row):
+    return {"id": row["id"], "name": row["name"]}
+
+
+def assert_same_results(snapshot, rows):
+    """与由当前全部行重新建立的快照逐个查询比较 (含续页)"""
+    expected = MaterialSearchSnapshot(rows, formatter, 0)
+    assert snapshot.size == expected.size
+    for keywords in ([], ['春季'], ['卫衣', '62'], ['_1'], ['不存在']):
+        for file_type in (None, 'all', 'image', 'video', 'doc'):
+            before_id = None
+            while True:
+                result = snapshot.search(keywords, file_type, 7, before_id)
+                assert result == expected.search(keywords, file_type, 7, before_id)
+                before_id = result[2]
+                if before_id is None:
+                    break
+
+
+def test_incremental_load_appends_and_marks_deletes():
+    rng = random.Random(1)
+    rows = {i: make_row(i, rng) for i in range(300)}
+    live = {i for i, r in rows.items() if r["is_delete"] == 0}
+    engine = MaterialSearchEngine(formatter, live_ids=lambda: live)
+    engine.on_load(list(rows.values()), True)
+
+    for step in range(3):
+        added = [make_row(i, rng) for i in range(300 + step * 20, 320 + step * 20)]
+        for row in added:
+            rows[row["id"]] = row
+            if row["is_delete"] == 0:
+                live.add(row["id"])
+        # 删除若干已有素材 (包括刚追加的)
+        for row_id in rng.sample(sorted(live), 5):
+            live.discard(row_id)
+            rows[row_id] = {**rows[row_id], "is_delete": 1}
+        engine.on_load(added, False)
+        assert len(engine.current().segments) == step + 2
+        assert_same_results(engine.current(), rows.values())
+
+    # 没有新素材时也同步删除
+    row_id = max(live)
+    live.discard(row_id)
+    rows[row_id] = {**rows[row_id], "is_delete": 1}
+    engine.on_load([], False)
+    assert_same_results(engine.current(), rows.values())
+
+
+def test_restored_material_rebuilds_snapshot():
+    rng = random.Random(2)
+    rows = {i: make_row(i, rng) for i in range(200)}
+    live = {i for i, r in rows.items() if r["is_delete"] == 0}
+    engine = MaterialSearchEngine(formatter, live_ids=lambda: live)
+    engine.on_load(list(rows.values()), True)
+    rows[200] = {**make_row(200, rng), "is_delete": 0}
+    live.add(200)
+    engine.on_load([rows[200]], False)
+    assert len(engine.current().segments) == 2
+
+    row_id = next(i for i, r in rows.items() if r["is_delete"] == 1)
+    live.add(row_id)
+    rows[row_id] = {**rows[row_id], "is_delete": 0}
+    engine.on_load([], False)
+    assert len(engine.current().segments) == 1
+    assert_same_results(engine.current(), rows.values())
+
+
+def test_segments_are_compacted():
+    rng = random.Random(3)
+    rows = [make_row(i, rng) for i in range(100)]
+    engine = MaterialSearchEngine(formatter)
+    engine.on_load(rows, True)
+    for i in range(100, 100 + material_search.MAX_SEGMENTS + 2):
+        row = {**make_row(i, rng), "is_delete": 0}
+        rows.append(row)
+        engine.on_load([row], False)
+        assert len(engine.current().segments) <= material_search.MAX_SEGMENTS
+    assert_same_results(engine.current(), rows)
@@ -0,0 +1,91 @@
+from fastapi.testclient import TestClient
+
+
+def search(server, body):
+    return TestClient(server.app).post('/api/product_search', json=body).json()
+
+
+def test_cursor_continues_to_next_page(catalog):
+    first = search(catalog, {"code_start": "6", "limit": 5})
+    assert first["next_cursor"]
+    second = search(catalog, {"code_start": "6", "limit": 5, "cursor": first["next_cursor"]})
+    assert "error" not in second
+    assert second["total"] == first["total"]
+    assert not {r["code"] for r in first["list"]} & {r["code"] for r in second["list"]}
+
+
+def test_cursor_from_other_query_returns_error(catalog):
+    first = search(catalog, {"code_start": "6", "limit": 5})
+    other = search(catalog, {"code_start": "9", "limit": 5, "cursor": first["next_cursor"]})
+    assert other["error"] == "Cursor does not match query"
+    assert other["total"] == 0 and other["list"] == []
+
+
+def test_malformed_cursor_returns_error(catalog):
+    result = search(catalog, {"code_start": "6", "cursor": "not-a-cursor"})
+    assert result["error"] == "Invalid cursor"
+
+
+def test_cursor_error_in_list_input(catalog):
+    results = search(catalog, [{"code_start": "6", "limit": 5}, {"code_start": "6", "cursor": "not-a-cursor"}])
+    assert "error" not in results[0]
+    assert results[1]["error"] == "Invalid cursor"
+
+
+def test_cursor_without_snapshot_returns_error(catalog):
+    first = search(catalog, {"code_start": "3", "limit": 5})
+    catalog.catalog_engine._snapshot = None
+    result = search(catalog, {"code_start": "3", "limit": 5, "cursor": first["next_cursor"]})
+    assert result["error"].startswith("Cursor expired")
+
+
+def test_cursor_survives_reload_of_same_content(catalog):
+    first = search(catalog, {"code_start": "6", "limit": 5, "title": "reload"})
+    # 另一个 worker (加载次数不同) 加载到相同数据时快照版本相同
+    other = catalog.CatalogEngine(loader=catalog.load_catalog_rows, fields=catalog.catalog_engine.fields,
+                                  numeric_fields=catalog.NUMERIC_FIELDS, index_fields=catalog.STRICT_TEXT_FIELDS)
+    for _ in range(2):
+        other.load()
+    assert other.current().version == catalog.catalog_engine.load().version
+    second = search(catalog, {"code_start": "6", "limit": 5, "cursor": first["next_cursor"]})
+    assert "error" not in second and len(second["list"]) == 5
+
+
+def test_cursor_expires_when_content_changes(catalog, monkeypatch):
+    first = search(catalog, {"code_start": "6", "limit": 5, "title": "changed"})
+    loader = catalog.catalog_engine.loader
+    monkeypatch.setattr(catalog.catalog_engine, "loader", lambda fields: loader(fields)[1:])
+    catalog.catalog_engine.load()
+    result = search(catalog, {"code_start": "6", "limit": 5, "cursor": first["next_cursor"]})
+    assert result["error"] == "Cursor expired, catalog has been refreshed"
+
+
+def test_database_path_marks_cursor_unsupported(database):
+    # 下推到 SQL 的查询与需要 Python 排序的查询
+    for query in ({"code_start": "6", "limit": 5}, {"code": "62", "limit": 5}):
+        result = search(database, {**query, "title": "db"})
+        assert len(result["list"]) == 5
+        assert result.get("cursor_unsupported") is True and "next_cursor" not in result
+    # 没有更多结果时不标记
+    result = search(database, {"code": "62", "limit": 100, "title": "db"})
+    assert len(result["list"]) < 100 and "cursor_unsupported" not in result
+
+
+def test_source_cursor_on_database_path_matches_snapshot(catalog, monkeypatch):
+    client = TestClient(catalog.app)
+
+    def pages():
+        body, pages = {"keywords": "", "type": "all"}, []
+        while True:
+            page = client.post('/api/search_source', json=body).json()
+            pages.append((page["total"], page["list"]))
+            if not page.get("next_cursor"):
+                return pages
+            body = {**body, "cursor": page["next_cursor"]}
+
+    snapshot_pages = pages()
+    monkeypatch.setattr(catalog.material_search, "_snapshot", None)
+    database_pages = pages()
+    assert len(database_pages) > 1
+    assert database_pages[0][0] == snapshot_pages[0][0]
+    assert [items for _, items in database_pages] == [items for _, items in snapshot_pages]
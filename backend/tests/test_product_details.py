@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+
+def test_failed_load_does_not_leak_waits(server, monkeypatch):
+    async def failing_load(codes):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(server, "load_product_details", failing_load)
+
+    async def main():
+        # "LEAK-A" 正由其他请求查询，本次只查询 "LEAK-B"
+        other = server.detail_flight.lead("LEAK-A")
+        try:
+            with pytest.raises(RuntimeError):
+                await server.fetch_product_details(["LEAK-A", "LEAK-B"])
+            # 等待 LEAK-A 的任务已回收，不会在事件循环关闭时被销毁
+            return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        finally:
+            server.detail_flight.abandon("LEAK-A", other)
+
+    assert asyncio.run(main()) == []
+    assert not server.detail_flight.in_flight("LEAK-B")
@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import run_searches
+from result_cache import canonical_key
+
+
+def test_equivalent_queries_share_key():
+    assert canonical_key({"elem": " 棉 / 天丝 ", "title": "a"}) == canonical_key({"elem": "天丝/棉", "title": "b"})
+    assert canonical_key({"code_start": [9, 6]}) == canonical_key({"code_start": ["6", "9"]})
+    assert canonical_key({"sort": "price"}) == canonical_key({"sort_by": "price"})
+    assert canonical_key({}) == canonical_key({"mode": None}) == canonical_key({"mode": 1}) == canonical_key({"mode": "1"})
+
+
+def test_empty_mode_is_not_default_mode():
+    # mode 缺省为 1 (带模式过滤)，空字符串则关闭模式过滤
+    assert canonical_key({"code_start": "1", "mode": ""}) != canonical_key({"code_start": "1"})
+
+
+def test_empty_sort_overrides_sort_by():
+    # sort 存在时优先，即使为空也不回退到 sort_by
+    assert canonical_key({"sort": None, "sort_by": "price"}) == canonical_key({})
+    assert canonical_key({"sort": "", "sort_by": "price"}) != canonical_key({"sort_by": "price"})
+
+
+def test_blank_list_items_are_kept():
+    assert canonical_key({"code_start": [" "]}) != canonical_key({})
+
+
+def test_mcp_default_mode():
+    # MCP 服务的 mode 缺省时不做模式过滤
+    assert canonical_key({}, default_mode=None) != canonical_key({"mode": 1}, default_mode=None)
+    assert canonical_key({}, default_mode=None) == canonical_key({"mode": None}, default_mode=None)
+
+
+@pytest.mark.parametrize("queries", [
+    [{"code_start": "1"}, {"code_start": "1", "mode": ""}],
+    [{"code_start": "6", "sort_by": "price"}, {"code_start": "6", "sort": None, "sort_by": "price"}],
+    [{"code_start": "6", "sort_by": "price"}, {"code_start": "6", "sort": "", "sort_by": "price"}],
+])
+def test_cached_results_match_uncached(database, queries):
+    database.result_cache.invalidate()
+    client = TestClient(database.app)
+    expected = [(r["total"], [row["code"] for row in r["list"]]) for r in run_searches(database, queries)]
+    # 两个查询的结果确实不同
+    assert expected[0] != expected[1]
+    for query, result in zip(queries, expected):
+        cached = client.post('/api/product_search', json=query).json()
+        assert (cached["total"], [row["code"] for row in cached["list"]]) == result
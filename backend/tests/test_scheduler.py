@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from scheduler import RequestClass, AdmissionMiddleware
+
+
+def make_app(request_class):
+    app = FastAPI()
+    gate = asyncio.Event()
+
+    @app.get("/slow")
+    async def slow():
+        await gate.wait()
+        return {"ok": True}
+
+    @app.get("/free")
+    async def free():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, classes={"search": request_class}, routes={"/slow": "search"})
+    return app, gate
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queue_full_is_rejected_with_retry_after():
+    request_class = RequestClass("search", concurrency=1, queue_size=1, threads=1, retry_after=3)
+
+    async def main():
+        app, gate = make_app(request_class)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            running = asyncio.ensure_future(client.get("/slow"))
+            await settle()
+            queued = asyncio.ensure_future(client.get("/slow"))
+            await settle()
+            assert request_class.stats()["active"] == 1 and request_class.stats()["queued"] == 1
+            rejected = await client.get("/slow")
+            # 不受限的路径不受影响
+            free = await client.get("/free")
+            gate.set()
+            return rejected, free, await running, await queued
+
+    rejected, free, running, queued = asyncio.run(main())
+    assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "3"
+    assert "queue full" in rejected.json()["detail"]
+    assert free.status_code == running.status_code == queued.status_code == 200
+    stats = request_class.stats()
+    assert (stats["admitted"], stats["rejected"], stats["active"], stats["queued"]) == (2, 1, 0, 0)
+
+
+def test_queue_timeout_is_rejected_with_retry_after():
+    request_class = RequestClass("search", concurrency=1, queue_size=5, threads=1, queue_timeout=0.05)
+
+    async def main():
+        app, gate = make_app(request_class)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            running = asyncio.ensure_future(client.get("/slow"))
+            await settle()
+            timed_out = await client.get("/slow")
+            gate.set()
+            await running
+            # 超时的请求没有占用名额
+            return timed_out, await client.get("/slow")
+
+    timed_out, after = asyncio.run(main())
+    assert timed_out.status_code == 503 and timed_out.headers["Retry-After"] == "1"
+    assert "queue timeout" in timed_out.json()["detail"]
+    assert after.status_code == 200
+    stats = request_class.stats()
+    assert (stats["timeouts"], stats["admitted"], stats["active"], stats["queued"]) == (1, 2, 0, 0)
+
+
+def test_timeout_racing_with_release_does_not_leak_permits():
+    request_class = RequestClass("search", concurrency=2, queue_size=100, threads=1, queue_timeout=0.002)
+
+    async def holder():
+        await request_class.acquire()
+        # 在等待者超时的同一时刻前后释放名额
+        await asyncio.sleep(0.002)
+        request_class.release()
+
+    async def waiter():
+        try:
+            await request_class.acquire()
+        except Exception:
+            return
+        await asyncio.sleep(0)
+        request_class.release()
+
+    async def main():
+        for _ in range(200):
+            await asyncio.gather(holder(), holder(), *[waiter() for _ in range(4)])
+        # 全部名额都可再次获得
+        for _ in range(request_class.concurrency):
+            await asyncio.wait_for(request_class.acquire(), 1)
+
+    asyncio.run(main())
+    assert request_class.stats()["active"] == request_class.concurrency
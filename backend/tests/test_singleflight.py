@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Compute:
+    """记录执行次数，执行期间挂起直到 release"""
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.gate = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight("test")
+
+    async def main():
+        compute, other = Compute({"total": 1}), Compute({"total": 2})
+        calls = [asyncio.ensure_future(flight.do("a", compute)) for _ in range(10)]
+        calls.append(asyncio.ensure_future(flight.do("b", other)))
+        await settle()
+        assert flight.stats()["in_flight"] == 2 and flight.stats()["waiting"] == 9
+        compute.gate.set()
+        other.gate.set()
+        results = await asyncio.gather(*calls)
+        return compute, other, results
+
+    compute, other, results = asyncio.run(main())
+    assert compute.calls == 1 and other.calls == 1
+    assert results == [{"total": 1}] * 10 + [{"total": 2}]
+    assert flight.stats() == {"in_flight": 0, "waiting": 0, "executions": 2, "coalesced": 9, "max_waiters": 9}
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight("test")
+
+    async def main():
+        failing = Compute(error=RuntimeError("db down"))
+        calls = [asyncio.ensure_future(flight.do("a", failing)) for _ in range(5)]
+        await settle()
+        failing.gate.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        # 失败不会留在飞行表中，之后的调用重新执行
+        working = Compute("ok")
+        working.gate.set()
+        return failing, results, await flight.do("a", working), working
+
+    failing, results, after, working = asyncio.run(main())
+    assert failing.calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "db down" for r in results)
+    assert after == "ok" and working.calls == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_hands_over_to_waiter():
+    flight = SingleFlight("test")
+
+    async def main():
+        first, second = Compute("first"), Compute("second")
+        leader = asyncio.ensure_future(flight.do("a", first))
+        await settle()
+        waiter = asyncio.ensure_future(flight.do("a", second))
+        await settle()
+        leader.cancel()
+        await settle()
+        # 执行者被取消时等待者不会收到 CancelledError，而是自己执行
+        second.gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return first, second, await waiter
+
+    first, second, result = asyncio.run(main())
+    assert result == "second" and first.calls == 1 and second.calls == 1
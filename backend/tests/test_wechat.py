@@ -0,0 +1,147 @@
+import json
+import time
+import asyncio
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wechat import Wechat
+
+
+class StubWeChat(ThreadingHTTPServer):
+    """企业微信接口桩：签发 T1, T2, ... 并记录每个接口的调用次数"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.calls = {}
+        self.issued = 0
+        self.expires_in = []       # 依次使用的有效期，用完后为 7200
+        self.revoked = set()       # 被提前作废的 token
+        self.fail_gettoken = False
+        self.delay = 0.1
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stub = self.server
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        stub.calls[url.path] = stub.calls.get(url.path, 0) + 1
+        if url.path == "/cgi-bin/gettoken":
+            time.sleep(stub.delay)
+            if stub.fail_gettoken:
+                body = {"errcode": 40013, "errmsg": "invalid corpid"}
+            else:
+                stub.issued += 1
+                expires_in = stub.expires_in.pop(0) if stub.expires_in else 7200
+                body = {"errcode": 0, "access_token": f"T{stub.issued}", "expires_in": expires_in}
+        elif params.get("access_token") in stub.revoked:
+            body = {"errcode": 40014, "errmsg": "invalid access_token"}
+        elif url.path == "/cgi-bin/user/getuserinfo":
+            body = {"errcode": 0, "UserId": "user1"}
+        else:
+            body = {"errcode": 0, "userid": params.get("userid"), "token": params.get("access_token")}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubWeChat()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Wechat, "WECHAT_API_BASE", server.url)
+    monkeypatch.setattr(Wechat, "_client", None)
+    monkeypatch.setattr(Wechat, "_token_caches", {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await Wechat.close_http_client()
+    return asyncio.run(main())
+
+
+def test_concurrent_callers_share_one_fetch(stub):
+    async def main():
+        wechat = Wechat.WeChat("rs")
+        tokens = await asyncio.gather(*[wechat.get_access_token() for _ in range(20)])
+        # 有效期内直接返回缓存
+        tokens.append(await wechat.get_access_token())
+        return tokens
+
+    assert set(run(main())) == {"T1"}
+    assert stub.calls["/cgi-bin/gettoken"] == 1
+
+
+def test_refresh_before_expiry(stub):
+    # 首个 token 的有效期低于提前刷新的余量
+    stub.expires_in = [Wechat.WECHAT_TOKEN_REFRESH_MARGIN / 2]
+
+    async def main():
+        wechat = Wechat.WeChat("rs")
+        first = await wechat.get_access_token()
+        # 后台刷新期间继续返回旧 token，并发调用只触发一次刷新
+        during = await asyncio.gather(*[wechat.get_access_token() for _ in range(10)])
+        await wechat.token_cache._refreshing
+        return first, during, await wechat.get_access_token()
+
+    first, during, after = run(main())
+    assert first == "T1" and set(during) == {"T1"} and after == "T2"
+    assert stub.calls["/cgi-bin/gettoken"] == 2
+
+
+def test_expired_token_is_fetched_again(stub):
+    async def main():
+        wechat = Wechat.WeChat("rs")
+        await wechat.get_access_token()
+        wechat.token_cache.expires_at = time.monotonic() - 1
+        return await wechat.get_access_token()
+
+    assert run(main()) == "T2"
+    assert stub.calls["/cgi-bin/gettoken"] == 2
+
+
+def test_invalid_token_is_refreshed_and_retried(stub):
+    async def main():
+        wechat = Wechat.WeChat("rs")
+        token = await wechat.get_access_token()
+        stub.revoked.add(token)
+        return await wechat.get_user_info(token, "code")
+
+    user = run(main())
+    assert user == {"errcode": 0, "userid": "user1", "token": "T2"}
+    assert stub.calls["/cgi-bin/gettoken"] == 2
+    assert stub.calls["/cgi-bin/user/getuserinfo"] == 2
+
+
+def test_failed_fetch_is_not_cached(stub):
+    stub.fail_gettoken = True
+
+    async def main():
+        wechat = Wechat.WeChat("rs")
+        failed = await wechat.get_access_token()
+        stub.fail_gettoken = False
+        return failed, await wechat.get_access_token()
+
+    assert run(main()) == (None, "T1")
+    assert stub.calls["/cgi-bin/gettoken"] == 2
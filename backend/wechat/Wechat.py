@@ -1,13 +1,124 @@
 # WeChat.py
-import requests
+import time
+import asyncio
+import logging
+import httpx
 import urllib.parse
 import os
+from typing import Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 from logs import log
 
+load_dotenv()
+
+# 企业微信接口地址 (可指向本地桩服务做测试)
+WECHAT_API_BASE = os.getenv("WECHAT_API_BASE", "https://qyapi.weixin.qq.com")
+WECHAT_HTTP_TIMEOUT = float(os.getenv("WECHAT_HTTP_TIMEOUT", 5))
+WECHAT_HTTP_MAX_CONNECTIONS = int(os.getenv("WECHAT_HTTP_MAX_CONNECTIONS", 20))
+# access_token 剩余有效期低于该值时提前刷新 (秒)
+WECHAT_TOKEN_REFRESH_MARGIN = float(os.getenv("WECHAT_TOKEN_REFRESH_MARGIN", 300))
+
+# access_token 无效或过期的错误码，遇到时丢弃缓存重新获取
+TOKEN_INVALID_ERRCODES = {40001, 40014, 42001}
+
+# httpx 的请求日志会带上 corpsecret 等查询参数
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """共享的异步 HTTP 客户端 (连接池 + 超时)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=WECHAT_API_BASE,
+            timeout=httpx.Timeout(WECHAT_HTTP_TIMEOUT),
+            limits=httpx.Limits(max_connections=WECHAT_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=WECHAT_HTTP_MAX_CONNECTIONS)
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _get_json(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """GET 请求企业微信接口；网络错误或返回非 JSON 时返回 errcode=-1"""
+    try:
+        response = await get_http_client().get(path, params=params)
+        return response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        log('WeChat-error', f"request {path} failed: {e}")
+        return {"errcode": -1, "errmsg": str(e)}
+
+
+class AccessTokenCache:
+    """
+    单个企业应用的 access_token 缓存
+    1. 有效期内直接返回缓存
+    2. 剩余有效期低于 WECHAT_TOKEN_REFRESH_MARGIN 时在后台提前刷新，期间继续返回旧 token
+    3. 同一时刻最多一个刷新请求 (single-flight)，并发调用方共享同一结果
+    """
+
+    def __init__(self, corp_id: str, corp_secret: str, refresh_margin: float = WECHAT_TOKEN_REFRESH_MARGIN):
+        self.corp_id = corp_id
+        self.corp_secret = corp_secret
+        self.refresh_margin = refresh_margin
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self.fetch_count = 0
+
+    async def _fetch(self) -> Optional[str]:
+        self.fetch_count += 1
+        data = await _get_json("/cgi-bin/gettoken", {"corpid": self.corp_id, "corpsecret": self.corp_secret})
+        if data.get("errcode") != 0 or not data.get("access_token"):
+            log('WeChat-error', f"gettoken failed for {self.corp_id}: {data.get('errcode')} {data.get('errmsg')}")
+            return None
+        self.token = data["access_token"]
+        self.expires_at = time.monotonic() + float(data.get("expires_in", 7200))
+        log('WeChat-info', f"access_token refreshed for {self.corp_id}, expires in {data.get('expires_in', 7200)}s")
+        return self.token
+
+    def _refresh(self) -> asyncio.Task:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._fetch())
+        return self._refreshing
+
+    async def get(self) -> Optional[str]:
+        remaining = self.expires_at - time.monotonic()
+        if self.token and remaining > 0:
+            if remaining < self.refresh_margin:
+                self._refresh()
+            return self.token
+        return await asyncio.shield(self._refresh())
+
+    def invalidate(self, token: Optional[str] = None):
+        """丢弃缓存的 token (传入 token 时仅当其仍是当前 token 才丢弃)"""
+        if token is None or token == self.token:
+            self.token = None
+            self.expires_at = 0.0
+
+
+# (corp_id, corp_secret) -> token 缓存
+_token_caches: Dict[Tuple[str, str], AccessTokenCache] = {}
+
+
+def get_token_cache(corp_id: str, corp_secret: str) -> AccessTokenCache:
+    key = (corp_id, corp_secret)
+    cache = _token_caches.get(key)
+    if cache is None:
+        cache = _token_caches[key] = AccessTokenCache(corp_id, corp_secret)
+    return cache
+
+
 class WeChat:
     def __init__(self,type):
-        load_dotenv()
         log('WeChat-info',f"type: {type}")
         if(type == 'rs'):
             self.corp_id = os.getenv("CORP_ID", "ww1923a7aa7cf707e5")
@@ -19,7 +130,7 @@ class WeChat:
             self.agent_id = os.getenv("AGENT_ID_RC", "1000011")
             self.corp_secret = os.getenv("CORP_SECRET_RC", "ZTeSpJTC7BiTdVXRwyq3JkDWBsntJdybvjfmKA6gcbo")
             self.redirect_uri = os.getenv("REDIRECT_URI_RC", "https://ai.wyoooni.net")
-    
+
     def get_auth_url(self):
         """获取企业微信授权URL"""
         base_url = "https://open.weixin.qq.com/connect/oauth2/authorize"
@@ -32,33 +143,37 @@ class WeChat:
             f"&agentid={self.agent_id}"
             "#wechat_redirect"
         )
-    
+
+    @property
+    def token_cache(self) -> AccessTokenCache:
+        return get_token_cache(self.corp_id, self.corp_secret)
+
     async def get_access_token(self):
-        """获取企业微信access_token"""
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self.corp_id}&corpsecret={self.corp_secret}"
-        response = requests.get(url)
-        data = response.json()
-        return data.get("access_token") if data.get("errcode") == 0 else None
-    
+        """获取企业微信access_token (按企业缓存，过期前提前刷新)"""
+        return await self.token_cache.get()
+
     async def get_user_info(self, access_token: str, code: str):
         """使用access_token和code获取用户信息"""
         # 第一步：通过code获取用户UserID
-        userid_url = f"https://qyapi.weixin.qq.com/cgi-bin/user/getuserinfo?access_token={access_token}&code={code}"
-        userid_response = requests.get(userid_url)
-        userid_data = userid_response.json()
-        
+        userid_data = await _get_json("/cgi-bin/user/getuserinfo", {"access_token": access_token, "code": code})
+        if userid_data.get("errcode") in TOKEN_INVALID_ERRCODES:
+            # token 被提前作废：丢弃缓存并重试一次
+            self.token_cache.invalidate(access_token)
+            access_token = await self.get_access_token()
+            if not access_token:
+                return None
+            userid_data = await _get_json("/cgi-bin/user/getuserinfo", {"access_token": access_token, "code": code})
+
         if userid_data.get("errcode") != 0:
             return None
-        
+
         userid = userid_data.get("UserId")
         if not userid:
             return None
-        
+
         # 第二步：通过UserID获取用户详细信息
-        detail_url = f"https://qyapi.weixin.qq.com/cgi-bin/user/get?access_token={access_token}&userid={userid}"
-        detail_response = requests.get(detail_url)
-        detail_data = detail_response.json()
-        
+        detail_data = await _get_json("/cgi-bin/user/get", {"access_token": access_token, "userid": userid})
+
         if detail_data.get("errcode") == 0:
             return detail_data
-        return None
\ No newline at end of file
+        return None